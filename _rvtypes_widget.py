@@ -1,20 +1,50 @@
+import functools
+import math
+import time
+
+import numpy as np
+from .gl import GL_LINE_SMOOTH, GL_BLEND, GL_LINE_STRIP
 from rv.rvtypes import MinorMode
 from rv import commands, runtime
-from .util import TBox, Configuration
+from .util import TBox, Color, Configuration, SpatialGrid, RingBuffer
 
 
 class Widget(MinorMode):
+    #  When set, layout() and render() of every Widget subclass are timed and
+    #  the durations kept per mode in RingBuffers of frameTimeCapacity samples.
+    profiling = False
+    frameTimeCapacity = 240
+    _frameTimes = {}
+
+    #  Widgets whose contentVersion() is not None render into an offscreen
+    #  layer once per version, bounds and view size, and are composited from
+    #  it with a single quad on the frames in between.
+    useRenderCache = True
+
     class Button:
-        def __init__(self):
-            self._x = 0.0
-            self._y = 0.0
-            self._w = 0.0
-            self._h = 0.0
-            self._callback = None
+        def __init__(self, x=0.0, y=0.0, w=0.0, h=0.0, callback=None):
+            self._x = x
+            self._y = y
+            self._w = w
+            self._h = h
+            self._callback = callback
             self._near = False
+            self._owner = None
 
         def inside(self, x, y):
-            return self._x <= x <= (self._x + self._w) and self._y <= y <= (self._y + self._w)
+            return self._x <= x <= (self._x + self._w) and self._y <= y <= (self._y + self._h)
+
+        def setBounds(self, x, y, w, h):
+            """
+            Move the button, keeping its widget's hit test index up to date.
+            Assigning _x/_y/_w/_h directly requires Widget.reindexButtons().
+            """
+            self._x = x
+            self._y = y
+            self._w = w
+            self._h = h
+            if self._owner is not None:
+                self._owner._buttonMoved(self)
 
     def __init__(self):
         super(Widget, self).__init__()
@@ -29,7 +59,117 @@ class Widget(MinorMode):
         self._inCloseArea = False
         self._containsPointer = False
         self._buttons = []
+        self._buttonGrid = SpatialGrid()
+        self._buttonRects = None
+        #  The list and length the index was built from, to notice code that
+        #  appends to, clears or replaces _buttons directly.
+        self._indexedButtons = self._buttons
+        self._indexedCount = 0
         self._whichMargin = 0
+        self._timing = False
+        self._layering = False
+        self._drawn = False
+
+    def __init_subclass__(cls, **kwargs):
+        super(Widget, cls).__init_subclass__(**kwargs)
+        if "render" in vars(cls):
+            setattr(cls, "render", Widget._layered(vars(cls)["render"]))
+        for name in ("layout", "render"):
+            if name in vars(cls):
+                setattr(cls, name, Widget._timed(vars(cls)[name], name))
+
+    @staticmethod
+    def _timed(method, kind):
+        @functools.wraps(method)
+        def timed(self, *args, **kwargs):
+            #  Only the outermost call is timed when overrides call super().
+            if not Widget.profiling or self._timing:
+                return method(self, *args, **kwargs)
+            self._timing = True
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._timing = False
+                self.recordFrameTime(kind, time.perf_counter() - start)
+        return timed
+
+    @staticmethod
+    def _layered(render):
+        @functools.wraps(render)
+        def layered(self, event, *args, **kwargs):
+            self._drawn = True
+            #  Overrides calling super() render into the outermost layer.
+            if self._layering:
+                return render(self, event, *args, **kwargs)
+            version = self.contentVersion() if Widget.useRenderCache else None
+            if version is None or self._w <= 0 or self._h <= 0:
+                return render(self, event, *args, **kwargs)
+
+            from .glyph import GlyphNamespace
+            size = commands.viewSize()
+            x0, y0 = int(math.floor(self._x)), int(math.floor(self._y))
+            bounds = (x0, y0, int(math.ceil(self._x + self._w)) - x0, int(math.ceil(self._y + self._h)) - y0)
+            view_size = (int(size.x), int(size.y))
+            self._layering = True
+            try:
+                if not GlyphNamespace.drawCachedLayer(
+                    self, (version, bounds, view_size), bounds, view_size, lambda: render(self, event, *args, **kwargs)
+                ):
+                    render(self, event, *args, **kwargs)
+            finally:
+                self._layering = False
+        return layered
+
+    def contentVersion(self):
+        """
+        A hashable value which changes whenever what render() draws changes,
+        or None to render every frame. Cached renders are also redone when
+        the bounds or the view size change. Everything render() draws must lie
+        within the bounds.
+        """
+        return None
+
+    def invalidateRenderCache(self):
+        """
+        Render again on the next frame even though contentVersion() did not
+        change.
+        """
+        from .glyph import GlyphNamespace
+        GlyphNamespace.invalidateLayer(self)
+
+    def recordFrameTime(self, kind, seconds):
+        key = (self._modeName, kind)
+        samples = Widget._frameTimes.get(key)
+        if samples is None:
+            samples = Widget._frameTimes[key] = RingBuffer(Widget.frameTimeCapacity)
+        samples.append(seconds)
+
+    @classmethod
+    def setProfiling(cls, enabled):
+        Widget.profiling = bool(enabled)
+
+    @classmethod
+    def frameTimes(cls, kind=None):
+        """
+        {(mode, kind): RingBuffer} of the recorded layout and render times, in
+        seconds, optionally only those of one kind.
+        """
+        return dict((k, v) for k, v in Widget._frameTimes.items() if kind is None or k[1] == kind)
+
+    @classmethod
+    def frameTimeStats(cls):
+        """
+        {mode: {kind: (p50, p95, p99)}} in seconds.
+        """
+        stats = {}
+        for (mode, kind), samples in Widget._frameTimes.items():
+            stats.setdefault(mode, {})[kind] = tuple(samples.percentiles(50, 95, 99))
+        return stats
+
+    @classmethod
+    def clearFrameTimes(cls):
+        Widget._frameTimes.clear()
 
     def init(self, name, globalBindings, overrideBindings, menu=None, sortKey=None, ordering=0, multiple=None):
         super(Widget, self).init(name, globalBindings, overrideBindings, menu, sortKey, ordering)
@@ -48,7 +188,14 @@ class Widget(MinorMode):
             commands.deactivateMode(self._modeName)
             self.updateMargins(False)
 
-        commands.redraw()
+        #  Only redraw when the view changes: when the widget appears, or
+        #  disappears after having drawn something.
+        if self._active or self._drawn:
+            commands.redraw()
+        if not self._active:
+            from .glyph import GlyphNamespace
+            GlyphNamespace.releaseLayers(self)
+            self._drawn = False
         commands.sendInternalEvent("mode-toggles", "%s|%s" % (self._modeName, self._active), "Mode")
 
     def updateMargins(self, activated):
@@ -75,6 +222,10 @@ class Widget(MinorMode):
             runtime.gc.pop_api()
 
     def updateBounds(self, min_point, max_point):
+        if (min_point.x, min_point.y, max_point.x, max_point.y) != (
+            self._x, self._y, self._x + self._w, self._y + self._h
+        ):
+            self.invalidateRenderCache()
         self._x = min_point.x
         self._y = min_point.y
         self._w = max_point.x - self._x
@@ -110,4 +261,181 @@ class Widget(MinorMode):
         pass
 
     def render(self, event):
-        pass
+        self.drawLayout()
+
+    def submitLayout(self, function, *args, **kwargs):
+        """
+        Compute this widget's DrawList as function(*args, **kwargs) on the
+        shared layout worker, off the render thread. See layout.py.
+        """
+        from .layout import LayoutWorker
+        return LayoutWorker.shared().submit(self, function, *args, **kwargs)
+
+    def currentLayout(self):
+        """
+        The most recently completed DrawList submitted by this widget, or None.
+        """
+        from .layout import LayoutWorker
+        worker = LayoutWorker.sharedIfStarted()
+        return None if worker is None else worker.latest(self)
+
+    def drawLayout(self):
+        """
+        Draw the most recently completed layout, if any, without waiting for
+        layouts still being computed.
+        """
+        draw_list = self.currentLayout()
+        if draw_list is not None:
+            draw_list.draw()
+            self._drawn = True
+        return draw_list
+
+    def addButton(self, button):
+        buttons = self._indexed()
+        button._owner = self
+        buttons.append(button)
+        self._buttonGrid.insert(button, button._x, button._y, button._w, button._h)
+        self._buttonRects = None
+        self._indexedCount = len(buttons)
+        return button
+
+    def removeButton(self, button):
+        buttons = self._indexed()
+        buttons.remove(button)
+        self._buttonGrid.remove(button)
+        self._buttonRects = None
+        self._indexedCount = len(buttons)
+        button._owner = None
+
+    def reindexButtons(self):
+        """
+        Rebuild the hit test index from _buttons. Appending to, clearing or
+        replacing the list is noticed by itself; code that swaps buttons
+        without changing the length or assigns button coordinates directly
+        must call this.
+        """
+        self._buttonGrid.clear()
+        for button in self._buttons:
+            button._owner = self
+            self._buttonGrid.insert(button, button._x, button._y, button._w, button._h)
+        self._buttonRects = None
+        self._indexedButtons = self._buttons
+        self._indexedCount = len(self._buttons)
+
+    def _indexed(self):
+        """
+        _buttons, with the hit test index rebuilt first if the list was edited
+        behind addButton() and removeButton().
+        """
+        buttons = self._buttons
+        if buttons is not self._indexedButtons or len(buttons) != self._indexedCount:
+            self.reindexButtons()
+        return buttons
+
+    def _buttonMoved(self, button):
+        self._buttonGrid.update(button, button._x, button._y, button._w, button._h)
+        self._buttonRects = None
+
+    def buttonAt(self, x, y):
+        """
+        The first button containing (x, y), or None.
+        """
+        self._indexed()
+        return self._buttonGrid.first(x, y)
+
+    def buttonsAt(self, xs, ys):
+        """
+        Hit test a batch of points at once. Returns, for every point, the index
+        in _buttons of the first button containing it or -1.
+        """
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        ys = np.asarray(ys, dtype=np.float64).ravel()
+        result = np.full(len(xs), -1, dtype=np.intp)
+        buttons = self._indexed()
+        if not buttons or not len(xs):
+            return result
+
+        if self._buttonRects is None:
+            rects = np.array([(b._x, b._y, b._w, b._h) for b in buttons], dtype=np.float64)
+            rects[:, 2:] += rects[:, :2]
+            self._buttonRects = rects
+        x0, y0, x1, y1 = self._buttonRects.T
+
+        #  Test points in chunks to bound the size of the points x buttons mask.
+        chunk = max(1, (1 << 20) // len(buttons))
+        for start in range(0, len(xs), chunk):
+            px = xs[start:start + chunk, None]
+            py = ys[start:start + chunk, None]
+            inside = (x0 <= px) & (px <= x1) & (y0 <= py) & (py <= y1)
+            first = inside.argmax(axis=1)
+            result[start:start + chunk] = np.where(inside[np.arange(len(first)), first], first, -1)
+        return result
+
+
+class FrameTimeHUD(Widget):
+    """
+    Shows the p50/p95/p99 layout and render times of every profiled mode,
+    slowest first, with a sparkline of the slowest mode's recent render times.
+    Activating it turns Widget.profiling on.
+    """
+    def __init__(self, name="frame-time-hud"):
+        super(FrameTimeHUD, self).__init__()
+        self.init(name, [], None)
+        self.sparklineWidth = 240.0
+        self.sparklineHeight = 40.0
+
+    def activate(self):
+        Widget.setProfiling(True)
+
+    def deactivate(self):
+        Widget.setProfiling(False)
+
+    def rows(self):
+        """
+        (mode, p95 render seconds, text) for every profiled mode, slowest
+        first.
+        """
+        rows = []
+        for mode, kinds in Widget.frameTimeStats().items():
+            render = kinds.get("render", (0.0, 0.0, 0.0))
+            text = "  ".join(
+                "%s %.2f/%.2f/%.2f ms" % ((kind,) + tuple(t * 1000.0 for t in kinds[kind]))
+                for kind in ("layout", "render") if kind in kinds
+            )
+            rows.append((mode, render[1], text))
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows
+
+    def render(self, event):
+        from .glyph import GlyphNamespace
+
+        rows = self.rows()
+        if not rows:
+            return
+
+        size = commands.viewSize()
+        GlyphNamespace.setupProjection(size.x, size.y)
+
+        fg = Color(1, 1, 1, 1)
+        bg = Color(0, 0, 0, 0.6)
+        margin = 10
+        pairs = [("p50/p95/p99", "")] + [(mode, text) for mode, _, text in rows]
+        tbox = GlyphNamespace.drawNameValuePairs(pairs, fg, bg, margin * 2, margin * 2, margin)[0]
+
+        samples = Widget._frameTimes.get((rows[0][0], "render"))
+        if samples is not None and len(samples) > 1:
+            self.drawSparkline(samples.values(), margin * 2, margin * 3 + tbox.y)
+
+    def drawSparkline(self, values, x, y):
+        from .glyph import GlyphNamespace
+
+        values = np.asarray(values, dtype=np.float32)
+        peak = float(values.max()) or 1.0
+        vertices = np.empty((len(values), 2), dtype=np.float32)
+        vertices[:, 0] = x + np.linspace(0.0, self.sparklineWidth, len(values))
+        vertices[:, 1] = y + values * (self.sparklineHeight / peak)
+
+        with GlyphNamespace.batching() as batch:
+            batch.setState(enable=(GL_LINE_SMOOTH, GL_BLEND), lineWidth=1.5)
+            batch.setColor(Color(1.0, 0.8, 0.2, 1.0))
+            batch.shape(GL_LINE_STRIP, vertices)
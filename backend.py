@@ -0,0 +1,698 @@
+"""
+Drawing backends for glyph.py.
+
+GlyphNamespace never talks to OpenGL itself; it draws through the backend in
+GlyphNamespace.backend. GLBackend draws into the current GL context as the Mu
+glyph module does. NumpyBackend rasterizes the same primitives into an RGBA
+ndarray so overlays can be rendered without a GL context, on render farm
+nodes or in CI.
+"""
+
+import contextlib
+
+import numpy as np
+from . import gl
+
+import gltext
+from .batch import rgba, independent, drawArrays, blendFunc
+from .program import IDENTITY, multiply, transform, xform
+
+
+class Backend(object):
+    """
+    Interface GlyphNamespace draws through.
+
+    Geometry is either an immediate mode primitive in the current color
+    (shape) or a list of already batched runs (drawArrays), each run being
+    (primitive, state, (N, 2) vertices, (N, 4) colors) with primitive one of
+    GL_POINTS, GL_LINES or GL_TRIANGLES and state (enabled capabilities,
+    line width). Capabilities are identified by their GL enums.
+    """
+    def shape(self, mode, vertices):
+        raise NotImplementedError
+
+    def drawArrays(self, runs):
+        raise NotImplementedError
+
+    def setColor(self, color):
+        raise NotImplementedError
+
+    def currentColor(self):
+        raise NotImplementedError
+
+    def pushMatrix(self):
+        raise NotImplementedError
+
+    def popMatrix(self):
+        raise NotImplementedError
+
+    def loadIdentity(self):
+        raise NotImplementedError
+
+    def translate(self, x, y):
+        raise NotImplementedError
+
+    def rotate(self, angle):
+        raise NotImplementedError
+
+    def scale(self, scale):
+        raise NotImplementedError
+
+    def setupProjection(self, w, h):
+        raise NotImplementedError
+
+    def enable(self, capability):
+        pass
+
+    def disable(self, capability):
+        pass
+
+    def pushState(self, enable=(), lineWidth=None):
+        pass
+
+    def popState(self):
+        pass
+
+    def text(self, x, y, text, color):
+        pass
+
+    def textMany(self, records):
+        """
+        Write (x, y, color, text) records, in order.
+        """
+        for x, y, color, text in records:
+            self.text(x, y, text, color)
+
+    def drawCachedGlyph(self, key, build):
+        """
+        Replay the geometry cached under key, building it with build() first if
+        needed. Returns False when this backend does not cache geometry, in
+        which case the caller draws the glyph itself.
+        """
+        return False
+
+    def compiled(self, key, build):
+        return None
+
+    def invalidateCache(self, name=None):
+        pass
+
+    def drawCachedLayer(self, key, version, bounds, viewSize, draw):
+        """
+        Draw the bounds = (x, y, w, h) region of what draw() draws in a view of
+        viewSize as a cached image, running draw() into the cache first when
+        version differs from the version cached under key. Returns False when
+        this backend does not cache layers, in which case the caller draws
+        directly.
+        """
+        return False
+
+    def invalidateLayer(self, key):
+        """
+        Make the layer cached under key render again on its next draw.
+        """
+        pass
+
+    def releaseLayers(self, key=None):
+        """
+        Free cached layers, all of them or the one of key.
+        """
+        pass
+
+
+class GLBackend(Backend):
+    """
+    Draws into the current GL context. Cached glyphs are compiled into
+    display lists and cached layers rendered into framebuffer textures, once
+    per context.
+    """
+    class Layer(object):
+        """
+        A framebuffer object with a w x h RGBA texture attached.
+        """
+        def __init__(self, framebuffer, texture, w, h):
+            super(GLBackend.Layer, self).__init__()
+            self.framebuffer = framebuffer
+            self.texture = texture
+            self.w = w
+            self.h = h
+            self.version = None
+
+    def __init__(self):
+        super(GLBackend, self).__init__()
+        self._displayLists = {}
+        self._layers = {}
+        #  (x, y, w, h) of the layers being rendered, innermost last.
+        self._rendering = []
+
+    def shape(self, mode, vertices):
+        if isinstance(vertices, np.ndarray):
+            vertices = vertices.tolist()
+        vertex = gl.glVertex2f
+        gl.glBegin(mode)
+        for vx, vy in vertices:
+            vertex(vx, vy)
+        gl.glEnd()
+
+    def drawArrays(self, runs):
+        drawArrays(runs, bool(self._rendering))
+
+    def setColor(self, color):
+        gl.glColor4f(*rgba(color))
+
+    def currentColor(self):
+        return tuple(gl.glGetFloatv(gl.GL_CURRENT_COLOR))
+
+    def pushMatrix(self):
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPushMatrix()
+
+    def popMatrix(self):
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPopMatrix()
+
+    def loadIdentity(self):
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glLoadIdentity()
+
+    def translate(self, x, y):
+        gl.glTranslate(x, y, 0.0)
+
+    def rotate(self, angle):
+        gl.glRotate(angle, 0, 0, 1)
+
+    def scale(self, scale):
+        gl.glScale(scale, scale, scale)
+
+    def setupProjection(self, w, h):
+        #  Overlays set up their projection first thing every frame, which
+        #  makes this the place to collect the errors of the previous one.
+        gl.checkErrors()
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glLoadIdentity()
+        if self._rendering:
+            #  The same mapping as below, moved and cropped to the layer's
+            #  region of the view so its pixels line up with the view's.
+            x, y, layer_w, layer_h = self._rendering[-1]
+            sx, sy = (w - 1.0) / w, (h - 1.0) / h
+            gl.gluOrtho2D(x * sx, (x + layer_w) * sx, y * sy, (y + layer_h) * sy)
+        else:
+            gl.gluOrtho2D(0.0, w - 1, 0.0, h - 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glLoadIdentity()
+
+    def enable(self, capability):
+        gl.glEnable(capability)
+        if capability == gl.GL_BLEND:
+            blendFunc(bool(self._rendering))
+
+    def disable(self, capability):
+        gl.glDisable(capability)
+
+    def pushState(self, enable=(), lineWidth=None):
+        gl.glPushAttrib(gl.GL_ENABLE_BIT | gl.GL_LINE_BIT)
+        for capability in enable:
+            gl.glEnable(capability)
+        if lineWidth is not None:
+            gl.glLineWidth(lineWidth)
+
+    def popState(self):
+        gl.glPopAttrib()
+
+    def text(self, x, y, text, color):
+        gltext.writeMany([(x, y, color, text)])
+
+    def textMany(self, records):
+        gltext.writeMany(records)
+
+    @classmethod
+    def currentContext(cls):
+        try:
+            from OpenGL import contextdata
+            return contextdata.getContext()
+        except Exception:
+            return None
+
+    def compiled(self, key, build):
+        """
+        The display list holding build()'s drawing for key in the current
+        context, compiled on first use.
+        """
+        key = (self.currentContext(),) + tuple(key)
+        display_list = self._displayLists.get(key)
+        if display_list is None:
+            display_list = gl.glGenLists(1)
+            if not display_list:
+                return None
+            gl.glNewList(display_list, gl.GL_COMPILE)
+            try:
+                build()
+            finally:
+                gl.glEndList()
+            self._displayLists[key] = display_list
+        return display_list
+
+    def drawCachedGlyph(self, key, build):
+        display_list = self.compiled(key, build)
+        if not display_list:
+            return False
+        gl.glCallList(display_list)
+        return True
+
+    def invalidateCache(self, name=None):
+        """
+        Drop compiled display lists, all of them or those of the glyph named
+        name. Lists owned by the current context are deleted; lists owned by
+        other contexts are forgotten and go away with their context.
+        """
+        context = self.currentContext()
+        for key in list(self._displayLists):
+            if name is not None and key[1] != name:
+                continue
+            display_list = self._displayLists.pop(key)
+            if key[0] == context:
+                gl.glDeleteLists(display_list, 1)
+
+    def drawCachedLayer(self, key, version, bounds, viewSize, draw):
+        x, y, w, h = bounds
+        layer = self._layer((self.currentContext(), key), w, h)
+        if layer is None:
+            return False
+        if layer.version != version:
+            layer.version = None
+            self._renderLayer(layer, bounds, viewSize, draw)
+            layer.version = version
+
+        view_w, view_h = viewSize
+        sx, sy = (view_w - 1.0) / view_w, (view_h - 1.0) / view_h
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.gluOrtho2D(0.0, view_w - 1, 0.0, view_h - 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.glPushAttrib(gl.GL_ENABLE_BIT | gl.GL_COLOR_BUFFER_BIT | gl.GL_TEXTURE_BIT | gl.GL_CURRENT_BIT)
+        try:
+            gl.glEnable(gl.GL_TEXTURE_2D)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, layer.texture)
+            gl.glEnable(gl.GL_BLEND)
+            #  The texture holds premultiplied colors, see _renderLayer().
+            gl.glBlendFunc(gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+            gl.glColor4f(1.0, 1.0, 1.0, 1.0)
+            gl.glBegin(gl.GL_QUADS)
+            for u, v in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                gl.glTexCoord2f(u, v)
+                gl.glVertex2f((x + u * w) * sx, (y + v * h) * sy)
+            gl.glEnd()
+        finally:
+            gl.glPopAttrib()
+            gl.glPopMatrix()
+            gl.glMatrixMode(gl.GL_PROJECTION)
+            gl.glPopMatrix()
+            gl.glMatrixMode(gl.GL_MODELVIEW)
+        return True
+
+    def _layer(self, key, w, h):
+        """
+        The layer cached under key, (re)made when missing or not w x h. None if
+        no complete framebuffer could be made.
+        """
+        layer = self._layers.get(key)
+        if layer is not None and (layer.w, layer.h) == (w, h):
+            return layer
+        if layer is not None:
+            self._deleteLayer(self._layers.pop(key))
+        try:
+            texture = gl.glGenTextures(1)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+            gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, w, h, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+            layer = GLBackend.Layer(gl.glGenFramebuffers(1), texture, w, h)
+            with self._boundFramebuffer(layer.framebuffer):
+                gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_TEXTURE_2D, texture, 0)
+                complete = gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) == gl.GL_FRAMEBUFFER_COMPLETE
+        except Exception:
+            #  No framebuffer objects in this context.
+            return None
+        if not complete:
+            self._deleteLayer(layer)
+            return None
+        self._layers[key] = layer
+        return layer
+
+    @contextlib.contextmanager
+    def _boundFramebuffer(self, framebuffer):
+        previous = int(gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING))
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+        try:
+            yield
+        finally:
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, previous)
+
+    def _renderLayer(self, layer, bounds, viewSize, draw):
+        """
+        Run draw() into layer with the view's bounds region mapped onto it.
+        Alpha is accumulated as coverage while colors blend as usual, which
+        leaves premultiplied colors in the texture.
+        """
+        with self._boundFramebuffer(layer.framebuffer):
+            gl.glPushAttrib(gl.GL_VIEWPORT_BIT | gl.GL_COLOR_BUFFER_BIT | gl.GL_TRANSFORM_BIT)
+            gl.glMatrixMode(gl.GL_PROJECTION)
+            gl.glPushMatrix()
+            gl.glMatrixMode(gl.GL_MODELVIEW)
+            gl.glPushMatrix()
+            self._rendering.append(bounds)
+            try:
+                gl.glViewport(0, 0, layer.w, layer.h)
+                gl.glClearColor(0.0, 0.0, 0.0, 0.0)
+                gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+                blendFunc(True)
+                self.setupProjection(*viewSize)
+                draw()
+            finally:
+                self._rendering.pop()
+                gl.glMatrixMode(gl.GL_PROJECTION)
+                gl.glPopMatrix()
+                gl.glMatrixMode(gl.GL_MODELVIEW)
+                gl.glPopMatrix()
+                gl.glPopAttrib()
+
+    def invalidateLayer(self, key):
+        for (context, layer_key), layer in self._layers.items():
+            if layer_key == key:
+                layer.version = None
+
+    def releaseLayers(self, key=None):
+        """
+        Delete the layers owned by the current context; layers of other
+        contexts are forgotten and go away with their context.
+        """
+        context = self.currentContext()
+        for layer_key in list(self._layers):
+            if key is not None and layer_key[1] != key:
+                continue
+            layer = self._layers.pop(layer_key)
+            if layer_key[0] == context:
+                self._deleteLayer(layer)
+
+    def _deleteLayer(self, layer):
+        gl.glDeleteFramebuffers(1, [layer.framebuffer])
+        gl.glDeleteTextures([layer.texture])
+
+
+class NumpyBackend(Backend):
+    """
+    Software rasterizer into a (height, width, 4) float32 RGBA image whose
+    first row is the bottom of the frame, as in GL. All triangles of a batch
+    are filled together as vectorized scanline spans and lines are drawn as
+    lineWidth wide quads. Each pixel a source color of alpha a covers becomes
+    rgb = src * a + dst * (1 - a), as with GL_BLEND and GL_SRC_ALPHA,
+    GL_ONE_MINUS_SRC_ALPHA, and alpha = a + dst_alpha * (1 - a), source over
+    compositing of the coverage. There is no antialiasing.
+
+    Text is handed to textRenderer(backend, x, y, text, rgba) when one is set
+    and dropped otherwise.
+    """
+    _chunkPixels = 1 << 22
+
+    def __init__(self, width, height, background=(0.0, 0.0, 0.0, 0.0)):
+        super(NumpyBackend, self).__init__()
+        self.image = np.empty((height, width, 4), dtype=np.float32)
+        self.image[:] = background
+        self.textRenderer = None
+        self._color = (1.0, 1.0, 1.0, 1.0)
+        self._lineWidth = 1.0
+        self._states = []
+        self._matrix = IDENTITY
+        self._matrices = []
+        self._projection = IDENTITY
+
+    @classmethod
+    def fromImage(cls, image):
+        """
+        A backend drawing over a copy of image, a top down (height, width, 3
+        or 4) uint8 or float array such as a decoded frame.
+        """
+        image = np.asarray(image)
+        scale = 255.0 if image.dtype == np.uint8 else 1.0
+        backend = cls(image.shape[1], image.shape[0])
+        backend.image[..., :3] = image[::-1, :, :3] / scale
+        backend.image[..., 3] = image[::-1, :, 3] / scale if image.shape[2] > 3 else 1.0
+        return backend
+
+    def clear(self, color=(0.0, 0.0, 0.0, 0.0)):
+        self.image[:] = color
+
+    def pixels(self):
+        """
+        The image as a top down uint8 RGBA array.
+        """
+        return (np.clip(self.image[::-1], 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+    def shape(self, mode, vertices):
+        primitive, vertices = independent(mode, vertices)
+        if len(vertices):
+            colors = np.empty((len(vertices), 4), dtype=np.float32)
+            colors[:] = self._color
+            self.drawArrays([(primitive, ((), self._lineWidth), vertices, colors)])
+
+    def drawArrays(self, runs):
+        matrix = multiply(self._projection, self._matrix)
+        for primitive, state, vertices, colors in runs:
+            vertices = transform(np.asarray(vertices, dtype=np.float32), matrix)
+            line_width = state[1]
+            if primitive == gl.GL_TRIANGLES:
+                self.fillTriangles(vertices, colors)
+            elif primitive == gl.GL_LINES:
+                self.fillTriangles(*self._segmentQuads(vertices, colors, line_width))
+            elif primitive == gl.GL_POINTS:
+                self.fillTriangles(*self._pointQuads(vertices, colors, line_width))
+
+    def setColor(self, color):
+        self._color = rgba(color)
+
+    def currentColor(self):
+        return self._color
+
+    def pushMatrix(self):
+        self._matrices.append(self._matrix)
+
+    def popMatrix(self):
+        self._matrix = self._matrices.pop()
+
+    def loadIdentity(self):
+        self._matrix = IDENTITY
+
+    def translate(self, x, y):
+        self._matrix = multiply(self._matrix, (1.0, 0.0, 0.0, 1.0, x, y))
+
+    def rotate(self, angle):
+        self._matrix = multiply(self._matrix, xform(0.0, 0.0, angle, 1.0))
+
+    def scale(self, scale):
+        self._matrix = multiply(self._matrix, (scale, 0.0, 0.0, scale, 0.0, 0.0))
+
+    def setupProjection(self, w, h):
+        height, width = self.image.shape[:2]
+        self._projection = (width / max(w - 1.0, 1.0), 0.0, 0.0, height / max(h - 1.0, 1.0), 0.0, 0.0)
+        self._matrix = IDENTITY
+
+    def pushState(self, enable=(), lineWidth=None):
+        self._states.append(self._lineWidth)
+        if lineWidth is not None:
+            self._lineWidth = lineWidth
+
+    def popState(self):
+        self._lineWidth = self._states.pop()
+
+    def text(self, x, y, text, color):
+        if self.textRenderer is not None:
+            px, py = transform(np.array([[x, y]], dtype=np.float32), multiply(self._projection, self._matrix))[0]
+            self.textRenderer(self, px, py, text, rgba(color))
+
+    @staticmethod
+    def _segmentQuads(vertices, colors, width):
+        start, end = vertices[0::2], vertices[1::2]
+        direction = end - start
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        keep = length > 0
+        start, end, direction, length = start[keep], end[keep], direction[keep], length[keep]
+        normal = np.column_stack((-direction[:, 1], direction[:, 0])) * (width * 0.5 / length)[:, None]
+        corners = np.stack((start + normal, end + normal, end - normal, start - normal), axis=1)
+        triangles = corners[:, (0, 1, 2, 0, 2, 3)].reshape(-1, 2)
+        return triangles, np.repeat(colors[0::2][keep], 6, axis=0)
+
+    @staticmethod
+    def _pointQuads(vertices, colors, size):
+        half = max(size, 1.0) * 0.5
+        offsets = np.array(((-half, -half), (half, -half), (half, half), (-half, half)), dtype=np.float32)
+        corners = vertices[:, None, :] + offsets
+        triangles = corners[:, (0, 1, 2, 0, 2, 3)].reshape(-1, 2)
+        return triangles, np.repeat(colors, 6, axis=0)
+
+    def fillTriangles(self, vertices, colors):
+        """
+        Composite flat shaded triangles, given as (3N, 2) pixel space vertices
+        with (3N, 4) colors of which each triangle's first is used.
+        """
+        height, width = self.image.shape[:2]
+        triangles = np.asarray(vertices, dtype=np.float64).reshape(-1, 3, 2)
+        colors = np.asarray(colors, dtype=np.float32)[0::3]
+
+        #  Orient every triangle counter clockwise and drop degenerate ones.
+        ax, ay = triangles[:, 0, 0], triangles[:, 0, 1]
+        area = (triangles[:, 1, 0] - ax) * (triangles[:, 2, 1] - ay) - (triangles[:, 1, 1] - ay) * (triangles[:, 2, 0] - ax)
+        flip = area < 0
+        triangles[flip] = triangles[flip][:, (0, 2, 1)]
+        keep = (area != 0) & (colors[:, 3] > 0)
+
+        #  Pixels whose centers fall within each triangle's bounding box.
+        low = np.ceil(triangles.min(axis=1) - 0.5).astype(np.intp)
+        high = np.floor(triangles.max(axis=1) - 0.5).astype(np.intp) + 1
+        low = np.maximum(low, 0)
+        high = np.minimum(high, (width, height))
+        keep &= (high > low).all(axis=1)
+
+        triangles, colors = triangles[keep], colors[keep]
+        low, high = low[keep], high[keep]
+
+        #  Triangles are rasterized together, in runs covering at most
+        #  _chunkPixels pixels between them to bound memory.
+        start, count, owner = self._spans(triangles, low, high)
+        if not len(start):
+            return
+        covered = np.cumsum(np.bincount(owner, count, len(triangles)))
+        cuts = np.searchsorted(covered, np.arange(self._chunkPixels, covered[-1], self._chunkPixels))
+        for run in np.split(np.arange(len(start)), np.unique(np.searchsorted(owner, cuts))):
+            if len(run):
+                self._fillSpans(start[run], count[run], owner[run], colors)
+
+    def _spans(self, triangles, low, high):
+        """
+        The pixels counter clockwise triangles cover within their [low, high)
+        pixel bounding boxes as row spans in triangle order: the flat index of
+        the first pixel of each span, its length and the index of its triangle.
+        """
+        width = self.image.shape[1]
+
+        #  One (triangle, row) pair per row of each bounding box.
+        rows = high[:, 1] - low[:, 1]
+        owner = np.repeat(np.arange(len(triangles)), rows)
+        y = low[owner, 1] + np.arange(len(owner)) - np.repeat(np.cumsum(rows) - rows, rows)
+        py = y + 0.5
+
+        start = triangles[owner]
+        delta = start[:, (1, 2, 0)] - start
+        sx, sy = start[..., 0], start[..., 1]
+        dx, dy = delta[..., 0], delta[..., 1]
+        #  Top-left rule, so triangles sharing an edge never both cover a pixel
+        #  on it.
+        top_left = (dy < 0) | ((dy == 0) & (dx < 0))
+        row_value = dx * (py[:, None] - sy)
+
+        def inside(px):
+            value = row_value - dy * ((px + 0.5)[:, None] - sx)
+            return np.where(top_left, value >= 0, value > 0).all(axis=1)
+
+        #  Each row's span lies between where its edges cross the row. Pixels
+        #  at the ends are tested with the edge functions themselves, so the
+        #  result does not depend on the rounding of the crossings.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross = sx + row_value / dy
+        left = np.where(dy < 0, cross, -np.inf).max(axis=1)
+        right = np.where(dy > 0, cross, np.inf).min(axis=1)
+        x0, x1 = low[owner, 0], high[owner, 0]
+        first = np.ceil(np.clip(left, x0 - 1, x1 + 1) - 0.5).astype(np.intp)
+        last = np.floor(np.clip(right, x0 - 1, x1 + 1) - 0.5).astype(np.intp) + 1
+        first = np.where(inside(first - 1), first - 1, np.where(inside(first), first, first + 1))
+        last = np.where(inside(last), last + 1, np.where(inside(last - 1), last, last - 1))
+        first, last = np.maximum(first, x0), np.minimum(last, x1)
+
+        #  Rows on the wrong side of a horizontal edge have no crossing to
+        #  bound them.
+        flat = np.where(top_left, row_value >= 0, row_value > 0) | (dy != 0)
+        keep = (last > first) & flat.all(axis=1)
+        return (y * width + first)[keep], (last - first)[keep], owner[keep]
+
+    @staticmethod
+    def _expand(start, count):
+        """
+        The flat pixel indices of all spans, in order, and the span of each.
+        """
+        span = np.repeat(np.arange(len(start)), count)
+        return start[span] + np.arange(len(span)) - np.repeat(np.cumsum(count) - count, count), span
+
+    def _fillSpans(self, start, count, owner, colors):
+        """
+        Composite colors[owner] over the spans of count pixels from the flat
+        pixel indices start, later spans over earlier ones.
+        """
+        keep = np.ones((len(colors) + 1, 4), dtype=np.float32)
+        keep[1:] = 1.0 - colors[:, 3:]
+        add = np.zeros((len(colors) + 1, 4), dtype=np.float32)
+        add[1:, :3] = colors[:, 3:] * colors[:, :3]
+        add[1:, 3] = colors[:, 3]
+        index = owner + 1
+        if not len(start):
+            return
+
+        #  Spans only touch the contiguous range of the image between the
+        #  first and the last of them.
+        base = start.min()
+        begin, end = start - base, start - base + count
+        region = self.image.reshape(-1, 4)[base:base + end.max()]
+        #  A few pixels spread over a long range are cheaper to blend one by
+        #  one than by passing over the whole range.
+        if count.sum() * 4 < len(region):
+            pixel, span = self._expand(begin, count)
+            self._blendPixels(region, pixel, index[span], keep, add)
+            return
+
+        #  Pixels covered once are blended in place from a painted image of
+        #  which span covers them, with no per-pixel gathering.
+        size = len(region) + 1
+        coverage = np.cumsum(np.bincount(begin, minlength=size) - np.bincount(end, minlength=size))[:-1]
+        painted = np.cumsum(np.bincount(begin, index, size) - np.bincount(end, index, size))[:-1]
+        once = coverage == 1
+        painted = np.where(once, painted.astype(np.intp), 0)
+        region *= keep.take(painted, axis=0)
+        region += add.take(painted, axis=0)
+
+        several = coverage > 1
+        if several.any():
+            total = np.r_[0, np.cumsum(several)]
+            touched = total[end] > total[begin]
+            pixel, span = self._expand(begin[touched], count[touched])
+            inside = several[pixel]
+            self._blendPixels(region, pixel[inside], index[touched][span[inside]], keep, add)
+
+    @staticmethod
+    def _blendPixels(region, pixel, index, keep, add):
+        """
+        Blend keep[index] and add[index] into region at pixel, entries for the
+        same pixel in the order given.
+        """
+        covered = np.bincount(pixel, minlength=len(region))[pixel]
+        once = covered == 1
+        layers = [(pixel[once], index[once])]
+        if not once.all():
+            #  Pixels covered more than once are composited one layer at a
+            #  time, the n-th triangle on each pixel in the n-th layer.
+            #  Sorting keys made unique by the entry's position is a stable
+            #  sort, and much faster than a stable argsort.
+            pixel, index = pixel[~once], index[~once]
+            position = np.arange(len(pixel))
+            order = np.sort(pixel * len(pixel) + position) % len(pixel)
+            pixel, index = pixel.take(order), index.take(order)
+            first = np.r_[True, pixel[1:] != pixel[:-1]]
+            depth = position - np.flatnonzero(first)[np.cumsum(first) - 1]
+            order = np.sort(depth * len(pixel) + position) % len(pixel)
+            bounds = np.cumsum(np.bincount(depth))[:-1]
+            layers.extend(zip(np.split(pixel[order], bounds), np.split(index[order], bounds)))
+        for pixel, index in layers:
+            region[pixel] = region.take(pixel, axis=0) * keep.take(index, axis=0) + add.take(index, axis=0)
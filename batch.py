@@ -0,0 +1,211 @@
+"""
+Vertex batching for the glyph drawing code.
+
+A VertexBatch gathers shapes and their colors into float32 arrays instead of
+issuing a glBegin/glVertex/glEnd block per shape. Every shape is reduced to
+independent triangles or line segments so consecutive shapes drawn with the
+same GL state can share a single glDrawArrays call when the batch is flushed.
+"""
+import numpy as np
+from . import gl
+
+
+def rgba(color):
+    """
+    Return color (a util.Color or a 3/4 element sequence) as an RGBA tuple.
+    """
+    if hasattr(color, "rgba"):
+        return color.rgba()
+    color = tuple(color)
+    if len(color) == 3:
+        return color + (1.0,)
+    return color
+
+
+def fanToTriangles(vertices):
+    """
+    Convert a triangle fan (or convex polygon) into independent triangles.
+    """
+    count = len(vertices)
+    if count < 3:
+        return vertices[:0]
+    index = np.arange(1, count - 1)
+    return vertices[np.column_stack((np.zeros_like(index), index, index + 1)).ravel()]
+
+
+def quadsToTriangles(vertices):
+    """
+    Convert independent quads into independent triangles.
+    """
+    quads = vertices[:len(vertices) - len(vertices) % 4].reshape(-1, 4, 2)
+    return quads[:, (0, 1, 2, 0, 2, 3)].reshape(-1, 2)
+
+
+def stripToLines(vertices, closed=False):
+    """
+    Convert a line strip (or line loop when closed) into independent segments.
+    """
+    if len(vertices) < 2:
+        return vertices[:0]
+    end = np.roll(vertices, -1, axis=0) if closed else vertices[1:]
+    start = vertices if closed else vertices[:-1]
+    return np.column_stack((start, end)).reshape(-1, 2)
+
+
+#  Maps an immediate mode primitive onto the primitive it is batched as and
+#  the conversion applied to its vertices.
+_PRIMITIVES = {
+    gl.GL_POINTS: (gl.GL_POINTS, None),
+    gl.GL_LINES: (gl.GL_LINES, None),
+    gl.GL_LINE_STRIP: (gl.GL_LINES, stripToLines),
+    gl.GL_LINE_LOOP: (gl.GL_LINES, lambda v: stripToLines(v, True)),
+    gl.GL_TRIANGLES: (gl.GL_TRIANGLES, None),
+    gl.GL_TRIANGLE_FAN: (gl.GL_TRIANGLES, fanToTriangles),
+    gl.GL_POLYGON: (gl.GL_TRIANGLES, fanToTriangles),
+    gl.GL_QUADS: (gl.GL_TRIANGLES, quadsToTriangles),
+}
+
+DEFAULT_STATE = ((), 1.0)
+
+
+def independent(mode, vertices):
+    """
+    Return (primitive, vertices) with the immediate mode primitive mode
+    converted into independent GL_POINTS, GL_LINES or GL_TRIANGLES.
+    """
+    primitive, convert = _PRIMITIVES[mode]
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 2)
+    if convert is not None:
+        vertices = convert(vertices)
+    return primitive, vertices
+
+
+class VertexBatch(object):
+    """
+    Accumulates shapes as runs of (primitive, state) and draws each run with
+    one glDrawArrays, or with draw(runs) when given. Runs are kept in
+    submission order so overlapping shapes still composite the same way they
+    would in immediate mode.
+
+    The state of a run is the set of capabilities it enables on top of the
+    ambient GL state and its line width.
+    """
+    class Run(object):
+        def __init__(self, primitive, state):
+            self.primitive = primitive
+            self.state = state
+            self.chunks = []
+            self.colors = []
+            self.counts = []
+
+    def __init__(self, draw=None):
+        super(VertexBatch, self).__init__()
+        self._draw = draw or drawArrays
+        self._runs = []
+        self._color = (1.0, 1.0, 1.0, 1.0)
+        self._state = DEFAULT_STATE
+
+    def __len__(self):
+        return len(self._runs)
+
+    def setColor(self, color):
+        self._color = rgba(color)
+
+    def setState(self, enable=(), lineWidth=1.0):
+        self._state = (tuple(sorted(enable)), float(lineWidth))
+
+    def shape(self, mode, vertices):
+        """
+        Add one immediate mode primitive, given as a sequence of (x, y)
+        vertices, drawn in the current color and state.
+        """
+        primitive, vertices = independent(mode, vertices)
+        if not len(vertices):
+            return
+
+        run = self._runs[-1] if self._runs else None
+        if run is None or run.primitive != primitive or run.state != self._state or not run.counts:
+            run = VertexBatch.Run(primitive, self._state)
+            self._runs.append(run)
+
+        run.chunks.append(vertices)
+        run.colors.append(self._color)
+        run.counts.append(len(vertices))
+
+    def clear(self):
+        del self._runs[:]
+        self._state = DEFAULT_STATE
+
+    def addArrays(self, primitive, state, vertices, colors):
+        """
+        Append an already batched run: (N, 2) vertices and (N, 4) colors of a
+        primitive this batch produces (GL_POINTS, GL_LINES or GL_TRIANGLES).
+        """
+        if not len(vertices):
+            return
+        run = VertexBatch.Run(primitive, state)
+        run.chunks.append(vertices)
+        run.colors = colors
+        self._runs.append(run)
+
+    def arrays(self):
+        """
+        Yield (primitive, state, vertices, colors) for every pending run, with
+        vertices as an (N, 2) and colors as an (N, 4) float32 array.
+        """
+        for run in self._runs:
+            vertices = np.concatenate(run.chunks)
+            if run.counts:
+                colors = np.repeat(np.asarray(run.colors, dtype=np.float32), run.counts, axis=0)
+            else:
+                colors = run.colors
+            yield run.primitive, run.state, vertices, colors
+
+    def flush(self):
+        """
+        Draw and discard every pending run.
+        """
+        if not self._runs:
+            return
+        try:
+            self._draw(self.arrays())
+        finally:
+            self.clear()
+
+
+def blendFunc(separateAlpha=False):
+    """
+    The usual alpha blending. With separateAlpha the destination alpha
+    accumulates coverage rather than alpha times itself, for drawing into a
+    transparent offscreen layer.
+    """
+    if separateAlpha:
+        gl.glBlendFuncSeparate(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA, gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+    else:
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+
+def drawArrays(runs, separateAlpha=False):
+    """
+    Draw (primitive, state, vertices, colors) runs with one glDrawArrays each.
+    """
+    gl.glPushClientAttrib(gl.GL_CLIENT_VERTEX_ARRAY_BIT)
+    gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+    gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+    try:
+        for primitive, state, vertices, colors in runs:
+            enable, line_width = state
+            gl.glPushAttrib(gl.GL_ENABLE_BIT | gl.GL_LINE_BIT | gl.GL_CURRENT_BIT | gl.GL_COLOR_BUFFER_BIT | gl.GL_HINT_BIT)
+            for capability in enable:
+                gl.glEnable(capability)
+            if gl.GL_BLEND in enable:
+                blendFunc(separateAlpha)
+            if gl.GL_LINE_SMOOTH in enable:
+                gl.glHint(gl.GL_LINE_SMOOTH_HINT, gl.GL_NICEST)
+            gl.glLineWidth(line_width)
+            gl.glVertexPointer(2, gl.GL_FLOAT, 0, vertices)
+            gl.glColorPointer(4, gl.GL_FLOAT, 0, colors)
+            gl.glDrawArrays(primitive, 0, len(vertices))
+            gl.glPopAttrib()
+    finally:
+        gl.glPopClientAttrib()
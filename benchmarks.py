@@ -0,0 +1,571 @@
+"""
+Benchmarks for GlyphNamespace, the gltext proxy and Widget.
+
+They run without RV and without a GPU: rv.runtime, rv.commands and
+rv.rvtypes are replaced by in-process stand-ins, pymu is hidden so every
+gltext call goes through runtime.eval, and the GL entry points used by the
+drawing backend are replaced by a recording GL that only counts calls.
+
+For every scenario the wall time of one iteration, the peak Python memory
+allocated by it, and the runtime.eval round trips, rv.commands calls and GL
+calls it makes (cold, with empty caches, and warm) are reported. Importing
+glyph is timed with -X importtime in a fresh interpreter and checked against
+IMPORT_BUDGET; it must not import PyOpenGL. Run from the directory containing
+this package:
+
+    python -m <package>.benchmarks                    # report
+    python -m <package>.benchmarks --save-baseline    # store benchmarks.json
+    python -m <package>.benchmarks --check            # exit 1 on regressions
+
+The baseline is compared against whenever it exists. Times are only
+comparable on the machine the baseline was stored on; call counts are
+deterministic.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks.json")
+
+#  Metrics a regression is reported for, with the slack allowed against the
+#  baseline. Counts are exact.
+TOLERANCES = {
+    "seconds": 1.25,
+    "peakKiB": 1.25,
+    "coldEvals": 1.0,
+    "evals": 1.0,
+    "commands": 1.0,
+    "glCalls": 1.0,
+    "vertices": 1.0,
+}
+
+#  Seconds importing glyph may take, cumulative over everything it imports.
+IMPORT_BUDGET = 0.15
+
+_IMPORT_TIME = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)")
+
+_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_ESCAPES = {"n": "\n", "r": "\r"}
+_SIZE = re.compile(r"gltext\.size\(([-+.\deE]+)\);")
+
+
+class StandInRuntime(types.ModuleType):
+    """
+    rv.runtime, answering the gltext sources glText generates from a font with
+    fixed proportions.
+    """
+    def __init__(self):
+        super(StandInRuntime, self).__init__("rv.runtime")
+        self.evals = 0
+        self.textSize = 12.0
+        self.gc = types.SimpleNamespace(push_api=lambda n: None, pop_api=lambda: None)
+
+    def bounds(self, text):
+        size = self.textSize
+        return [0.0, -0.25 * size, 0.55 * size * len(text), 1.05 * size]
+
+    def eval(self, source, modules):
+        self.evals += 1
+        if source.startswith("{ float[] r;"):
+            sizes = _SIZE.findall(source)
+            if sizes:
+                self.textSize = float(sizes[0])
+            values = []
+            for text in _STRING.findall(source):
+                text = re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), text)
+                values.extend(self.bounds(text))
+            values += [0.8 * self.textSize, -0.25 * self.textSize]
+            if sizes:
+                self.textSize = float(sizes[-1])
+            return values
+        if source.startswith("gltext.size("):
+            self.textSize = float(source[len("gltext.size("):-1])
+        elif source.startswith("gltext.bounds("):
+            return self.bounds(re.sub(r"\\(.)", r"\1", _STRING.search(source).group(1)))
+        elif source.startswith("gltext.ascenderHeight("):
+            return 0.8 * self.textSize
+        elif source.startswith("gltext.descenderDepth("):
+            return -0.25 * self.textSize
+        return None
+
+
+class StandInCommands(types.ModuleType):
+    """
+    rv.commands, remembering settings and margins and counting calls.
+    """
+    def __init__(self):
+        super(StandInCommands, self).__init__("rv.commands")
+        self.calls = 0
+        self._margins = [0.0, 0.0, 0.0, 0.0]
+        self._settings = {}
+        self._active = set()
+
+    def _call(self):
+        self.calls += 1
+
+    def margins(self):
+        self._call()
+        return list(self._margins)
+
+    def setMargins(self, margins, allDevices=False):
+        self._call()
+        self._margins = [m if v == -1.0 else v for m, v in zip(self._margins, margins)]
+
+    def viewSize(self):
+        self._call()
+        return types.SimpleNamespace(x=1920.0, y=1080.0)
+
+    def writeSetting(self, group, name, value):
+        self._call()
+        self._settings[(group, name)] = value
+
+    def readSetting(self, group, name, default):
+        self._call()
+        return self._settings.get((group, name), default)
+
+    def activateMode(self, name):
+        self._call()
+        self._active.add(name)
+
+    def deactivateMode(self, name):
+        self._call()
+        self._active.discard(name)
+
+    def isModeActive(self, name):
+        self._call()
+        return name in self._active
+
+    def redraw(self):
+        self._call()
+
+    def sendInternalEvent(self, name, contents="", sender=""):
+        self._call()
+        return ""
+
+    def setEventTableBBox(self, mode, table, min_point, max_point):
+        self._call()
+
+
+class MinorMode(object):
+    def __init__(self):
+        self._active = False
+        self._modeName = ""
+
+    def init(self, name, globalBindings, overrideBindings, menu=None, sortKey=None, ordering=0):
+        self._modeName = name
+
+
+class RecordingGL(object):
+    """
+    Stands in for the GL entry points of the gl module, counting calls and
+    vertices instead of drawing.
+    """
+    _RESULTS = {
+        "glGetFloatv": (1.0, 1.0, 1.0, 1.0),
+        "glGenLists": 1,
+        "glGetError": 0,
+        "glGetIntegerv": 0,
+        "glGenTextures": 1,
+        "glGenFramebuffers": 1,
+        "glCheckFramebufferStatus": 0x8CD5,
+    }
+
+    def __init__(self, gl):
+        super(RecordingGL, self).__init__()
+        self.calls = 0
+        self.vertices = 0
+        for name in gl.FUNCTIONS:
+            setattr(gl, name, self._entryPoint(name))
+
+    def _entryPoint(self, name):
+        result = self._RESULTS.get(name)
+
+        def f(*args, **kwargs):
+            self.calls += 1
+            if name == "glVertex2f":
+                self.vertices += 1
+            elif name == "glDrawArrays":
+                self.vertices += args[2]
+            return result
+        return f
+
+
+def installStandIns():
+    """
+    Put the rv stand-ins in sys.modules and make gltext importable the way
+    glyph.py imports it. Returns (runtime, commands).
+    """
+    runtime = StandInRuntime()
+    commands = StandInCommands()
+    rvtypes = types.ModuleType("rv.rvtypes")
+    rvtypes.MinorMode = MinorMode
+    rv = types.ModuleType("rv")
+    rv.runtime, rv.commands, rv.rvtypes = runtime, commands, rvtypes
+    sys.modules.update({"rv": rv, "rv.runtime": runtime, "rv.commands": commands, "rv.rvtypes": rvtypes})
+    sys.modules["pymu"] = None
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.append(here)
+    return runtime, commands
+
+
+def scenarios(G, Widget, Color, TBox, gltext):
+    """
+    (name, function) pairs; each function runs one iteration.
+    """
+    fg = Color(1, 1, 1, 1)
+    bg = Color(0, 0, 0, 0.85)
+
+    def nameValuePairs(count):
+        pairs = [("Name %d" % i, "value %d of %d" % (i * 7919 % 1000, count)) for i in range(count)]
+        return lambda: G.drawNameValuePairs(pairs, fg, bg, 20, 20, 8)
+
+    frames = iter(range(1 << 62))
+
+    def changingValues():
+        #  Values which differ every frame, like a timecode readout.
+        frame = next(frames)
+        pairs = [("Frame", str(frame)), ("Timecode", "00:00:%02d:%02d" % (frame // 24 % 60, frame % 24))]
+        gltext.size(14)
+        G.drawNameValuePairs(pairs, fg, bg, 20, 20, 8)
+
+    toggled = Widget()
+    toggled.init("benchmark-toggle", [], [])
+    toggled.drawInMargin(0)
+
+    dragged = Widget()
+    dragged.init("benchmark-drag", [], [])
+    dragged.drawInMargin(0)
+    dragged.toggle()
+
+    def toggle():
+        toggled.toggle()
+        toggled.toggle()
+
+    def drag():
+        dragged._dragging = True
+        for step in range(10):
+            dragged.updateBounds(TBox(10 + step, 10 + step), TBox(210 + step, 110 + step))
+        dragged._dragging = False
+
+    from .timeline import Timeline
+    timeline = Timeline(1, 100000)
+    timeline.setCachedFrames([f for f in range(1, 100001) if (f * 7919) % 13 < 7])
+    timeline.setMarkedFrames(range(1, 100001, 211))
+    timeline.setInOut(100, 90000)
+
+    class Overlay(Widget):
+        #  A 20 line readout, static or not, which sizes itself while
+        #  rendering like RV's widgets do.
+        pairs = [("Name %d" % i, "value %d" % i) for i in range(20)]
+
+        def __init__(self, name, static):
+            super(Overlay, self).__init__()
+            self.init(name, [], [])
+            self.static = static
+
+        def contentVersion(self):
+            return 1 if self.static else None
+
+        def render(self, event):
+            G.setupProjection(1920, 1080)
+            tbox = G.drawNameValuePairs(self.pairs, fg, bg, 20, 20, 8)[0]
+            self.updateBounds(TBox(20, 20), TBox(20 + tbox.x, 20 + tbox.y))
+
+    live = Overlay("benchmark-live", False)
+    static = Overlay("benchmark-static", True)
+    #  The first render sizes the widget, the second fills its layer.
+    static.render(None)
+    static.render(None)
+
+    #  Annotation markers: the same glyph in 500 places.
+    import numpy as np
+    marker = G.xformedGlyph(G.circleGlyph, scale=0.8) & G.triangleGlyph
+    xs = np.arange(500, dtype=np.float32) * 3.0
+    ys = np.full(500, 20.0, dtype=np.float32)
+    angles = np.arange(500, dtype=np.float32) % 360
+    sizes = np.full(500, 12.0, dtype=np.float32)
+    colors = [Color(i % 2, 1, 0, 1) for i in range(500)]
+
+    def markers():
+        for i in range(500):
+            G.backend.setColor(colors[i])
+            G.draw(marker, xs[i], ys[i], angles[i], sizes[i], False)
+
+    descriptors = ["Replace", "Append", "Layer", "Tile", "Sequence"]
+    return [
+        ("drawNameValuePairs[10]", nameValuePairs(10)),
+        ("drawNameValuePairs[100]", nameValuePairs(100)),
+        ("drawNameValuePairs[1000]", nameValuePairs(1000)),
+        ("drawNameValuePairs[changing]", changingValues),
+        ("fitTextInBox", lambda: G.fitTextInBox("Frame 1001 of shot_010_comp_v042", 480, 32)),
+        ("drawTextWithCartouche", lambda: G.drawTextWithCartouche(20, 20, "shot_010_comp_v042", 14, fg, bg, G.triangleGlyph)),
+        ("drawRoundedBox", lambda: G.drawRoundedBox(10, 10, 410, 210, 10, bg, fg)),
+        ("drawDropRegions", lambda: G.drawDropRegions(1920, 1080, 960, 500, 20, descriptors)),
+        ("Timeline.draw[100k]", lambda: timeline.draw(0, 0, 1600, 40)),
+        ("draw[500]", markers),
+        ("drawMany[500]", lambda: G.drawMany(marker, xs, ys, angles, sizes, colors)),
+        ("Widget.toggle", toggle),
+        ("Widget.render[live]", lambda: live.render(None)),
+        ("Widget.render[static]", lambda: static.render(None)),
+        ("Widget.drag", drag),
+    ]
+
+
+def measure(function, reset, runtime, commands, gl, minTime=0.2):
+    """
+    Benchmark function. reset() empties the caches before the cold run.
+    """
+    reset()
+    evals = runtime.evals
+    function()
+    cold_evals = runtime.evals - evals
+
+    evals, calls, gl_calls, vertices = runtime.evals, commands.calls, gl.calls, gl.vertices
+    function()
+    result = {
+        "coldEvals": cold_evals,
+        "evals": runtime.evals - evals,
+        "commands": commands.calls - calls,
+        "glCalls": gl.calls - gl_calls,
+        "vertices": gl.vertices - vertices,
+    }
+
+    tracemalloc.start()
+    function()
+    result["peakKiB"] = round(tracemalloc.get_traced_memory()[1] / 1024.0, 1)
+    tracemalloc.stop()
+
+    iterations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < minTime:
+        function()
+        iterations += 1
+        elapsed = time.perf_counter() - start
+    result["seconds"] = elapsed / iterations
+    result["iterations"] = iterations
+    return result
+
+
+def entryPoints(gl, recording, runtime, commands, minTime=0.2):
+    """
+    Time GLBackend's immediate mode drawing, a glyph's color and matrix calls
+    around a 256 vertex fan, through the real GL entry points: the raw ones
+    and PyOpenGL's (debug mode). No context is current, and libglvnd and
+    Mesa dispatch every call to a no-op then, so only the cost of making the
+    calls is timed. The call counts are taken with the recording GL.
+    """
+    from .backend import GLBackend
+    from .util import Color
+
+    backend = GLBackend()
+    color = Color(1, 1, 1, 1)
+    fan = [(0.0, 0.0)] + [(math.cos(i * math.pi / 127), math.sin(i * math.pi / 127)) for i in range(255)]
+
+    def draw():
+        backend.pushMatrix()
+        backend.loadIdentity()
+        backend.translate(10.0, 10.0)
+        backend.rotate(30.0)
+        backend.scale(20.0)
+        backend.setColor(color)
+        backend.shape(gl.GL_TRIANGLE_FAN, fan)
+        backend.popMatrix()
+
+    calls, vertices = recording.calls, recording.vertices
+    draw()
+    counts = {"glCalls": recording.calls - calls, "vertices": recording.vertices - vertices}
+
+    results = {}
+    fakes = dict((name, getattr(gl, name)) for name in gl.FUNCTIONS)
+    debug = gl.debug
+    for name, debugging in (("raw", False), ("PyOpenGL", True)):
+        gl.setDebug(debugging)
+        try:
+            result = measure(draw, lambda: None, runtime, commands, recording, minTime)
+            result.update(counts)
+            results["GL entry points[%s]" % name] = result
+        except Exception as e:
+            results["GL entry points[%s]" % name] = {"error": "%s: %s" % (type(e).__name__, e)}
+    gl.setDebug(debug)
+    for name, fake in fakes.items():
+        setattr(gl, name, fake)
+    return results
+
+
+def importTime(module="glyph", repeat=3):
+    """
+    Import module of this package in a fresh interpreter under -X importtime,
+    after installing the stand-ins. Returns the best cumulative import time
+    in seconds, the number of modules the import loaded and whether PyOpenGL
+    was among them.
+    """
+    package = __package__
+    source = "from {0} import benchmarks; benchmarks.installStandIns(); import {0}.{1}".format(package, module)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", source], cwd=root, capture_output=True, text=True
+        )
+        if process.returncode:
+            raise RuntimeError(process.stderr.strip().splitlines()[-1])
+        #  Children are listed before their parent, so everything after the
+        #  benchmarks import up to the module itself was loaded by it.
+        seconds, loaded, started = None, [], False
+        for line in process.stderr.splitlines():
+            match = _IMPORT_TIME.match(line)
+            if match is None:
+                continue
+            name = match.group(3)
+            if started:
+                loaded.append(name)
+                if name == "%s.%s" % (package, module):
+                    seconds = int(match.group(1)) / 1e6
+                    break
+            elif name == package + ".benchmarks":
+                started = True
+        if seconds is not None and (best is None or seconds < best["importSeconds"]):
+            best = {
+                "importSeconds": seconds,
+                "modules": len(loaded),
+                "openGL": any(name.split(".")[0] == "OpenGL" for name in loaded),
+            }
+    if best is None:
+        raise RuntimeError("%s.%s was not imported" % (package, module))
+    return best
+
+
+def run(minTime=0.2):
+    runtime, commands = installStandIns()
+    from . import gl as gl_module
+    from .glyph import GlyphNamespace
+    from ._rvtypes_widget import Widget
+    from .util import Color, TBox
+    import gltext
+
+    gl = RecordingGL(gl_module)
+
+    #  Advance tables are measured per run, never loaded from disk.
+    gltext.advanceCacheDirectory = None
+
+    def reset():
+        gltext.clearBoundsCache()
+        gltext.clearAdvanceTables()
+        GlyphNamespace._fitCache.clear()
+        GlyphNamespace.invalidateGlyphCache()
+
+    results = {}
+    for name, function in scenarios(GlyphNamespace, Widget, Color, TBox, gltext):
+        try:
+            results[name] = measure(function, reset, runtime, commands, gl, minTime)
+        except Exception as e:
+            results[name] = {"error": "%s: %s" % (type(e).__name__, e)}
+    if sys.platform.startswith("linux"):
+        results.update(entryPoints(gl_module, gl, runtime, commands, minTime))
+    return results
+
+
+def compare(results, baseline):
+    """
+    Return a list of (scenario, metric, baseline, current) regressions.
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or "error" in previous:
+            continue
+        if "error" in current:
+            regressions.append((name, "error", None, current["error"]))
+            continue
+        for metric, tolerance in sorted(TOLERANCES.items()):
+            if metric not in current:
+                continue
+            if metric in previous and current[metric] > previous[metric] * tolerance:
+                regressions.append((name, metric, previous[metric], current[metric]))
+    return regressions
+
+
+def report(results, baseline):
+    columns = ("seconds", "peakKiB", "coldEvals", "evals", "commands", "glCalls", "vertices")
+    print("%-28s %12s %9s %9s %7s %9s %9s %9s" % (("scenario",) + columns))
+    for name in sorted(results):
+        result = results[name]
+        if "error" in result:
+            print("%-28s %s" % (name, result["error"]))
+            continue
+        previous = baseline.get(name)
+        if "modules" in result:
+            print("%-28s %10.1fms %9s %d modules%s" % (
+                name, result["importSeconds"] * 1e3, "", result["modules"], ", OpenGL" if result["openGL"] else ""
+            ))
+            if previous and "error" not in previous:
+                print("%-28s %11.2fx" % ("  vs baseline", result["importSeconds"] / previous["importSeconds"]))
+            continue
+        print("%-28s %10.1fus %9.1f %9d %7d %9d %9d %9d" % (
+            (name, result["seconds"] * 1e6) + tuple(result[c] for c in columns[1:])
+        ))
+        if previous and "error" not in previous:
+            print("%-28s %11.2fx %8.2fx %9d %7d %9d %9d %9d" % (
+                ("  vs baseline", result["seconds"] / previous["seconds"],
+                 result["peakKiB"] / max(previous["peakKiB"], 0.1)) +
+                tuple(result[c] - previous[c] for c in columns[2:])
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if anything regressed")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to time each scenario for")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET,
+                        help="seconds importing glyph may take")
+    args = parser.parse_args(argv)
+
+    results = run(args.min_time)
+    try:
+        results["import glyph"] = importTime()
+    except Exception as e:
+        results["import glyph"] = {"error": "%s: %s" % (type(e).__name__, e)}
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    regressions = compare(results, baseline)
+    imported = results["import glyph"]
+    if "error" not in imported:
+        if imported["importSeconds"] > args.import_budget:
+            regressions.append(("import glyph", "budget", args.import_budget, imported["importSeconds"]))
+        if imported["openGL"]:
+            regressions.append(("import glyph", "openGL", False, True))
+    for name, metric, previous, current in regressions:
+        print("REGRESSION %s %s: %s -> %s" % (name, metric, previous, current))
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+OpenGL for the glyph code, resolved on first use.
+
+The enums used by the package are plain ints fixed by the GL specification
+and defined here, so importing glyph.py and friends does not import PyOpenGL.
+Functions (gl.glBegin, gl.gluOrtho2D, ...) are looked up the first time they
+are accessed and then cached in this module, so the PyOpenGL import is paid
+on the first draw instead of at load time.
+
+The entry points called in tight loops (glBegin, glVertex2f, glColor4f, the
+matrix stack, ...) are bound straight to the GL library through ctypes,
+skipping PyOpenGL's argument conversion and the glGetError it makes after
+every call. GL errors are instead collected once per frame by checkErrors().
+Debug mode (setDebug(True), or PYRV_GL_DEBUG=1 in the environment) uses
+PyOpenGL for everything, with its full per call checking.
+"""
+
+import os
+
+GL_POINTS = 0x0000
+GL_LINES = 0x0001
+GL_LINE_LOOP = 0x0002
+GL_LINE_STRIP = 0x0003
+GL_TRIANGLES = 0x0004
+GL_TRIANGLE_STRIP = 0x0005
+GL_TRIANGLE_FAN = 0x0006
+GL_QUADS = 0x0007
+GL_QUAD_STRIP = 0x0008
+GL_POLYGON = 0x0009
+
+GL_CURRENT_BIT = 0x00000001
+GL_LINE_BIT = 0x00000004
+GL_POLYGON_BIT = 0x00000008
+GL_VIEWPORT_BIT = 0x00000800
+GL_TRANSFORM_BIT = 0x00001000
+GL_ENABLE_BIT = 0x00002000
+GL_COLOR_BUFFER_BIT = 0x00004000
+GL_HINT_BIT = 0x00008000
+GL_TEXTURE_BIT = 0x00040000
+GL_CLIENT_VERTEX_ARRAY_BIT = 0x00000002
+
+GL_NO_ERROR = 0x0000
+GL_ONE = 0x0001
+GL_SRC_ALPHA = 0x0302
+GL_ONE_MINUS_SRC_ALPHA = 0x0303
+GL_FRONT_AND_BACK = 0x0408
+GL_CURRENT_COLOR = 0x0B00
+GL_LINE_SMOOTH = 0x0B20
+GL_POLYGON_SMOOTH = 0x0B41
+GL_BLEND = 0x0BE2
+GL_LINE_SMOOTH_HINT = 0x0C52
+GL_TEXTURE_2D = 0x0DE1
+GL_NICEST = 0x1102
+GL_COMPILE = 0x1300
+GL_UNSIGNED_BYTE = 0x1401
+GL_FLOAT = 0x1406
+GL_MODELVIEW = 0x1700
+GL_PROJECTION = 0x1701
+GL_RGBA = 0x1908
+GL_LINE = 0x1B01
+GL_NEAREST = 0x2600
+GL_TEXTURE_MAG_FILTER = 0x2800
+GL_TEXTURE_MIN_FILTER = 0x2801
+GL_TEXTURE_WRAP_S = 0x2802
+GL_TEXTURE_WRAP_T = 0x2803
+GL_RGBA8 = 0x8058
+GL_VERTEX_ARRAY = 0x8074
+GL_COLOR_ARRAY = 0x8076
+GL_CLAMP_TO_EDGE = 0x812F
+GL_FRAMEBUFFER_BINDING = 0x8CA6
+GL_FRAMEBUFFER_COMPLETE = 0x8CD5
+GL_COLOR_ATTACHMENT0 = 0x8CE0
+GL_FRAMEBUFFER = 0x8D40
+
+#  Every GL function the package calls, for tools that stand in for or wrap
+#  them (glstats, the benchmarks' recording GL).
+FUNCTIONS = (
+    "glBegin", "glEnd", "glVertex2f", "glColor4f", "glGetFloatv", "glGetError",
+    "glEnable", "glDisable", "glBlendFunc", "glHint", "glLineWidth",
+    "glPushAttrib", "glPopAttrib", "glPushClientAttrib", "glPopClientAttrib",
+    "glEnableClientState", "glVertexPointer", "glColorPointer", "glDrawArrays",
+    "glMatrixMode", "glPushMatrix", "glPopMatrix", "glLoadIdentity",
+    "glTranslate", "glRotate", "glScale",
+    "glGenLists", "glNewList", "glEndList", "glCallList", "glDeleteLists",
+    "glGetIntegerv", "glViewport", "glClearColor", "glClear", "glBlendFuncSeparate",
+    "glGenTextures", "glBindTexture", "glTexImage2D", "glTexParameteri", "glDeleteTextures", "glTexCoord2f",
+    "glGenFramebuffers", "glBindFramebuffer", "glFramebufferTexture2D", "glCheckFramebufferStatus",
+    "glDeleteFramebuffers",
+    "gluOrtho2D",
+)
+
+#  Entry points bound through ctypes outside debug mode: name -> (C symbol,
+#  result type, argument types), types given as codes: "" void, "I" GLenum,
+#  GLbitfield or GLuint, "f" GLfloat and "d" GLdouble. glTranslate, glRotate
+#  and glScale are the double versions, as in PyOpenGL. Everything called
+#  between glBegin and glEnd must be in here: PyOpenGL's checked wrappers call
+#  glGetError afterwards, which is itself an error inside a raw glBegin.
+_RAW = {
+    "glGetError": ("glGetError", "I", ""),
+    "glBegin": ("glBegin", "", "I"),
+    "glEnd": ("glEnd", "", ""),
+    "glVertex2f": ("glVertex2f", "", "ff"),
+    "glColor4f": ("glColor4f", "", "ffff"),
+    "glTexCoord2f": ("glTexCoord2f", "", "ff"),
+    "glMatrixMode": ("glMatrixMode", "", "I"),
+    "glPushMatrix": ("glPushMatrix", "", ""),
+    "glPopMatrix": ("glPopMatrix", "", ""),
+    "glLoadIdentity": ("glLoadIdentity", "", ""),
+    "glTranslate": ("glTranslated", "", "ddd"),
+    "glRotate": ("glRotated", "", "dddd"),
+    "glScale": ("glScaled", "", "ddd"),
+    "glEnable": ("glEnable", "", "I"),
+    "glDisable": ("glDisable", "", "I"),
+    "glBlendFunc": ("glBlendFunc", "", "II"),
+    "glLineWidth": ("glLineWidth", "", "f"),
+    "glPushAttrib": ("glPushAttrib", "", "I"),
+    "glPopAttrib": ("glPopAttrib", "", ""),
+    "glCallList": ("glCallList", "", "I"),
+}
+
+#  Errors checkErrors() reads at most; glGetError keeps returning the same
+#  error when there is no context to clear it in.
+_MAX_ERRORS = 32
+
+debug = os.environ.get("PYRV_GL_DEBUG", "") not in ("", "0")
+
+__all__ = [name for name in list(globals()) if name.startswith("GL_")]
+
+
+def setDebug(enabled):
+    """
+    Switch between the raw entry points and PyOpenGL's fully checked ones.
+    Functions already resolved are dropped, so anything patched in over them
+    (glstats, the benchmarks' recording GL) has to be patched in again.
+    """
+    global debug
+    debug = bool(enabled)
+    for name in FUNCTIONS:
+        globals().pop(name, None)
+
+
+def _rawFunction(name):
+    """
+    The ctypes function for name, or None if the GL library does not export
+    it directly.
+    """
+    import ctypes
+    from OpenGL import platform
+
+    symbol, result, arguments = _RAW[name]
+    types = {"": None, "I": ctypes.c_uint, "f": ctypes.c_float, "d": ctypes.c_double}
+    library = platform.PLATFORM.GL
+    prototype = platform.PLATFORM.functionTypeFor(library)(types[result], *[types[c] for c in arguments])
+    try:
+        return prototype((symbol, library))
+    except AttributeError:
+        return None
+
+
+def checkErrors():
+    """
+    Read every pending GL error, log them and return them as a list of
+    GLenums. Outside debug mode this is the only error checking there is;
+    GLBackend runs it once per frame, from setupProjection.
+    """
+    get_error = globals().get("glGetError") or __getattr__("glGetError")
+    errors = []
+    while len(errors) < _MAX_ERRORS:
+        error = int(get_error())
+        if error == GL_NO_ERROR or (errors and error == errors[-1]):
+            break
+        errors.append(error)
+    if errors:
+        import logging
+        log = logging.getLogger(__name__)
+        for error in errors:
+            log.warning("GL error 0x%04x since the last check", error)
+    return errors
+
+
+def __getattr__(name):
+    value = None
+    if not debug and name in _RAW:
+        value = _rawFunction(name)
+    if value is None:
+        if name.startswith("glu"):
+            from OpenGL import GLU as module
+        elif name.startswith("gl"):
+            from OpenGL import GL as module
+        else:
+            raise AttributeError(name)
+        value = getattr(module, name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,259 @@
+"""
+GL call accounting for the glyph drawing code.
+
+While enabled, the GL entry points of gl.py, which backend.py and batch.py
+call through, are replaced with counting wrappers, as are the drawing functions of
+GlyphNamespace and the layout and render methods of Widget modes. Every GL
+call is then charged to the current frame, to the outermost GlyphNamespace
+function it was made from and to the Widget mode being rendered. Disabling
+puts the original functions back, so there is no cost while it is off.
+
+    from package.glstats import stats
+    stats.enable()
+    ...
+    print(stats.toJSON(indent=2))
+
+A frame ends when nextFrame() is called or when a mode renders a second time.
+"""
+
+import functools
+import json
+from collections import deque
+
+#  Counter charged by each wrapped GL entry point.
+_GL_CALLS = {
+    "glBegin": "begin",
+    "glVertex2f": "vertices",
+    "glDrawArrays": "drawCalls",
+    "glCallList": "drawCalls",
+    "glPushMatrix": "matrix",
+    "glPopMatrix": "matrix",
+    "glLoadIdentity": "matrix",
+    "glTranslate": "matrix",
+    "glRotate": "matrix",
+    "glScale": "matrix",
+    "glMatrixMode": "stateChanges",
+    "glColor4f": "stateChanges",
+    "glEnable": "stateChanges",
+    "glDisable": "stateChanges",
+    "glBlendFunc": "stateChanges",
+    "glHint": "stateChanges",
+    "glLineWidth": "stateChanges",
+    "glPushAttrib": "stateChanges",
+    "glPopAttrib": "stateChanges",
+    "glPushClientAttrib": "stateChanges",
+    "glPopClientAttrib": "stateChanges",
+    "glEnableClientState": "stateChanges",
+    "glVertexPointer": "stateChanges",
+    "glColorPointer": "stateChanges",
+}
+
+COUNTERS = ("begin", "vertices", "drawCalls", "stateChanges", "matrix")
+
+#  GlyphNamespace classmethods which are not drawing entry points.
+_NOT_DRAWING = frozenset(["xformedGlyph", "coloredGlyph", "compileGlyph", "compiledGlyph", "invalidateGlyphCache"])
+
+
+def _counters():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+class FrameStats(object):
+    """
+    The GL calls of one frame: totals, per GlyphNamespace function and per
+    Widget mode, plus the number of calls of every GL function.
+    """
+    def __init__(self, index):
+        super(FrameStats, self).__init__()
+        self.index = index
+        self.total = _counters()
+        self.functions = {}
+        self.modes = {}
+        self.calls = {}
+
+    def call(self, function, mode, name, counter, vertices=0):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.count(function, mode, counter, 1)
+        if vertices:
+            self.count(function, mode, "vertices", vertices)
+
+    def count(self, function, mode, counter, amount):
+        self.total[counter] += amount
+        if function is not None:
+            counters = self.functions.get(function)
+            if counters is None:
+                counters = self.functions[function] = _counters()
+            counters[counter] += amount
+        if mode is not None:
+            counters = self.modes.get(mode)
+            if counters is None:
+                counters = self.modes[mode] = _counters()
+            counters[counter] += amount
+
+    def asDict(self):
+        return {
+            "frame": self.index,
+            "total": dict(self.total),
+            "functions": dict((k, dict(v)) for k, v in self.functions.items()),
+            "modes": dict((k, dict(v)) for k, v in self.modes.items()),
+            "calls": dict(self.calls),
+        }
+
+
+class GLStats(object):
+    """
+    Runtime switchable GL call counters. Keeps the frame in progress and the
+    last historySize completed frames.
+    """
+    def __init__(self, historySize=120):
+        super(GLStats, self).__init__()
+        self._patches = []
+        self._function = None
+        self._mode = None
+        self._modesThisFrame = set()
+        self._frameCount = 0
+        self._frame = FrameStats(0)
+        self._history = deque(maxlen=historySize)
+
+    def isEnabled(self):
+        return bool(self._patches)
+
+    def enable(self):
+        """
+        Start counting. Widget classes defined afterwards are only picked up by
+        the next enable().
+        """
+        if self._patches:
+            return
+        from . import gl
+        from .glyph import GlyphNamespace
+        from ._rvtypes_widget import Widget
+
+        for name, counter in _GL_CALLS.items():
+            #  gl resolves functions on first access, so look each one up before
+            #  patching it.
+            self._patch(gl, name, self._glCall(getattr(gl, name), name, counter))
+
+        for name, value in list(vars(GlyphNamespace).items()):
+            if not isinstance(value, classmethod) or name in _NOT_DRAWING:
+                continue
+            if name.startswith("draw") or name.endswith("Glyph") or name == "setupProjection":
+                self._patch(GlyphNamespace, name, classmethod(self._scoped(value.__func__)))
+
+        classes = [Widget]
+        while classes:
+            cls = classes.pop()
+            classes.extend(cls.__subclasses__())
+            for name in ("layout", "render"):
+                if name in vars(cls):
+                    self._patch(cls, name, self._moded(vars(cls)[name], name == "render"))
+
+    def disable(self):
+        """
+        Stop counting and restore the original functions. Counters are kept.
+        """
+        while self._patches:
+            owner, name, original = self._patches.pop()
+            setattr(owner, name, original)
+        self._function = None
+        self._mode = None
+
+    def _patch(self, owner, name, replacement):
+        self._patches.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, replacement)
+
+    def _glCall(self, function, name, counter):
+        stats = self
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            vertices = args[2] if name == "glDrawArrays" else 0
+            stats._frame.call(stats._function, stats._mode, name, counter, vertices)
+            return function(*args, **kwargs)
+        return wrapper
+
+    def _scoped(self, function):
+        stats = self
+
+        @functools.wraps(function)
+        def wrapper(cls, *args, **kwargs):
+            if stats._function is not None:
+                return function(cls, *args, **kwargs)
+            stats._function = function.__name__
+            try:
+                return function(cls, *args, **kwargs)
+            finally:
+                stats._function = None
+        return wrapper
+
+    def _moded(self, function, render):
+        stats = self
+
+        @functools.wraps(function)
+        def wrapper(mode, *args, **kwargs):
+            name = getattr(mode, "_modeName", None) or type(mode).__name__
+            if render:
+                if name in stats._modesThisFrame:
+                    stats.nextFrame()
+                stats._modesThisFrame.add(name)
+            previous, stats._mode = stats._mode, name
+            try:
+                return function(mode, *args, **kwargs)
+            finally:
+                stats._mode = previous
+        return wrapper
+
+    def nextFrame(self):
+        """
+        Finish the frame in progress and start counting a new one.
+        """
+        self._history.append(self._frame)
+        self._frameCount += 1
+        self._frame = FrameStats(self._frameCount)
+        self._modesThisFrame.clear()
+
+    def reset(self):
+        self._history.clear()
+        self._frameCount = 0
+        self._frame = FrameStats(0)
+        self._modesThisFrame.clear()
+
+    def currentFrame(self):
+        return self._frame.asDict()
+
+    def lastFrame(self):
+        """
+        The most recently completed frame, or None.
+        """
+        return self._history[-1].asDict() if self._history else None
+
+    def frames(self):
+        return [frame.asDict() for frame in self._history]
+
+    def totals(self):
+        """
+        Counters summed over the remembered frames and the frame in progress.
+        """
+        total = _counters()
+        for frame in list(self._history) + [self._frame]:
+            for counter, value in frame.total.items():
+                total[counter] += value
+        return total
+
+    def asDict(self):
+        return {
+            "enabled": self.isEnabled(),
+            "totals": self.totals(),
+            "current": self.currentFrame(),
+            "frames": self.frames(),
+        }
+
+    def toJSON(self, indent=None):
+        return json.dumps(self.asDict(), indent=indent, sort_keys=True)
+
+    def dump(self, path, indent=2):
+        with open(path, "w") as f:
+            f.write(self.toJSON(indent))
+
+
+stats = GLStats()
@@ -1,10 +1,78 @@
 """
 gltext is a wrapper around the Mu interface into the gltext library.
-It uses rv.runtime.eval to resolve functions on the fly. It may raise a glText.MuException if the runtime.eval failed.
+Each gltext function is resolved once, on first use, into a cached stub bound to a pymu.MuSymbol handle.
+Functions which cannot be bound that way fall back to rv.runtime.eval with their arguments marshalled
+into Mu literals. It may raise a glText.MuException if the call failed.
+
+gltext.bounds() results are memoized in a bounded LRU keyed by (font, size, text). The size is tracked through
+gltext.size() and any call that changes the font invalidates the cache. gltext.boundsMany() measures and
+gltext.writeMany() writes a whole list of strings in a single eval. gltext.metrics() returns the shared
+glText.FontMetrics of the current font and size, which also answers gltext.ascenderHeight() and
+gltext.descenderDepth().
 """
 
+import hashlib
+import json
+import os
+import re
 import sys
-from rv import runtime
+from collections import OrderedDict
+
+import numpy as np
+
+
+def muValue(value):
+    """
+    Convert value into something pymu can pass to Mu: Colors become 4 element and TBoxes 2 element
+    tuples, everything else is passed through.
+    """
+    if hasattr(value, "rgba"):
+        return value.rgba()
+    if hasattr(value, "x") and hasattr(value, "y"):
+        return (value.x, value.y)
+    return value
+
+
+def muLiteral(value):
+    """
+    Format value as Mu source.
+    """
+    value = muValue(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, np.number):
+        return repr(value.item())
+    if isinstance(value, str):
+        return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+    if isinstance(value, tuple) and 2 <= len(value) <= 4:
+        return "Vec%d(%s)" % (len(value), ", ".join(repr(float(v)) for v in value))
+    if isinstance(value, list):
+        if all(isinstance(v, str) for v in value):
+            return "string[] {%s}" % ", ".join(muLiteral(v) for v in value)
+        return "float[] {%s}" % ", ".join(repr(float(v)) for v in value)
+    raise TypeError("Cannot convert a %s to a Mu literal" % type(value))
+
+
+def _runtime():
+    """
+    rv.runtime, imported on the first Mu call instead of with this module.
+    """
+    from rv import runtime
+    return runtime
+
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def muFloats(result):
+    """
+    Flatten a Mu float array result, either as returned by pymu or as printed Mu source, into a list of floats.
+    """
+    if isinstance(result, str):
+        return [float(v) for v in _NUMBER.findall(result)]
+    return [float(v) for v in result]
 
 
 class glText(object):
@@ -13,19 +81,506 @@ class glText(object):
     """
     class MuException(Exception): pass
 
-    def __getattr__(self, item):
-        def f(*args, **kwargs):
+    class MuFunction(object):
+        """
+        Callable stub for one gltext function. The Mu function handle is looked up on the first call
+        and reused afterwards, so repeated calls do not make Mu parse any source.
+        """
+        def __init__(self, name):
+            super(glText.MuFunction, self).__init__()
+            self.name = name
+            self._symbol = None
+            self._bound = False
+            #  Argument types the bound symbol could not take, called through eval.
+            self._evalSignatures = set()
+
+        def _bind(self):
+            self._bound = True
+            try:
+                from pymu import MuSymbol
+                _runtime().eval("require gltext;", [])
+                self._symbol = MuSymbol("gltext." + self.name)
+            except Exception:
+                #  Overloaded or otherwise unresolvable; use eval instead.
+                self._symbol = None
+
+        def _eval(self, args, kwargs):
             message = "gltext.{name}({args})".format(
-                name=item,
-                args=", ".join(list(args) + ["%s=%s" % (k, kwargs[k]) for k in kwargs])
+                name=self.name,
+                args=", ".join([muLiteral(a) for a in args] + ["%s=%s" % (k, muLiteral(kwargs[k])) for k in kwargs])
             )
             try:
-                return runtime.eval(
+                return _runtime().eval(
                     message,
                     ["gltext"]
                 )
             except Exception:
                 raise glText.MuException("Could not successfully call %s. An exception was raised." % message)
+
+        def __call__(self, *args, **kwargs):
+            if not self._bound:
+                self._bind()
+            if self._symbol is not None and not kwargs:
+                signature = tuple(type(a) for a in args)
+                if signature not in self._evalSignatures:
+                    try:
+                        return self._symbol(*[muValue(a) for a in args])
+                    except TypeError:
+                        #  The handle is not the overload these arguments need. Anything else was raised by the
+                        #  call itself and must not be run a second time through eval.
+                        self._evalSignatures.add(signature)
+            return self._eval(args, kwargs)
+
+    class FontMetrics(object):
+        """
+        Line metrics of one font at one size, measured once and shared by everyone using that (font, size).
+        It can be held on to and measured through directly; it sets its size on gltext when needed. It is only
+        meaningful until the font changes.
+        """
+        def __init__(self, proxy, font, size, ascender, descender):
+            super(glText.FontMetrics, self).__init__()
+            self._proxy = proxy
+            self.font = font
+            self.size = size
+            self.ascender = ascender
+            self.descender = descender
+            self.height = ascender - descender
+
+        def _select(self):
+            if self._proxy._size != self.size:
+                self._proxy.size(self.size)
+
+        def bounds(self, text):
+            key = (self.font, self.size, text)
+            value = self._proxy._localBounds(key)
+            if value is not None:
+                return value
+            if key not in self._proxy._boundsCache:
+                self._select()
+            return self._proxy._boundsAt(key)
+
+        def boundsMany(self, strings):
+            table = self._proxy._advanceTable(self.font, self.size)
+            if table is not None:
+                result, computed = table.boundsMany(strings, self.size)
+                if computed.all():
+                    self._proxy.advanceTableHits += len(strings)
+                    return result
+            self._select()
+            return self._proxy.boundsMany(strings)[0]
+
+        def width(self, text):
+            bounds = self.bounds(text)
+            return bounds[0] + bounds[2]
+
+    class AdvanceTable(object):
+        """
+        Per character advances and bounds of one font at a reference size, measured once, from which string
+        bounds at any size are computed locally: the advances of all but the last character plus the extent of
+        the last one, scaled by size. Kerning is not modelled. Only Latin-1 characters measured into the table
+        are known; strings with any other character return None.
+        """
+        VERSION = 1
+        CHARACTERS = "".join(chr(c) for c in list(range(32, 127)) + list(range(160, 256)))
+
+        def __init__(self, font, referenceSize, characters, advances, bounds, ascender, descender):
+            super(glText.AdvanceTable, self).__init__()
+            self.font = font
+            self.referenceSize = referenceSize
+            self.ascender = ascender
+            self.descender = descender
+            self.known = np.zeros(256, dtype=bool)
+            self.advances = np.zeros(256, dtype=np.float64)
+            self.left = np.zeros(256, dtype=np.float64)
+            self.right = np.zeros(256, dtype=np.float64)
+            self.bottom = np.zeros(256, dtype=np.float64)
+            self.top = np.zeros(256, dtype=np.float64)
+            codes = np.array([ord(c) for c in characters], dtype=np.intp)
+            bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+            self.known[codes] = True
+            self.advances[codes] = advances
+            self.left[codes] = bounds[:, 0]
+            self.right[codes] = bounds[:, 0] + bounds[:, 2]
+            self.bottom[codes] = bounds[:, 1]
+            self.top[codes] = bounds[:, 1] + bounds[:, 3]
+            self._characters = characters
+            self._advances = list(advances)
+            self._bounds = bounds.tolist()
+
+        @classmethod
+        def measure(cls, proxy, font):
+            """
+            Measure every character, and every character doubled, at the reference size in one eval. The
+            advance of a character is the difference between the two widths.
+            """
+            characters = cls.CHARACTERS
+            size = proxy.advanceReferenceSize
+            values = proxy._measure(list(characters) + [c + c for c in characters], size)
+            count = len(characters)
+            single = np.array(values[:count * 4]).reshape(-1, 4)
+            double = np.array(values[count * 4:count * 8]).reshape(-1, 4)
+            advances = (double[:, 0] + double[:, 2]) - (single[:, 0] + single[:, 2])
+            return cls(font, size, characters, advances.tolist(), single, values[-2], values[-1])
+
+        @classmethod
+        def load(cls, path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != cls.VERSION:
+                return None
+            return cls(data["font"], data["referenceSize"], data["characters"], data["advances"], data["bounds"],
+                       data["ascender"], data["descender"])
+
+        def save(self, path):
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            temporary = "%s.%d" % (path, os.getpid())
+            with open(temporary, "w") as f:
+                json.dump({
+                    "version": self.VERSION, "font": self.font, "referenceSize": self.referenceSize,
+                    "characters": self._characters, "advances": self._advances, "bounds": self._bounds,
+                    "ascender": self.ascender, "descender": self.descender,
+                }, f)
+            os.replace(temporary, path)
+
+        def lineMetrics(self, size):
+            scale = size / float(self.referenceSize)
+            return self.ascender * scale, self.descender * scale
+
+        def bounds(self, text, size):
+            if not text:
+                return (0.0, 0.0, 0.0, 0.0)
+            try:
+                codes = text.encode("latin-1")
+            except UnicodeEncodeError:
+                return None
+            known = self.known
+            if not all(known[c] for c in codes):
+                return None
+            scale = size / float(self.referenceSize)
+            advances = self.advances
+            last = codes[-1]
+            left = self.left[codes[0]]
+            right = sum(advances[c] for c in codes[:-1]) + self.right[last]
+            bottom = min(self.bottom[c] for c in codes)
+            top = max(self.top[c] for c in codes)
+            return (float(left * scale), float(bottom * scale), float((right - left) * scale), float((top - bottom) * scale))
+
+        def boundsMany(self, strings, size):
+            """
+            Returns an (N, 4) float32 array of bounds and a boolean array of which strings could be computed.
+            """
+            count = len(strings)
+            result = np.zeros((count, 4), dtype=np.float32)
+            encoded = []
+            for text in strings:
+                try:
+                    encoded.append(text.encode("latin-1"))
+                except UnicodeEncodeError:
+                    encoded.append(b"\x00")
+            lengths = np.fromiter((len(e) for e in encoded), dtype=np.intp, count=count)
+            ok = np.ones(count, dtype=bool)
+            filled = np.flatnonzero(lengths)
+            if not len(filled):
+                return result, ok
+
+            codes = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.intp)
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[filled]
+            lasts = starts + lengths[filled] - 1
+            ok[filled] = np.logical_and.reduceat(self.known[codes], starts)
+
+            left = self.left[codes[starts]]
+            right = np.add.reduceat(self.advances[codes], starts) - self.advances[codes[lasts]] + self.right[codes[lasts]]
+            bottom = np.minimum.reduceat(self.bottom[codes], starts)
+            top = np.maximum.reduceat(self.top[codes], starts)
+            scale = size / float(self.referenceSize)
+            result[filled] = np.column_stack((left, bottom, right - left, top - bottom)) * scale
+            return result, ok
+
+    #  gltext functions that change the active font.
+    fontFunctions = frozenset(["init", "setFont"])
+
+    def __init__(self):
+        super(glText, self).__init__()
+        self._functions = {}
+        self._font = None
+        self._size = None
+        self._boundsCache = OrderedDict()
+        self._fontMetrics = {}
+        self.boundsCacheCapacity = 4096
+        self.boundsCacheHits = 0
+        self.boundsCacheMisses = 0
+        self._advanceTables = {}
+        self.useAdvanceTables = True
+        self.advanceReferenceSize = 100
+        self.advanceTableHits = 0
+        self.advanceCacheDirectory = os.environ.get(
+            "PYRV_GLTEXT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "pyrv", "gltext")
+        )
+
+    def _function(self, name):
+        stub = self._functions.get(name)
+        if stub is None:
+            stub = self._functions[name] = glText.MuFunction(name)
+        return stub
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        if item in self.fontFunctions:
+            stub = self._fontSetter(item)
+        else:
+            stub = self._function(item)
+        setattr(self, item, stub)
+        return stub
+
+    def _fontSetter(self, name):
+        function = self._function(name)
+
+        def f(*args, **kwargs):
+            self.clearBoundsCache()
+            self._font = args[0] if args else None
+            return function(*args, **kwargs)
         return f
 
+    def currentFont(self):
+        return self._font
+
+    def size(self, size):
+        self._size = size
+        return self._function("size")(size)
+
+    def bounds(self, text):
+        """
+        gltext.bounds(text) at the current font and size, served from the LRU when possible.
+        """
+        return self._boundsAt((self._font, self._size, text))
+
+    def _localBounds(self, key):
+        table = self._advanceTable(key[0], key[1])
+        if table is None:
+            return None
+        value = table.bounds(key[2], key[1])
+        if value is not None:
+            self.advanceTableHits += 1
+        return value
+
+    def _boundsAt(self, key):
+        value = self._localBounds(key)
+        if value is not None:
+            return value
+        cache = self._boundsCache
+        value = cache.get(key)
+        if value is None:
+            self.boundsCacheMisses += 1
+            value = cache[key] = tuple(muFloats(self._function("bounds")(key[2])))
+            if len(cache) > self.boundsCacheCapacity:
+                cache.popitem(last=False)
+        else:
+            self.boundsCacheHits += 1
+            cache.move_to_end(key)
+        return value
+
+    def boundsMany(self, strings):
+        """
+        Measure every string in strings at the current font and size.
+        Returns an (N, 4) float32 array of bounds along with the ascender height and descender depth. Strings
+        missing from the bounds cache are measured together in a single runtime.eval.
+        """
+        cache = self._boundsCache
+        prefix = (self._font, self._size)
+        table = self._advanceTable(self._font, self._size)
+        if table is not None:
+            result, computed = table.boundsMany(strings, self._size)
+            self.advanceTableHits += int(computed.sum())
+            metrics = self._metricsAt(prefix)
+            if computed.all():
+                return result, metrics.ascender, metrics.descender
+            indices = np.flatnonzero(~computed).tolist()
+        else:
+            result = np.empty((len(strings), 4), dtype=np.float32)
+            indices = range(len(strings))
+
+        missing = []
+        for index in indices:
+            text = strings[index]
+            key = prefix + (text,)
+            value = cache.get(key)
+            if value is None:
+                missing.append(text)
+            else:
+                self.boundsCacheHits += 1
+                cache.move_to_end(key)
+                result[index] = value
+
+        metrics = self._fontMetrics.get(prefix)
+        if missing or metrics is None:
+            missing = list(OrderedDict.fromkeys(missing))
+            values = self._measure(missing)
+            if metrics is None:
+                metrics = self._fontMetrics[prefix] = glText.FontMetrics(self, self._font, self._size, values[-2], values[-1])
+            measured = dict(zip(missing, [tuple(values[i:i + 4]) for i in range(0, len(missing) * 4, 4)]))
+            self.boundsCacheMisses += len(missing)
+
+            for index in indices:
+                value = measured.get(strings[index])
+                if value is not None:
+                    result[index] = value
+            for text in missing:
+                cache[prefix + (text,)] = measured[text]
+            while len(cache) > self.boundsCacheCapacity:
+                cache.popitem(last=False)
+
+        return result, metrics.ascender, metrics.descender
+
+    def writeMany(self, records):
+        """
+        Write every (x, y, color, text) record in a single runtime.eval. A color of None keeps the current
+        color. Consecutive records of the same color only set it once.
+        """
+        statements = []
+        current = None
+        for x, y, color, text in records:
+            if color is not None:
+                color = muValue(color)
+                if color != current:
+                    statements.append("gltext.color(%s);" % muLiteral(color))
+                    current = color
+            statements.append("gltext.writeAt(%s, %s, %s);" % (muLiteral(x), muLiteral(y), muLiteral(text)))
+        if not statements:
+            return
+        source = "{ %s }" % " ".join(statements)
+        try:
+            _runtime().eval(source, ["gltext"])
+        except Exception:
+            raise glText.MuException("Could not successfully write %d strings. An exception was raised." % len(records))
+
+    def metrics(self):
+        """
+        The FontMetrics of the current font and size, measured on first use.
+        """
+        return self._metricsAt((self._font, self._size))
+
+    def _metricsAt(self, prefix):
+        metrics = self._fontMetrics.get(prefix)
+        if metrics is None:
+            table = self._advanceTable(*prefix)
+            if table is not None:
+                ascender, descender = table.lineMetrics(prefix[1])
+            else:
+                ascender, descender = self._measure([])
+            metrics = self._fontMetrics[prefix] = glText.FontMetrics(self, prefix[0], prefix[1], ascender, descender)
+        return metrics
+
+    def _advanceTable(self, font, size):
+        """
+        The AdvanceTable of font, loaded from the on-disk cache or measured on first use. None when tables are
+        disabled or the size is unknown.
+        """
+        if not self.useAdvanceTables or size is None:
+            return None
+        return self._loadAdvanceTable(font)
+
+    def advanceTable(self):
+        """
+        The AdvanceTable of the current font, whether or not useAdvanceTables is set, or None when it is neither
+        loaded nor cached on disk and no size has been set: measuring it changes the Mu text size, which can only
+        be restored when known. Its arrays are not changed after construction, so it can be read from other
+        threads.
+        """
+        return self._loadAdvanceTable(self._font)
+
+    def _loadAdvanceTable(self, font):
+        table = self._advanceTables.get(font)
+        if table is None:
+            path = self._advanceCachePath(font)
+            if path is not None and os.path.exists(path):
+                try:
+                    table = glText.AdvanceTable.load(path)
+                except (OSError, ValueError, KeyError):
+                    table = None
+            if table is None:
+                if self._size is None:
+                    return None
+                table = glText.AdvanceTable.measure(self, font)
+                if path is not None:
+                    try:
+                        table.save(path)
+                    except OSError:
+                        pass
+            self._advanceTables[font] = table
+        return table
+
+    def _advanceCachePath(self, font):
+        """
+        Cache file of font, keyed by its name and, for font files, their modification time. Only fonts named
+        through init() or setFont() persist: for None, the default or a font set on the Mu side, Mu does not tell
+        which font it is, so its table is measured once per session instead of sharing a file with other fonts.
+        """
+        if not self.advanceCacheDirectory or font is None:
+            return None
+        key = "%s|%s" % (font, self.advanceReferenceSize)
+        if font and os.path.exists(font):
+            key += "|%s" % os.path.getmtime(font)
+        return os.path.join(self.advanceCacheDirectory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def clearAdvanceTables(self):
+        """
+        Forget the in-memory advance tables; the on-disk cache is kept.
+        """
+        self._advanceTables.clear()
+        self._fontMetrics.clear()
+
+    def ascenderHeight(self):
+        return self.metrics().ascender
+
+    def descenderDepth(self):
+        return self.metrics().descender
+
+    def _measure(self, strings, size=None):
+        """
+        Bounds of strings followed by the ascender height and descender depth, as a flat list of floats, in a
+        single eval. With size the measurement is made at that size and the current size, which must be known,
+        restored afterwards.
+        """
+        if size is not None and self._size is None:
+            raise ValueError("Cannot measure at size %s: the current gltext size is unknown." % size)
+        source = "{ float[] r; "
+        if size is not None:
+            source += "gltext.size(%s); " % muLiteral(size)
+        if strings:
+            source += (
+                "for_each (t; %s) { let b = gltext.bounds(t); "
+                "r.push_back(b[0]); r.push_back(b[1]); r.push_back(b[2]); r.push_back(b[3]); } "
+            ) % muLiteral(list(strings))
+        source += "r.push_back(gltext.ascenderHeight()); r.push_back(gltext.descenderDepth()); "
+        if size is not None:
+            source += "gltext.size(%s); " % muLiteral(self._size)
+        source += "r; }"
+        try:
+            values = muFloats(_runtime().eval(source, ["gltext"]))
+        except Exception:
+            raise glText.MuException("Could not successfully measure %d strings. An exception was raised." % len(strings))
+        if len(values) != len(strings) * 4 + 2:
+            raise glText.MuException("gltext measured %d values for %d strings." % (len(values), len(strings)))
+        return values
+
+    def setBoundsCacheCapacity(self, capacity):
+        self.boundsCacheCapacity = max(0, int(capacity))
+        while len(self._boundsCache) > self.boundsCacheCapacity:
+            self._boundsCache.popitem(last=False)
+
+    def clearBoundsCache(self):
+        self._boundsCache.clear()
+        self._fontMetrics.clear()
+
+    def boundsCacheStats(self):
+        return {
+            "hits": self.boundsCacheHits,
+            "misses": self.boundsCacheMisses,
+            "entries": len(self._boundsCache),
+            "capacity": self.boundsCacheCapacity,
+        }
+
 sys.modules[__name__] = glText()
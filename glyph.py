@@ -17,25 +17,119 @@ require gltext;
 //  Higher order glyph functions
 //
 """
+import contextlib
+import itertools
 import math
-from OpenGL.GL import *
-from OpenGL.GLU import gluOrtho2D
 
-from rv import commands
+import numpy as np
+from .gl import *
 
 import gltext
+from .backend import GLBackend
+from .batch import VertexBatch
+from .program import GlyphRecorder, instanceColors
 from .util import lerp, Color, BBox, TBox
 
 
 class GlyphNamespace(object):
+    #  Everything is drawn through this backend; see setBackend().
+    backend = GLBackend()
+
+    #  Unit glyphs whose geometry never changes. When useGlyphCache is set,
+    #  draw() has the backend compile each (glyph, outline) pair once (into a
+    #  display list per GL context for GLBackend) and replay it.
+    useGlyphCache = True
+    _cacheableGlyphs = frozenset([
+        "triangleGlyph",
+        "circleGlyph",
+        "squareGlyph",
+        "pauseGlyph",
+        "advanceGlyph",
+        "rgbGlyph",
+        "drawXGlyph",
+        "tformCircle",
+        "translateIconGlyph",
+        "translateXIconGlyph",
+        "translateYIconGlyph",
+    ])
+    #  GlyphPrograms of the unit glyphs above, by (name, outline), for
+    #  drawMany().
+    _unitPrograms = {}
+
+    #  Shared vertex batch. Drawing functions that support batching add their
+    #  geometry to it while inside batching(); it is drawn when the outermost
+    #  batching() scope exits or when flushBatch() is called.
+    _batch = None
+    _batchDepth = 0
+
+    #  Set while compileGlyph() runs a glyph; the glyph primitives below send
+    #  their shapes, colors and transforms to it instead of GL.
+    _recorder = None
+
+    #  fitTextInBox/fitNameValuePairsInBox solve for a size from a measurement
+    #  at fitReferenceSize, predicting for up to fitMaxProbes probes and then
+    #  bisecting. fitStats counts calls, memo hits and probes, where a probe
+    #  is one gltext.size() plus measurement.
+    fitReferenceSize = 64
+    fitMinSize = 4
+    fitMaxSize = 2048
+    fitMaxProbes = 6
+    fitCacheCapacity = 1024
+    fitStats = {"calls": 0, "hits": 0, "probes": 0}
+    _fitCache = {}
+
     class AbstractGlyph(object):
+        #  Every glyph takes a new, ever increasing version from this counter
+        #  when one of its public attributes is set. A tree is changed when
+        #  the newest version in it is, since replacing a subtree is itself an
+        #  assignment to its parent.
+        _versions = itertools.count(1)
+
         def __init__(self, glyph):
             super(GlyphNamespace.AbstractGlyph, self).__init__()
+            self._programs = {}
             self.glyph = glyph
 
+        def __setattr__(self, name, value):
+            object.__setattr__(self, name, value)
+            if not name.startswith("_"):
+                object.__setattr__(self, "_version", next(GlyphNamespace.AbstractGlyph._versions))
+
         def __call__(self, outline):
             return
 
+        def invalidate(self):
+            """
+            Recompile this tree and the trees containing it on next draw, for
+            changes made in place (to a translate TBox or a Color) that
+            attribute assignment did not catch.
+            """
+            object.__setattr__(self, "_version", next(GlyphNamespace.AbstractGlyph._versions))
+
+        def children(self):
+            return (self.glyph,)
+
+        def treeVersion(self):
+            """
+            The newest version of this glyph and the composed glyphs under it.
+            """
+            version = self._version
+            for child in self.children():
+                if isinstance(child, GlyphNamespace.AbstractGlyph):
+                    version = max(version, child.treeVersion())
+            return version
+
+        def program(self, outline):
+            """
+            The GlyphProgram of this tree, compiled when missing or stale. None
+            if the tree contains glyphs which cannot be flattened.
+            """
+            entry = self._programs.get(outline)
+            version = self.treeVersion()
+            if entry is None or entry[0] != version:
+                entry = self._programs[outline] = (version, GlyphNamespace.compileGlyph(self, outline))
+            return entry[1]
+
         def __and__(self, other):
             """
             operator: & (Glyph; Glyph a, Glyph b)
@@ -54,6 +148,9 @@ class GlyphNamespace(object):
             super(GlyphNamespace.GlyphJoiner, self).__init__(glyphs[0])
             self.glyphs = glyphs
 
+        def children(self):
+            return self.glyphs
+
         def __call__(self, outline):
             for glyph in self.glyphs:
                 glyph(outline)
@@ -66,14 +163,13 @@ class GlyphNamespace(object):
             self.translate = translate or TBox(0, 0)
 
         def __call__(self, outline):
-            glMatrixMode(GL_MODELVIEW)
-            glPushMatrix()
-            glRotate(self.angle, 0, 0, 1)
-            glScale(self.scale, self.scale, self.scale)
+            GlyphNamespace._pushMatrix()
+            GlyphNamespace._rotate(self.angle)
+            GlyphNamespace._scale(self.scale)
             if self.translate.x or self.translate.y:
-                glTranslate(self.translate.x, self.translate.y, 0.0)
+                GlyphNamespace._translate(self.translate.x, self.translate.y)
             self.glyph(outline)
-            glPopMatrix()
+            GlyphNamespace._popMatrix()
 
     class ColoredGlyph(AbstractGlyph):
         def __init__(self, glyph, color):
@@ -81,7 +177,7 @@ class GlyphNamespace(object):
             self.color = color
 
         def __call__(self, outline):
-            glColor(self.color)
+            GlyphNamespace._color(self.color)
             self.glyph(outline)
 
     @classmethod
@@ -147,12 +243,7 @@ class GlyphNamespace(object):
             glEnd();
         }
         """
-        glBegin(glenum)
-        glVertex(ax, ay)
-        glVertex(bx, by)
-        glVertex(cx, cy)
-        glVertex(dx, dy)
-        glEnd()
+        cls._shape(glenum, ((ax, ay), (bx, by), (cx, cy), (dx, dy)))
 
     @classmethod
     def drawCircleFan(cls, x, y, width, start, end, increment, outline=False):
@@ -176,21 +267,27 @@ class GlyphNamespace(object):
             glEnd();
         }
         """
+        cls._shape(
+            GL_LINE_STRIP if outline else GL_TRIANGLE_FAN,
+            cls.circleFanVertices(x, y, width, start, end, increment, outline)
+        )
+
+    @classmethod
+    def circleFanVertices(cls, x, y, width, start, end, increment, outline=False):
+        """
+        The vertices drawCircleFan() emits, as an (N, 2) float32 array.
+        """
         rad_start = start * math.pi * 2.0
         rad_end = end * math.pi * 2.0
+        angles = np.append(np.arange(rad_start, rad_end, increment), rad_end)
 
-        if outline:
-            glBegin(GL_LINE_STRIP)
-        else:
-            glBegin(GL_TRIANGLE_FAN)
-            glVertex(x, y)
-
-        for x in range(int(rad_end / increment)):
-            glVertex(math.sin(rad_start) * width + x, math.cos(rad_start) * width + y)
-            rad_start += increment
-
-        glVertex(math.sin(rad_end) * width + x, math.cos(end) * width + y)
-        glEnd()
+        vertices = np.empty((len(angles) + (0 if outline else 1), 2), dtype=np.float32)
+        rim = vertices if outline else vertices[1:]
+        rim[:, 0] = np.sin(angles) * width + x
+        rim[:, 1] = np.cos(angles) * width + y
+        if not outline:
+            vertices[0] = (x, y)
+        return vertices
 
     @classmethod
     def triangleGlyph(cls, outline):
@@ -204,11 +301,7 @@ class GlyphNamespace(object):
             glEnd();
         }
         """
-        glBegin(GL_LINE_LOOP if outline else GL_TRIANGLES)
-        glVertex(-0.5, 0)
-        glVertex(0.5, -0.5)
-        glVertex(0.5, 0.5)
-        glEnd()
+        cls._shape(GL_LINE_LOOP if outline else GL_TRIANGLES, ((-0.5, 0), (0.5, -0.5), (0.5, 0.5)))
 
     @classmethod
     def circleGlyph(cls, outline):
@@ -233,12 +326,7 @@ class GlyphNamespace(object):
             glEnd();
         }
         """
-        glBegin(GL_LINE_LOOP if outline else GL_QUADS)
-        glVertex(-0.5, -0.5)
-        glVertex(0.5, -0.5)
-        glVertex(0.5, 0.5)
-        glVertex(-0.5, 0.5)
-        glEnd()
+        cls._shape(GL_LINE_LOOP if outline else GL_QUADS, ((-0.5, -0.5), (0.5, -0.5), (0.5, 0.5), (-0.5, 0.5)))
 
     @classmethod
     def pauseGlyph(cls, outline):
@@ -261,21 +349,14 @@ class GlyphNamespace(object):
             glPopAttrib();
         }
         """
-        glPushAttrib(GL_POLYGON_BIT)
+        left = ((-0.5, -0.5), (-0.1, -0.5), (-0.1, 0.5), (-0.5, 0.5))
+        right = ((0.1, -0.5), (0.5, -0.5), (0.5, 0.5), (0.1, 0.5))
         if outline:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-        glBegin(GL_QUADS)
-        glVertex(-0.5, -0.5)
-        glVertex(-0.1, -0.5)
-        glVertex(-0.1, 0.5)
-        glVertex(-0.5, 0.5)
-
-        glVertex(0.1, -0.5)
-        glVertex(0.5, -0.5)
-        glVertex(0.5, 0.5)
-        glVertex(0.1, 0.5)
-        glEnd()
-        glPopAttrib()
+            #  Same edges glPolygonMode(GL_LINE) would draw for the two quads.
+            cls._shape(GL_LINE_LOOP, left)
+            cls._shape(GL_LINE_LOOP, right)
+        else:
+            cls._shape(GL_QUADS, left + right)
 
     @classmethod
     def advanceGlyph(cls, outline):
@@ -296,18 +377,8 @@ class GlyphNamespace(object):
             glEnd();
         }
         """
-        glBegin(GL_LINE_LOOP if outline else GL_TRIANGLES)
-        glVertex(-0.5, 0)
-        glVertex(0.2, -0.5)
-        glVertex(0.2, 0.5)
-        glEnd()
-
-        glBegin(GL_LINE_LOOP if outline else GL_QUADS)
-        glVertex(0.3, -0.5)
-        glVertex(0.5, -0.5)
-        glVertex(0.5, 0.5)
-        glVertex(0.3, 0.5)
-        glEnd()
+        cls._shape(GL_LINE_LOOP if outline else GL_TRIANGLES, ((-0.5, 0), (0.2, -0.5), (0.2, 0.5)))
+        cls._shape(GL_LINE_LOOP if outline else GL_QUADS, ((0.3, -0.5), (0.5, -0.5), (0.5, 0.5), (0.3, 0.5)))
 
     @classmethod
     def rgbGlyph(cls, outline):
@@ -319,11 +390,11 @@ class GlyphNamespace(object):
             glColor(0,0,1,1); drawCircleFan(0, 0, 0.5, 0.66, 1.0, .3, outline);
         }
         """
-        glColor(1, 0, 0, 1)
+        cls._color((1, 0, 0, 1))
         cls.drawCircleFan(0, 0, 0.5, 0.0, 0.33, .3, outline)
-        glColor(0, 1, 0, 1)
+        cls._color((0, 1, 0, 1))
         cls.drawCircleFan(0, 0, 0.5, 0.33, 0.66, .3, outline)
-        glColor(0, 0, 1, 1)
+        cls._color((0, 0, 1, 1))
         cls.drawCircleFan(0, 0, 0.5, 0.66, 1.0, .3, outline)
 
     @classmethod
@@ -360,7 +431,7 @@ class GlyphNamespace(object):
         while current_value >= start:
             var = 1.0 - (current_value / check)
             scalar = cube_root(var)
-            glColor(Color(.2, 1, 1, 1) * scalar)
+            cls._color(Color(.2, 1, 1, 1) * scalar)
             cls.drawCircleFan(0, 0, current_value, 0.0, 1.0, .1, True)
             current_value *= 0.9
 
@@ -376,11 +447,10 @@ class GlyphNamespace(object):
             glPopMatrix();
         }
         """
-        glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-        glScale(0.2333, 0.2333, 0.2333)
+        cls._pushMatrix()
+        cls._scale(0.2333)
         cls.circleGlyph(outline)
-        glPopMatrix()
+        cls._popMatrix()
 
     @classmethod
     def tformTriangle(cls, angle, outline):
@@ -396,13 +466,12 @@ class GlyphNamespace(object):
             glPopMatrix();
         }
         """
-        glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-        glRotate(angle, 0, 0, 1)
-        glScale(0.25, 0.25, 0.25)
-        glTranslate(-1.3, 0.0, 0.0)
+        cls._pushMatrix()
+        cls._rotate(angle)
+        cls._scale(0.25)
+        cls._translate(-1.3, 0.0)
         cls.triangleGlyph(outline)
-        glPopMatrix()
+        cls._popMatrix()
 
     @classmethod
     def translateIconGlyph(cls, outline):
@@ -492,19 +561,23 @@ class GlyphNamespace(object):
             f(array, n, array.size() / 2, 0, array.size());
         }
         """
-        def get_bounds(arr, num, middle_index, previous_index, end_index):
-            if len(arr) >= middle_index and arr[middle_index] <= num:
-                if middle_index+1 == len(arr) or arr[middle_index+1] > num:
-                    return middle_index
-                else:
-                    return get_bounds(arr, num, (middle_index + end_index) / 2, middle_index, end_index)
-
-            if middle_index == 0:
-                return -1
+        #  Index of the last element <= n, or -1 when there is none.
+        low, high = 0, len(array)
+        while low < high:
+            middle = (low + high) // 2
+            if n < array[middle]:
+                high = middle
             else:
-                return get_bounds(arr, num, (middle_index + previous_index) / 2, previous_index, middle_index)
+                low = middle + 1
+        return low - 1
 
-        return get_bounds(array, n, len(array) / 2, 0, len(array))
+    @classmethod
+    def lower_bounds_many(cls, array, values):
+        """
+        lower_bounds() of every element of values against the sorted array,
+        as an int array, in one NumPy call.
+        """
+        return np.searchsorted(np.asarray(array), np.asarray(values), side="right") - 1
 
     @classmethod
     def drawTextWithCartouche(cls, x, y, text, size, text_color, bg_color, glyph=None, glyph_color=None):
@@ -585,8 +658,9 @@ class GlyphNamespace(object):
 
         bounds = gltext.bounds(text)
         width = bounds[2] + bounds[0]
-        ascender_height = gltext.ascenderHeight()
-        decender_depth = gltext.descenderDepth()
+        metrics = gltext.metrics()
+        ascender_height = metrics.ascender
+        decender_depth = metrics.descender
         margin = (ascender_height - decender_depth) * 0.5
         x0 = x - margin
         x1 = x + width + margin
@@ -595,42 +669,29 @@ class GlyphNamespace(object):
         rad = (y1 - y0) * 0.5
         y_middle = (y1 + y0) * 0.5
 
-        glColor(bg_color)
-        glBegin(GL_POLYGON)
-        glVertex(x0, y0)
-        glVertex(x1, y0)
-        glVertex(x1, y1)
-        glVertex(x0, y1)
-        glEnd()
-
-        cls.drawCircleFan(x0, y_middle, rad, 0.5, 1.0, .3)
-        cls.drawCircleFan(x1, y_middle, rad, 0.0, 0.5, .3)
-
-        glColor(bg_color * 0.8)
-        glPushAttrib(GL_ENABLE_BIT)
-        glEnable(GL_LINE_SMOOTH)
-        glEnable(GL_BLEND)
-        # glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glLineWidth(1.0)
-        cls.drawCircleFan(x0, y_middle, rad, 0.5, 1.0, .3, True)
-        cls.drawCircleFan(x1, y_middle, rad, 0.0, 0.5, .3, True)
-        glBegin(GL_LINES)
-        glVertex(x0, y0)
-        glVertex(x1, y0)
-        glVertex(x1, y1)
-        glVertex(x0, y1)
-        glEnd()
+        with cls.batching() as batch:
+            batch.setState()
+            batch.setColor(bg_color)
+            batch.shape(GL_POLYGON, ((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
+            batch.shape(GL_TRIANGLE_FAN, cls.circleFanVertices(x0, y_middle, rad, 0.5, 1.0, .3))
+            batch.shape(GL_TRIANGLE_FAN, cls.circleFanVertices(x1, y_middle, rad, 0.0, 0.5, .3))
+
+            batch.setState(enable=(GL_LINE_SMOOTH, GL_BLEND), lineWidth=1.0)
+            batch.setColor(bg_color * 0.8)
+            batch.shape(GL_LINE_STRIP, cls.circleFanVertices(x0, y_middle, rad, 0.5, 1.0, .3, True))
+            batch.shape(GL_LINE_STRIP, cls.circleFanVertices(x1, y_middle, rad, 0.0, 0.5, .3, True))
+            batch.shape(GL_LINES, ((x0, y0), (x1, y0), (x1, y1), (x0, y1)))
+            batch.flush()
 
         if glyph is not None:
-            glColor(glyph_color)
+            cls.backend.pushState(enable=(GL_LINE_SMOOTH, GL_BLEND))
+            cls.backend.setColor(glyph_color)
             cls.draw(glyph, x, y_middle, 0, rad, False)
-            glEnable(GL_LINE_SMOOTH)
-            glColor(glyph_color * 0.8)
+            cls.backend.setColor(glyph_color * 0.8)
             cls.draw(glyph, x, y_middle, 0, rad, True)
-            
-        glPopAttrib()
-        gltext.color(text_color)
-        gltext.writeAt(x, y, text)
+            cls.backend.popState()
+
+        cls.backend.textMany([(x, y, text_color, text)])
 
         return BBox(x0 - rad, y0, x1 + rad, y1)
 
@@ -647,11 +708,7 @@ class GlyphNamespace(object):
             glLoadIdentity();
         }
         """
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluOrtho2D(0.0, w - 1, 0.0, h - 1)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
+        cls.backend.setupProjection(w, h)
 
     @classmethod
     def fitTextInBox(cls, text, width, height):
@@ -691,36 +748,15 @@ class GlyphNamespace(object):
         }
         
         """
-        def bound_math(size, upper, lower):
-            gltext.size(size)
-            bounds = gltext.bounds(text)
-            bwidth = bounds[0] + bounds[2]
-            bheight = bounds[1] + bounds[3]
-            if bwidth > width or bheight > height:
-                upper = size
-                size = (size + lower) / 2
-            else:
-                lower = size
-                size = (size + upper) / 2
-            return size, upper, lower, bwidth, bheight
-        
-        text_size = 64
-        last_upper_bound = 2048
-        last_lower_bound = 4
-        
         if not text:
             raise Exception("ERROR: fitTextInBox: empty string.")
-        
-        count = 0
-        result = bound_math(text_size, last_upper_bound, last_lower_bound)
-        text_size, last_upper_bound, last_lower_bound, bound_height, bound_width = result
 
-        while bound_width > width or bound_height > height or (last_upper_bound - last_lower_bound > 1):
-            result = bound_math(text_size, last_upper_bound, last_lower_bound)
-            text_size, last_upper_bound, last_lower_bound, bound_height, bound_width = result
-            count += 1
+        def measure(size):
+            gltext.size(size)
+            bounds = gltext.bounds(text)
+            return bounds[0] + bounds[2], bounds[1] + bounds[3]
 
-        return text_size - 2
+        return cls._fitSize(("text", gltext.currentFont(), text, width, height), measure, width, height)
 
     @classmethod
     def fitNameValuePairsInBox(cls, pairs, margin, width, height):
@@ -760,38 +796,74 @@ class GlyphNamespace(object):
         }
         
         """
-        def pair_bounds(size, title_names, prev_lower_bound, prev_upper_bound, w, h):
+        if not len(pairs):
+            raise Exception("ERROR: fitNameValuePairsInBox: empty pairs.")
+
+        def measure(size):
             gltext.size(size)
-            _pair_bound = cls.nameValuePairBounds(title_names, margin)
-            if _pair_bound:
-                box = _pair_bound[0]
+            tbox = cls.nameValuePairBounds(pairs, margin)[0]
+            return tbox.x, tbox.y
+
+        key = ("pairs", gltext.currentFont(), tuple(tuple(pair) for pair in pairs), margin, width, height)
+        return cls._fitSize(key, measure, width, height)
+
+    @classmethod
+    def _fitSize(cls, key, measure, width, height):
+        """
+        Solve for the largest text size whose measure(size) fits in width x height.
+        Text extents scale close to linearly with size, so one measurement at fitReferenceSize predicts the
+        answer, and a line through that and the latest measurement corrects it for margins and hinting. Every guess
+        stays between the largest size known to fit and the smallest known not to, and a guess at or under the
+        largest fitting size is checked one size up, so the search ends only when the two are adjacent; after
+        fitMaxProbes predictions it bisects. Results are memoized by key. Like the Mu binary search this replaces,
+        the result is two points under the fitting size.
+        """
+        cls.fitStats["calls"] += 1
+        size = cls._fitCache.get(key)
+        if size is not None:
+            cls.fitStats["hits"] += 1
+            return size
+
+        samples = []
+        best = None
+        fail = cls.fitMaxSize + 1
+
+        def predict():
+            #  A line through the reference and latest sample when they are far
+            #  enough apart to be meaningful, otherwise proportional scaling.
+            size, box_width, box_height = samples[-1]
+            size0, width0, height0 = samples[0]
+            if abs(size - size0) < cls.fitMinSize:
+                size0, width0, height0 = 0, 0.0, 0.0
+            limits = []
+            for limit, extent, extent0 in ((width, box_width, width0), (height, box_height, height0)):
+                slope = (extent - extent0) / float(size - size0)
+                if slope > 0:
+                    limits.append(size + (limit - extent) / slope)
+            return int(math.floor(min(limits))) if limits else cls.fitMaxSize
+
+        size = cls.fitReferenceSize
+        while True:
+            cls.fitStats["probes"] += 1
+            box_width, box_height = measure(size)
+            samples.append((size, box_width, box_height))
+            if box_width <= width and box_height <= height:
+                best = size
             else:
-                raise Exception("ERROR: fintNameValuePairsInBox: nameValuePairBounds empty.")
-            
-            if box.x > w or box.y > h:
-                prev_upper_bound = size
-                size = (size + prev_lower_bound) / 2
+                fail = size
+
+            lowest = cls.fitMinSize if best is None else best + 1
+            if lowest >= fail:
+                break
+            if len(samples) < cls.fitMaxProbes:
+                size = min(fail - 1, max(lowest, predict()))
             else:
-                prev_lower_bound = size
-                size = (size + prev_upper_bound) / 2
-            
-            return size, prev_lower_bound, prev_upper_bound, box
-
-        text_size = 64
-        last_upper_bound = 2048
-        last_lower_bound = 4
-                
-        if not len(pairs):
-            raise Exception("ERROR: fitNameValuePairsInBox: empty pairs.")
-        
-        result = pair_bounds(text_size, pairs, last_lower_bound, last_upper_bound, width, height)
-        text_size, last_lower_bound, last_upper_bound, tbox = result
-        while tbox.x > width or tbox.y > height or (last_upper_bound - last_lower_bound > 1):
+                size = (lowest + fail) // 2
 
-            result = pair_bounds(text_size, pairs, last_lower_bound, last_upper_bound, width, height)
-            text_size, last_lower_bound, last_upper_bound, tbox = result
-        
-        return text_size - 2
+        if len(cls._fitCache) >= cls.fitCacheCapacity:
+            cls._fitCache.clear()
+        size = cls._fitCache[key] = (cls.fitMinSize if best is None else best) - 2
+        return size
 
     @classmethod
     def drawRoundedBox(cls, x0, y0, x1, y1, margin, bg, fg):
@@ -855,56 +927,34 @@ class GlyphNamespace(object):
             glPopAttrib();
         }
         """
-        glColor(bg)
-        glBegin(GL_QUADS)
-        glVertex(x0, y0)
-        glVertex(x1, y0)
-        glVertex(x1, y1)
-        glVertex(x0, y1)
-
-        glVertex(x0 - margin, y0 + margin)
-        glVertex(x0, y0 + margin)
-        glVertex(x0, y1 - margin)
-        glVertex(x0 - margin, y1 - margin)
-
-        glVertex(x1, y0 + margin)
-        glVertex(x1 + margin, y0 + margin)
-        glVertex(x1 + margin, y1 - margin)
-        glVertex(x1, y1 - margin)
-        glEnd()
-
-        cls.drawCircleFan(x0, y0 + margin, margin, 0.5, 0.75, .3)
-        cls.drawCircleFan(x1, y0 + margin, margin, 0.25, 0.5, .3)
-        cls.drawCircleFan(x1, y1 - margin, margin, 0.0, 0.25, .3)
-        cls.drawCircleFan(x0, y1 - margin, margin, 0.75, 1.0, .3)
-
-        glPushAttrib(GL_ENABLE_BIT)
-
-        glColor(fg)
-        glEnable(GL_LINE_SMOOTH)
-        glEnable(GL_POLYGON_SMOOTH)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glHint(GL_LINE_SMOOTH_HINT, GL_NICEST)
-        glEnable(GL_BLEND)
-        glLineWidth(3.0)
-
-        cls.drawCircleFan(x0, y0 + margin, margin, 0.5, 0.75, .3, True)
-        cls.drawCircleFan(x1, y0 + margin, margin, 0.25, 0.5, .3, True)
-        cls.drawCircleFan(x1, y1 - margin, margin, 0.0, 0.25, .3, True)
-        cls.drawCircleFan(x0, y1 - margin, margin, 0.75, 1.0, .3, True)
-
-        glBegin(GL_LINES)
-        glVertex(x0, y0)
-        glVertex(x1, y0)
-        glVertex(x1, y1)
-        glVertex(x0, y1)
-        glVertex(x0 - margin, y0 + margin)
-        glVertex(x0 - margin, y1 - margin)
-        glVertex(x1 + margin, y0 + margin)
-        glVertex(x1 + margin, y1 - margin)
-        glEnd()
-        glLineWidth(1.0)
-        glPopAttrib()
+        corners = (
+            (x0, y0 + margin, 0.5, 0.75),
+            (x1, y0 + margin, 0.25, 0.5),
+            (x1, y1 - margin, 0.0, 0.25),
+            (x0, y1 - margin, 0.75, 1.0),
+        )
+
+        with cls.batching() as batch:
+            batch.setState()
+            batch.setColor(bg)
+            batch.shape(GL_QUADS, (
+                (x0, y0), (x1, y0), (x1, y1), (x0, y1),
+                (x0 - margin, y0 + margin), (x0, y0 + margin), (x0, y1 - margin), (x0 - margin, y1 - margin),
+                (x1, y0 + margin), (x1 + margin, y0 + margin), (x1 + margin, y1 - margin), (x1, y1 - margin),
+            ))
+            for cx, cy, start, end in corners:
+                batch.shape(GL_TRIANGLE_FAN, cls.circleFanVertices(cx, cy, margin, start, end, .3))
+
+            batch.setState(enable=(GL_LINE_SMOOTH, GL_POLYGON_SMOOTH, GL_BLEND), lineWidth=3.0)
+            batch.setColor(fg)
+            for cx, cy, start, end in corners:
+                batch.shape(GL_LINE_STRIP, cls.circleFanVertices(cx, cy, margin, start, end, .3, True))
+            batch.shape(GL_LINES, (
+                (x0, y0), (x1, y0),
+                (x1, y1), (x0, y1),
+                (x0 - margin, y0 + margin), (x0 - margin, y1 - margin),
+                (x1 + margin, y0 + margin), (x1 + margin, y1 - margin),
+            ))
 
     @classmethod
     def drawDropRegions(cls, w, h, x, y, margin, descriptors):
@@ -950,34 +1000,42 @@ class GlyphNamespace(object):
         }
         """
 
+        from rv import commands
         current_margins = commands.margins()
         base_size = (h - current_margins[2] - current_margins[3]) / len(descriptors)
         inregion = -1
 
-        for index, descriptor in enumerate(descriptors):
-            gltext.size(20)
-
-            y0 = base_size * index + margin + current_margins[3]
-            x0 = current_margins[0] + margin
-            y1 = base_size * (index + 1) - margin + current_margins[3]
-            x1 = w - margin - current_margins[1]
-
-            bounds = gltext.bounds(descriptor)
-            total_width = bounds[2] + bounds[0]
-            active = y0 <= y <= y1
-            fg = Color(1, 1, 1, 1) if active else Color(0.5, 0.5, 0.5, 1)
-            bg = Color(0, 0, 0, 0.85)
-
-            cls.drawRoundedBox(x0, y0, x1, y1, 10, bg, fg)
-            if active:
-                inregion = index
-
-            gltext.color(fg)
-
-            write_x = (x1 - x0 - total_width) * 0.5 + x0
-            write_y = lerp(y0, y1, 0.5)
-
-            gltext.writeAt(write_x, write_y, descriptor)
+        gltext.size(20)
+        bounds = gltext.boundsMany(descriptors)[0]
+        total_widths = (bounds[:, 2] + bounds[:, 0]).tolist()
+
+        active_fg = Color(1, 1, 1, 1)
+        inactive_fg = Color(0.5, 0.5, 0.5, 1)
+        bg = Color(0, 0, 0, 0.85)
+
+        #  The regions do not overlap, so every box is drawn in one batch and
+        #  every label written in one gltext call afterwards.
+        records = []
+        with cls.batching():
+            for index, descriptor in enumerate(descriptors):
+                y0 = base_size * index + margin + current_margins[3]
+                x0 = current_margins[0] + margin
+                y1 = base_size * (index + 1) - margin + current_margins[3]
+                x1 = w - margin - current_margins[1]
+
+                total_width = total_widths[index]
+                active = y0 <= y <= y1
+                fg = active_fg if active else inactive_fg
+
+                cls.drawRoundedBox(x0, y0, x1, y1, 10, bg, fg)
+                if active:
+                    inregion = index
+
+                write_x = (x1 - x0 - total_width) * 0.5 + x0
+                write_y = lerp(y0, y1, 0.5)
+                records.append((write_x, write_y, fg, descriptor))
+
+        cls.backend.textMany(records)
         return inregion
 
     @classmethod
@@ -1019,32 +1077,24 @@ class GlyphNamespace(object):
         }
 
         """
-        name_width = 0
-        value_width = 0
-        height = 0
-        ascender_height = gltext.ascenderHeight()
-        descender_depth = gltext.descenderDepth()
+        count = len(pairs)
+        bounds, ascender_height, descender_depth = gltext.boundsMany(
+            [pair[0] for pair in pairs] + [pair[1] for pair in pairs]
+        )
         text_height = ascender_height - descender_depth
         x0 = - descender_depth
         x1 = x0
         y0 = -margin
         y1 = margin
-        name_bounds = []
-        value_bounds = []
+        name_bounds = bounds[:count]
+        value_bounds = bounds[count:]
 
-        for pair in pairs:
-            name, value = pair
-            bounds_name = gltext.bounds(name)
-            bounds_value = gltext.bounds(value)
-
-            name_bounds.append(bounds_name)
-            value_bounds.append(bounds_value)
-            name_width = max([name_width, bounds_name[2] + bounds_name[0]])
-            value_width = max([value_width, bounds_value[2] + bounds_value[0]])
-            height += text_height
+        widths = bounds[:, 2] + bounds[:, 0]
+        name_width = float(widths[:count].max(initial=0))
+        value_width = float(widths[count:].max(initial=0))
 
         x1 += (name_width + value_width)
-        y1 += height
+        y1 += text_height * count
 
         return TBox(x1-x0, y1-y0), name_bounds, value_bounds, name_width
 
@@ -1176,12 +1226,30 @@ class GlyphNamespace(object):
 
         """
 
-        margin_copy = margin
-        tbox, name_bounds, value_bounds, name_width = cls.nameValuePairBounds(pairs, margin_copy)
+        tbox, name_bounds, value_bounds, name_width = cls.nameValuePairBounds(pairs, margin)
+        return cls._drawNameValueLayout(
+            pairs, tbox, name_bounds, value_bounds, name_width, gltext.metrics(),
+            fg, bg, x, y, margin, maxw, maxh, minw, minh, no_box
+        )
 
-        ascender_height = gltext.ascenderHeight()
-        descender_depth = gltext.descenderDepth()
-        text_height = ascender_height - descender_depth
+    @classmethod
+    def _drawNameValueLayout(cls, pairs, tbox, name_bounds, value_bounds, name_width, metrics,
+                             fg, bg, x, y, margin, maxw, maxh, minw, minh, no_box):
+        draw_list = cls.nameValueDrawList(
+            pairs, tbox, name_bounds, name_width, metrics.descender, metrics.height,
+            fg, bg, x, y, margin, maxw, maxh, minw, minh, no_box
+        )
+        draw_list.draw()
+        return TBox(*draw_list.size), name_bounds, value_bounds, name_width
+
+    @classmethod
+    def nameValueDrawList(cls, pairs, tbox, name_bounds, name_width, descender_depth, text_height,
+                          fg, bg, x, y, margin, maxw=0, maxh=0, minw=0, minh=0, no_box=False, text_size=None):
+        """
+        The drawNameValuePairs() geometry of already measured pairs, as a
+        DrawList. Does not touch GL or gltext, so it may run on any thread.
+        """
+        margin_copy = margin
 
         x0 = x - descender_depth
         y0 = y - margin_copy
@@ -1200,35 +1268,177 @@ class GlyphNamespace(object):
         if 0 < maxh < y_size:
             y1 = y0 + maxh
 
-        tbox.x = x1 - x0
-        tbox.y = y1 - y0
-
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-
-        if not no_box:
-            cls.drawRoundedBox(x0, y0, x1, y1, margin_copy, bg, fg * Color(0.5, 0.5, 0.5, 0.5))
-        glColor(fg * Color(1, 1, 1, 0.25))
-        glBegin(GL_LINES)
-        glVertex(x + name_width + margin_copy / 4, y0 + margin_copy / 2)
-        glVertex(x + name_width + margin_copy / 4, y1 + margin_copy / 2)
-        glEnd()
+        boxes = () if no_box else ((x0, y0, x1, y1, margin_copy, bg, fg * Color(0.5, 0.5, 0.5, 0.5)),)
+        lines = ((fg * Color(1, 1, 1, 0.25), (
+            (x + name_width + margin_copy / 4, y0 + margin_copy / 2),
+            (x + name_width + margin_copy / 4, y1 - margin_copy / 2),
+        )),)
+
+        #  Rows do not overlap, so all names are written before all values,
+        #  which sets each color once, in a single gltext call.
+        name_color = fg - Color(0, 0, 0, 0.25)
+        name_extents = np.asarray(name_bounds, dtype=np.float32).reshape(-1, 4)
+        name_xs = (x + name_width - (name_extents[:, 2] + name_extents[:, 0])).tolist()
+        value_x = x + name_width + margin_copy/2
+        ys = [y + index * text_height for index in range(len(pairs))]
+        records = [(name_x, row_y, name_color, name) for name_x, row_y, (name, _) in zip(name_xs, ys, pairs)]
+        records.extend((value_x, row_y, fg, value) for row_y, (_, value) in zip(ys, pairs))
+
+        return cls.DrawList(text_size, boxes, lines, records, (x1 - x0, y1 - y0))
+
+    class DrawList(object):
+        """
+        Immutable, fully laid out drawing: rounded boxes (drawRoundedBox
+        arguments), line segments as (color, vertices) and (x, y, color, text)
+        records, written at text_size when it is not None. size is the
+        (width, height) of the laid out box.
+        """
+        __slots__ = ("textSize", "boxes", "lines", "texts", "size")
 
-        for index, pair in enumerate(pairs):
-            name, value = pair
-            bounds_name = name_bounds[index]
-            text_width = bounds_name[2] + bounds_name[0]
+        def __init__(self, textSize=None, boxes=(), lines=(), texts=(), size=(0, 0)):
+            for name, value in zip(self.__slots__, (textSize, tuple(boxes), tuple(lines), tuple(texts), tuple(size))):
+                object.__setattr__(self, name, value)
 
-            gltext.color(fg - Color(0, 0, 0, 0.25))
-            gltext.writeAt(x + (name_width - text_width), y, name)
-            gltext.color(fg)
-            gltext.write(x + name_width + margin_copy/2, y, value)
-            y += text_height
-            # if (index == s - 3):
-            #     y += margin_copy/2
+        def __setattr__(self, name, value):
+            raise AttributeError("DrawList is immutable")
 
-        glDisable(GL_BLEND)
-        return tbox, name_bounds, value_bounds, name_width
+        def draw(self):
+            """
+            Draw through GlyphNamespace; render thread only.
+            """
+            backend = GlyphNamespace.backend
+            backend.enable(GL_BLEND)
+            with GlyphNamespace.batching() as batch:
+                for box in self.boxes:
+                    GlyphNamespace.drawRoundedBox(*box)
+                batch.setState()
+                for color, vertices in self.lines:
+                    batch.setColor(color)
+                    batch.shape(GL_LINES, vertices)
+                batch.flush()
+            if self.texts:
+                if self.textSize is not None:
+                    gltext.size(self.textSize)
+                backend.textMany(self.texts)
+            backend.disable(GL_BLEND)
+
+    class NameValuePanel(object):
+        """
+        Retained drawNameValuePairs(). Rows are only measured when their text
+        changes and the column widths are maintained incrementally, so redrawing
+        a panel where only a value or two changes between frames (frame number,
+        timecode) does not lay out the whole panel again.
+        """
+        def __init__(self, pairs=()):
+            super(GlyphNamespace.NameValuePanel, self).__init__()
+            #  Each row is [name, value, name bounds, value bounds]; bounds of
+            #  None mean the text has not been measured at the current size.
+            self._rows = []
+            self._metrics = None
+            self._nameWidth = 0.0
+            self._valueWidth = 0.0
+            self._rescan = False
+            self.setPairs(pairs)
+
+        def __len__(self):
+            return len(self._rows)
+
+        def pairs(self):
+            return [(row[0], row[1]) for row in self._rows]
+
+        def setPairs(self, pairs):
+            """
+            Replace the rows, keeping the measurements of unchanged text.
+            """
+            rows = []
+            for index, (name, value) in enumerate(pairs):
+                old = self._rows[index] if index < len(self._rows) else None
+                row = [name, value, None, None]
+                if old is not None:
+                    row[2] = old[2] if old[0] == name else None
+                    row[3] = old[3] if old[1] == value else None
+                rows.append(row)
+            self._rows = rows
+            self._rescan = True
+
+        def updateValue(self, key, value):
+            """
+            Set the value of the row at index key, or of the first row named key.
+            """
+            row = self._row(key)
+            if row[1] != value:
+                row[1] = value
+                self._setBounds(row, 3, None)
+
+        def updateName(self, key, name):
+            row = self._row(key)
+            if row[0] != name:
+                row[0] = name
+                self._setBounds(row, 2, None)
+
+        def _row(self, key):
+            if isinstance(key, int):
+                return self._rows[key]
+            for row in self._rows:
+                if row[0] == key:
+                    return row
+            raise KeyError(key)
+
+        def _setBounds(self, row, column, bounds):
+            old = row[column]
+            row[column] = bounds
+            width = None if bounds is None else bounds[2] + bounds[0]
+            old_width = None if old is None else old[2] + old[0]
+            attr = "_nameWidth" if column == 2 else "_valueWidth"
+            current = getattr(self, attr)
+            if width is not None and width >= current:
+                setattr(self, attr, width)
+            elif old_width is not None and old_width >= current:
+                #  The widest cell shrank; the column has to be rescanned.
+                self._rescan = True
+
+        def _refresh(self):
+            metrics = gltext.metrics()
+            if metrics is not self._metrics:
+                self._metrics = metrics
+                for row in self._rows:
+                    row[2] = row[3] = None
+                self._nameWidth = self._valueWidth = 0.0
+
+            dirty = [(row, column) for row in self._rows for column in (2, 3) if row[column] is None]
+            if dirty:
+                bounds = metrics.boundsMany([row[column - 2] for row, column in dirty])
+                for (row, column), measured in zip(dirty, bounds.tolist()):
+                    self._setBounds(row, column, tuple(measured))
+
+            if self._rescan:
+                self._rescan = False
+                self._nameWidth = max([row[2][2] + row[2][0] for row in self._rows] or [0.0])
+                self._valueWidth = max([row[3][2] + row[3][0] for row in self._rows] or [0.0])
+
+        def bounds(self, margin):
+            """
+            Same result as nameValuePairBounds(self.pairs(), margin) at the
+            current text size.
+            """
+            self._refresh()
+            tbox = TBox(self._nameWidth + self._valueWidth, len(self._rows) * self._metrics.height + margin * 2)
+            return (
+                tbox,
+                [row[2] for row in self._rows],
+                [row[3] for row in self._rows],
+                self._nameWidth,
+            )
+
+        def draw(self, fg, bg, x, y, margin, maxw=0, maxh=0, minw=0, minh=0, no_box=False):
+            """
+            Same as drawNameValuePairs(self.pairs(), ...).
+            """
+            tbox, name_bounds, value_bounds, name_width = self.bounds(margin)
+            return GlyphNamespace._drawNameValueLayout(
+                self.pairs(), tbox, name_bounds, value_bounds, name_width, self._metrics,
+                fg, bg, x, y, margin, maxw, maxh, minw, minh, no_box
+            )
 
     @classmethod
     def drawCloseButton(cls, x, y, radius, bg, fg):
@@ -1258,21 +1468,18 @@ class GlyphNamespace(object):
 
         half_radius = radius / 2
 
-        glEnable(GL_BLEND)
-        glEnable(GL_LINE_SMOOTH)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glLineWidth(2.0)
-        glColor(bg)
-        cls.drawCircleFan(x, y, radius, 0, 1, .3)
-        glColor(fg)
-        cls.drawCircleFan(x, y, radius, 0, 1, .3, True)
-
-        glBegin(GL_LINES)
-        glVertex(x - half_radius, y - half_radius)
-        glVertex(x + half_radius, y + half_radius)
-        glVertex(x - half_radius, y + half_radius)
-        glVertex(x + half_radius, y - half_radius)
-        glEnd()
+        with cls.batching() as batch:
+            batch.setState(enable=(GL_BLEND, GL_LINE_SMOOTH), lineWidth=2.0)
+            batch.setColor(bg)
+            batch.shape(GL_TRIANGLE_FAN, cls.circleFanVertices(x, y, radius, 0, 1, .3))
+            batch.setColor(fg)
+            batch.shape(GL_LINE_STRIP, cls.circleFanVertices(x, y, radius, 0, 1, .3, True))
+            batch.shape(GL_LINES, (
+                (x - half_radius, y - half_radius),
+                (x + half_radius, y + half_radius),
+                (x - half_radius, y + half_radius),
+                (x + half_radius, y - half_radius),
+            ))
 
     @classmethod
     def draw(cls, glyph, x, y, angle, size, outline):
@@ -1289,12 +1496,242 @@ class GlyphNamespace(object):
             glPopMatrix();
         }
         """
-        glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-        glLoadIdentity()
-        glTranslate(x, y, 0)
-        glRotate(angle, 0, 0, 1)
-        glScale(size, size, size)
-        glyph(outline)
-        glPopMatrix()
-        pass
+        backend = cls.backend
+        cls.flushBatch()
+        if cls.useGlyphCache and isinstance(glyph, cls.AbstractGlyph):
+            program = glyph.program(outline)
+            if program is not None:
+                #  Transforms are already applied to the program's vertices;
+                #  only the identity load of the Mu version is kept.
+                color = backend.currentColor() if program.inherits else None
+                backend.pushMatrix()
+                backend.loadIdentity()
+                program.draw(backend, x, y, angle, size, color)
+                backend.popMatrix()
+                return
+
+        backend.pushMatrix()
+        backend.loadIdentity()
+        backend.translate(x, y)
+        backend.rotate(angle)
+        backend.scale(size)
+        with cls._unbatched():
+            key = cls._glyphCacheKey(glyph, outline) if cls.useGlyphCache else None
+            if key is None or not backend.drawCachedGlyph(key, lambda: glyph(outline)):
+                glyph(outline)
+        backend.popMatrix()
+
+    @classmethod
+    def drawMany(cls, glyph, xs, ys, angles, sizes, colors=None, outline=False):
+        """
+        draw() glyph at every (x, y, angle, size), each given as an array or a
+        scalar for all instances. colors is one color, one per instance or
+        None for the current color, and only applies to the parts of glyph
+        that do not set their own. The glyph's program is transformed for
+        all instances at once and submitted as one draw per run.
+        """
+        backend = cls.backend
+        cls.flushBatch()
+        program = cls.glyphProgram(glyph, outline)
+        if program is None:
+            xs, ys, angles, sizes = np.broadcast_arrays(xs, ys, angles, sizes)
+            xs, ys, angles, sizes = [a.ravel().tolist() for a in (xs, ys, angles, sizes)]
+            colors = None if colors is None else instanceColors(colors, len(xs))
+            for i in range(len(xs)):
+                if colors is not None:
+                    backend.setColor(tuple(colors[i].tolist()))
+                cls.draw(glyph, xs[i], ys[i], angles[i], sizes[i], outline)
+            return
+
+        if colors is None and program.inherits:
+            colors = backend.currentColor()
+        backend.pushMatrix()
+        backend.loadIdentity()
+        program.drawMany(backend, xs, ys, angles, sizes, colors)
+        backend.popMatrix()
+
+    @classmethod
+    def glyphProgram(cls, glyph, outline):
+        """
+        The GlyphProgram of glyph(outline), kept for composed glyphs and the
+        unit glyphs of this class while useGlyphCache is set. None if glyph
+        cannot be flattened.
+        """
+        if isinstance(glyph, cls.AbstractGlyph):
+            return glyph.program(outline) if cls.useGlyphCache else cls.compileGlyph(glyph, outline)
+        key = cls._glyphCacheKey(glyph, outline)
+        if key is None or not cls.useGlyphCache:
+            return cls.compileGlyph(glyph, outline)
+        program = cls._unitPrograms.get(key)
+        if program is None:
+            program = cls._unitPrograms[key] = cls.compileGlyph(glyph, outline)
+        return program
+
+    @classmethod
+    def setBackend(cls, backend):
+        """
+        Draw through backend from now on. Pending batched geometry is drawn
+        through the previous one first.
+        """
+        cls.flushBatch()
+        cls.backend = backend
+        cls._batch = None
+
+    @classmethod
+    @contextlib.contextmanager
+    def batching(cls):
+        """
+        Collect the geometry of batch aware drawing functions called inside
+        this scope into the shared VertexBatch. Scopes nest; the batch is
+        drawn when the outermost one exits.
+        """
+        if cls._recorder is not None:
+            yield cls._recorder
+            return
+        if cls._batch is None:
+            cls._batch = VertexBatch(cls.backend.drawArrays)
+        cls._batchDepth += 1
+        try:
+            yield cls._batch
+        finally:
+            cls._batchDepth -= 1
+            if not cls._batchDepth:
+                cls._batch.flush()
+
+    @classmethod
+    def flushBatch(cls):
+        """
+        Draw any batched geometry now. Anything drawn outside the batch that
+        must appear on top of it (text, display lists) needs this first.
+        """
+        if cls._batch is not None:
+            cls._batch.flush()
+
+    @classmethod
+    def compileGlyph(cls, glyph, outline):
+        """
+        Run glyph(outline) once against a GlyphRecorder and return the
+        flattened GlyphProgram, or None when glyph contains something other
+        than composed glyphs and the unit glyphs of this class.
+        """
+        if not cls._recordable(glyph):
+            return None
+        recorder = GlyphRecorder()
+        previous, cls._recorder = cls._recorder, recorder
+        try:
+            glyph(outline)
+        finally:
+            cls._recorder = previous
+        return recorder.program()
+
+    @classmethod
+    def _recordable(cls, glyph):
+        if type(glyph) is cls.GlyphJoiner:
+            return all(cls._recordable(g) for g in glyph.glyphs)
+        if type(glyph) in (cls.XformedGlyph, cls.ColoredGlyph):
+            return cls._recordable(glyph.glyph)
+        return getattr(glyph, "__self__", None) is cls and glyph.__name__ in cls._cacheableGlyphs
+
+    @classmethod
+    def _target(cls):
+        return cls.backend if cls._recorder is None else cls._recorder
+
+    @classmethod
+    def _shape(cls, mode, vertices):
+        cls._target().shape(mode, vertices)
+
+    @classmethod
+    def _color(cls, color):
+        cls._target().setColor(color)
+
+    @classmethod
+    def _pushMatrix(cls):
+        cls._target().pushMatrix()
+
+    @classmethod
+    def _popMatrix(cls):
+        cls._target().popMatrix()
+
+    @classmethod
+    def _rotate(cls, angle):
+        cls._target().rotate(angle)
+
+    @classmethod
+    def _scale(cls, scale):
+        cls._target().scale(scale)
+
+    @classmethod
+    def _translate(cls, x, y):
+        cls._target().translate(x, y)
+
+    @classmethod
+    @contextlib.contextmanager
+    def _unbatched(cls):
+        batch, depth = cls._batch, cls._batchDepth
+        cls._batch, cls._batchDepth = None, 0
+        try:
+            yield
+        finally:
+            cls._batch, cls._batchDepth = batch, depth
+
+    @classmethod
+    def _glyphCacheKey(cls, glyph, outline):
+        if getattr(glyph, "__self__", None) is not cls:
+            return None
+        name = glyph.__name__
+        if name not in cls._cacheableGlyphs:
+            return None
+        return name, bool(outline)
+
+    @classmethod
+    def compiledGlyph(cls, glyph, outline):
+        """
+        Return the backend's compiled form of glyph(outline) (a display list
+        for GLBackend), compiling it on first use. Returns None for glyphs that
+        are not known to be static, which the caller should draw directly.
+        """
+        key = cls._glyphCacheKey(glyph, outline)
+        if key is None:
+            return None
+        with cls._unbatched():
+            return cls.backend.compiled(key, lambda: glyph(outline))
+
+    @classmethod
+    def invalidateGlyphCache(cls, glyph=None):
+        """
+        Drop compiled glyphs, either all of them or only those of glyph.
+        """
+        name = None if glyph is None else glyph.__name__
+        cls.backend.invalidateCache(name)
+        for key in list(cls._unitPrograms):
+            if name is None or key[0] == name:
+                del cls._unitPrograms[key]
+
+    @classmethod
+    def drawCachedLayer(cls, key, version, bounds, viewSize, draw):
+        """
+        Draw the bounds = (x, y, w, h) region of draw()'s output, in a view of
+        viewSize, from the backend's layer cached under key, running draw()
+        into it first when version changed. Returns False if the backend has
+        no layers; the caller then draws directly.
+        """
+        def render():
+            draw()
+            cls.flushBatch()
+
+        cls.flushBatch()
+        return cls.backend.drawCachedLayer(key, version, bounds, viewSize, render)
+
+    @classmethod
+    def invalidateLayer(cls, key):
+        cls.backend.invalidateLayer(key)
+
+    @classmethod
+    def releaseLayers(cls, key=None):
+        cls.backend.releaseLayers(key)
+
+    @classmethod
+    def setGlyphCacheEnabled(cls, enabled):
+        cls.useGlyphCache = bool(enabled)
+        if not cls.useGlyphCache:
+            cls.invalidateGlyphCache()
@@ -0,0 +1,195 @@
+"""
+Text layout off the render thread.
+
+Measuring, expanding, fitting and sizing overlays runs on a LayoutWorker
+thread pool against an AdvanceMetrics snapshot, never against gltext, whose
+calls go through Mu and belong to the render thread. Each layout produces an
+immutable GlyphNamespace.DrawList. The render callback only draws the most
+recent completed one and never waits for text measurement:
+
+    worker = LayoutWorker.shared()
+    worker.submit(widget, nameValuePairs, pairs, metrics, fg, bg, 20, 20, 8)
+    ...
+    draw_list = worker.latest(widget)
+    if draw_list is not None:
+        draw_list.draw()
+"""
+
+import logging
+import math
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .glyph import GlyphNamespace
+from .util import TBox
+
+log = logging.getLogger(__name__)
+
+
+class AdvanceMetrics(object):
+    """
+    Thread safe font metrics from a glText.AdvanceTable snapshot, scaled to
+    size. Answers the same questions as gltext.FontMetrics with the numbers
+    gltext's own advance tables give, so layouts made here line up with
+    those drawn directly. Characters the table does not know get its average
+    advance.
+    """
+    def __init__(self, table, size):
+        super(AdvanceMetrics, self).__init__()
+        self.table = table
+        self.size = size
+        self.ascender, self.descender = table.lineMetrics(size)
+        self.height = self.ascender - self.descender
+        known = table.advances[table.known]
+        self.advance = float(known.mean()) * size / table.referenceSize if len(known) else 0.0
+
+    @classmethod
+    def fromGltext(cls, size):
+        """
+        Snapshot the advance table of the current gltext font. Render thread
+        only, and a gltext size must have been set unless the table is already
+        cached.
+        """
+        import gltext
+        table = gltext.advanceTable()
+        if table is None:
+            raise ValueError("No advance table for the current font: set a gltext size first")
+        return cls(table, size)
+
+    def atSize(self, size):
+        return AdvanceMetrics(self.table, size)
+
+    def bounds(self, text):
+        value = self.table.bounds(text, self.size)
+        if value is None:
+            return (0.0, self.descender, self.advance * len(text), self.height)
+        return value
+
+    def boundsMany(self, strings):
+        result, ok = self.table.boundsMany(strings, self.size)
+        for index in np.flatnonzero(~ok):
+            result[index] = (0.0, self.descender, self.advance * len(strings[index]), self.height)
+        return result
+
+    def width(self, text):
+        left, _, width, _ = self.bounds(text)
+        return left + width
+
+    def fitSize(self, width, height, textWidth, rows=1):
+        """
+        The largest integer text size at which rows lines, the widest of them
+        textWidth wide at this size, fit in width x height.
+        """
+        per_size = max(textWidth, 1e-6) / self.size, max(self.height * rows, 1e-6) / self.size
+        return max(1, int(math.floor(min(width / per_size[0], height / per_size[1]))))
+
+
+def nameValuePairs(pairs, metrics, fg, bg, x, y, margin, maxw=0, maxh=0, minw=0, minh=0, no_box=False, expand=True):
+    """
+    drawNameValuePairs() laid out against metrics, as a DrawList.
+    """
+    if expand:
+        pairs = GlyphNamespace.expandNameValuePairs(pairs)
+    count = len(pairs)
+    bounds = metrics.boundsMany([pair[0] for pair in pairs] + [pair[1] for pair in pairs])
+    widths = bounds[:, 2] + bounds[:, 0]
+    name_width = float(widths[:count].max(initial=0))
+    value_width = float(widths[count:].max(initial=0))
+    tbox = TBox(name_width + value_width, metrics.height * count + margin * 2)
+    return GlyphNamespace.nameValueDrawList(
+        pairs, tbox, bounds[:count], name_width, metrics.descender, metrics.height,
+        fg, bg, x, y, margin, maxw, maxh, minw, minh, no_box, metrics.size
+    )
+
+
+def nameValuePairsInBox(pairs, metrics, fg, bg, x, y, margin, width, height, no_box=False):
+    """
+    nameValuePairs() at the largest text size that fits width x height.
+    """
+    pairs = GlyphNamespace.expandNameValuePairs(pairs)
+    bounds = metrics.boundsMany([pair[0] for pair in pairs] + [pair[1] for pair in pairs])
+    widths = bounds[:, 2] + bounds[:, 0]
+    count = len(pairs)
+    text_width = float(widths[:count].max(initial=0)) + float(widths[count:].max(initial=0))
+    size = metrics.fitSize(width - margin * 2, height - margin * 2, text_width, count)
+    return nameValuePairs(pairs, metrics.atSize(size), fg, bg, x, y, margin, no_box=no_box, expand=False)
+
+
+class LayoutWorker(object):
+    """
+    Thread pool computing layouts per key (typically a Widget). Only the most
+    recent submission of a key matters: older ones still queued are skipped
+    and results older than what has already completed are dropped.
+    """
+    _shared = None
+    _sharedLock = threading.Lock()
+
+    def __init__(self, threads=2):
+        super(LayoutWorker, self).__init__()
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="glyph-layout")
+        self._lock = threading.Lock()
+        #  Keyed weakly, so widgets which go away take their layouts with them.
+        self._submitted = weakref.WeakKeyDictionary()
+        self._completed = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def shared(cls):
+        with cls._sharedLock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def sharedIfStarted(cls):
+        """
+        The shared worker, or None when nothing has started it yet.
+        """
+        return cls._shared
+
+    def submit(self, key, function, *args, **kwargs):
+        """
+        Compute function(*args, **kwargs) for key in the background. Returns
+        the generation of this submission.
+        """
+        with self._lock:
+            generation = self._submitted[key] = self._submitted.get(key, 0) + 1
+        self._pool.submit(self._run, key, generation, function, args, kwargs)
+        return generation
+
+    def _run(self, key, generation, function, args, kwargs):
+        with self._lock:
+            if self._submitted.get(key) != generation:
+                return
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            log.exception("Layout of %r failed", key)
+            return
+        with self._lock:
+            completed = self._completed.get(key)
+            if key in self._submitted and (completed is None or completed[0] < generation):
+                self._completed[key] = (generation, result)
+
+    def latest(self, key):
+        """
+        The most recently completed layout of key, or None. Never blocks on
+        layout work.
+        """
+        completed = self._completed.get(key)
+        return None if completed is None else completed[1]
+
+    def pending(self, key):
+        with self._lock:
+            completed = self._completed.get(key)
+            return self._submitted.get(key, 0) > (0 if completed is None else completed[0])
+
+    def discard(self, key):
+        with self._lock:
+            self._submitted.pop(key, None)
+            self._completed.pop(key, None)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
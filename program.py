@@ -0,0 +1,172 @@
+"""
+Flattened glyph programs.
+
+While a glyph runs against a GlyphRecorder, its transforms are multiplied out
+on the CPU and every shape is stored already transformed. A whole tree of
+composed glyphs therefore becomes a GlyphProgram: a few runs of vertices and
+colors which can be drawn without touching the matrix stack.
+"""
+import math
+
+import numpy as np
+
+from .batch import VertexBatch, rgba
+
+#  Color of shapes recorded before any color was set. They take whatever the
+#  current color is when the program is drawn.
+INHERIT = (float("nan"),) * 4
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def multiply(m, n):
+    """
+    Compose two 2D affine matrices (a, b, c, d, tx, ty), applying n first.
+    """
+    a, b, c, d, tx, ty = m
+    a2, b2, c2, d2, tx2, ty2 = n
+    return (
+        a * a2 + c * b2,
+        b * a2 + d * b2,
+        a * c2 + c * d2,
+        b * c2 + d * d2,
+        a * tx2 + c * ty2 + tx,
+        b * tx2 + d * ty2 + ty,
+    )
+
+
+def xform(x, y, angle, size):
+    """
+    The matrix of glTranslate(x, y), glRotate(angle) then glScale(size).
+    """
+    radians = math.radians(angle)
+    cos = math.cos(radians) * size
+    sin = math.sin(radians) * size
+    return (cos, sin, -sin, cos, x, y)
+
+
+def transform(vertices, matrix):
+    a, b, c, d, tx, ty = matrix
+    if matrix == IDENTITY:
+        return vertices
+    result = np.dot(vertices, np.array(((a, b), (c, d)), dtype=np.float32))
+    result += (tx, ty)
+    return result
+
+
+class GlyphRecorder(VertexBatch):
+    """
+    A VertexBatch with a CPU side modelview stack. Glyph code issues its
+    shapes, colors and transforms to it instead of GL while being compiled.
+    """
+    def __init__(self):
+        super(GlyphRecorder, self).__init__()
+        self._color = INHERIT
+        self._matrix = IDENTITY
+        self._stack = []
+
+    def pushMatrix(self):
+        self._stack.append(self._matrix)
+
+    def popMatrix(self):
+        self._matrix = self._stack.pop()
+
+    def rotate(self, angle):
+        self._matrix = multiply(self._matrix, xform(0.0, 0.0, angle, 1.0))
+
+    def scale(self, scale):
+        self._matrix = multiply(self._matrix, (scale, 0.0, 0.0, scale, 0.0, 0.0))
+
+    def translate(self, x, y):
+        self._matrix = multiply(self._matrix, (1.0, 0.0, 0.0, 1.0, x, y))
+
+    def shape(self, mode, vertices):
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 2)
+        super(GlyphRecorder, self).shape(mode, transform(vertices, self._matrix))
+
+    def flush(self):
+        #  Recorded geometry is only drawn through the program.
+        pass
+
+    def program(self):
+        return GlyphProgram(list(self.arrays()))
+
+
+class GlyphProgram(object):
+    """
+    Pre-transformed (primitive, state, vertices, colors) runs of a glyph in
+    its unit space.
+    """
+    def __init__(self, runs):
+        super(GlyphProgram, self).__init__()
+        self.runs = runs
+        self.inherits = any(np.isnan(colors).any() for _, _, _, colors in runs)
+
+    def __len__(self):
+        return sum(len(vertices) for _, _, vertices, _ in self.runs)
+
+    def placed(self, x, y, angle, size, color=None):
+        """
+        The runs moved to (x, y), rotated and scaled like GlyphNamespace.draw,
+        with inherited colors replaced by color.
+        """
+        matrix = xform(x, y, angle, size)
+        runs = []
+        for primitive, state, vertices, colors in self.runs:
+            if color is not None and self.inherits:
+                colors = np.where(np.isnan(colors), np.asarray(color, dtype=np.float32)[:4], colors)
+            runs.append((primitive, state, transform(vertices, matrix), colors))
+        return runs
+
+    def draw(self, backend, x, y, angle, size, color=None):
+        backend.drawArrays(self.placed(x, y, angle, size, color))
+
+    def placedMany(self, xs, ys, angles, sizes, colors=None):
+        """
+        The runs of placed() for every instance, concatenated: one run per
+        run of the program however many instances there are. xs, ys, angles
+        and sizes are arrays or scalars broadcast against each other; colors
+        replaces inherited colors and is one color for all instances, one per
+        instance (a sequence or an (N, 4) array) or None to leave them NaN.
+        """
+        xs, ys, angles, sizes = np.broadcast_arrays(
+            *[np.asarray(v, dtype=np.float32) for v in (xs, ys, angles, sizes)]
+        )
+        xs, ys = xs.reshape(-1, 1), ys.reshape(-1, 1)
+        radians = np.radians(angles.reshape(-1, 1))
+        cos = np.cos(radians) * sizes.reshape(-1, 1)
+        sin = np.sin(radians) * sizes.reshape(-1, 1)
+        count = len(xs)
+        if colors is not None and self.inherits:
+            colors = instanceColors(colors, count)[:, None, :]
+
+        runs = []
+        for primitive, state, vertices, run_colors in self.runs:
+            vx, vy = vertices[:, 0], vertices[:, 1]
+            placed = np.empty((count, len(vertices), 2), dtype=np.float32)
+            placed[:, :, 0] = cos * vx - sin * vy + xs
+            placed[:, :, 1] = sin * vx + cos * vy + ys
+            if colors is not None and self.inherits:
+                run_colors = np.where(np.isnan(run_colors), colors, run_colors)
+            else:
+                run_colors = np.broadcast_to(run_colors, (count,) + run_colors.shape)
+            runs.append((primitive, state, placed.reshape(-1, 2), run_colors.reshape(-1, 4)))
+        return runs
+
+    def drawMany(self, backend, xs, ys, angles, sizes, colors=None):
+        backend.drawArrays(self.placedMany(xs, ys, angles, sizes, colors))
+
+
+def instanceColors(colors, count):
+    """
+    colors (one color, a sequence of count colors or a (count, 3 or 4)
+    array) as a (count, 4) float32 RGBA array.
+    """
+    if isinstance(colors, np.ndarray) and colors.ndim == 2:
+        array = colors.astype(np.float32, copy=False)
+        if array.shape[1] == 3:
+            array = np.hstack((array, np.ones((len(array), 1), dtype=np.float32)))
+        return np.broadcast_to(array, (count, 4))
+    if hasattr(colors, "rgba") or np.isscalar(colors[0]):
+        return np.broadcast_to(np.asarray(rgba(colors), dtype=np.float32), (count, 4))
+    return np.array([rgba(c) for c in colors], dtype=np.float32).reshape(count, 4)
@@ -0,0 +1,102 @@
+"""
+Advance tables of the gltext proxy, against the stand-in runtime's font with
+fixed proportions.
+
+Run from the directory containing this package:
+
+    python -m pytest -q <package>/tests
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.dirname(ROOT) not in sys.path:
+    sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+importlib.import_module(PACKAGE + ".benchmarks").installStandIns()
+import gltext  # noqa: E402
+
+glText = type(gltext)
+
+
+class AdvanceTableTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.proxy = glText()
+        self.proxy.advanceCacheDirectory = self.directory
+        self.runtime = sys.modules["rv"].runtime
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_measuringRestoresTheSize(self):
+        self.proxy.size(14)
+        table = self.proxy.advanceTable()
+        self.assertEqual(table.referenceSize, self.proxy.advanceReferenceSize)
+        self.assertEqual(self.proxy._size, 14)
+        self.assertEqual(self.runtime.textSize, 14.0)
+
+    def test_noMeasuringWithoutASize(self):
+        self.runtime.textSize = 12.0
+        self.assertIsNone(self.proxy.advanceTable())
+        self.assertIsNone(self.proxy._size)
+        self.assertEqual(self.runtime.textSize, 12.0)
+
+    def test_bounds(self):
+        self.proxy.size(14)
+        table = self.proxy.advanceTable()
+        for text in ("W", "iiii", "Frame 1234"):
+            np.testing.assert_allclose(table.bounds(text, 14), self.runtime.bounds(text), atol=1e-9)
+        self.assertIsNone(table.bounds(u"€", 14))
+        result, ok = table.boundsMany(["W", "", u"€", "Frame 1234"], 14)
+        np.testing.assert_array_equal(ok, (True, True, False, True))
+        np.testing.assert_allclose(result[3], self.runtime.bounds("Frame 1234"), rtol=1e-6)
+
+    def test_saveAndLoad(self):
+        self.proxy.setFont("/fonts/Test.ttf")
+        self.proxy.size(14)
+        table = self.proxy.advanceTable()
+        path = self.proxy._advanceCachePath("/fonts/Test.ttf")
+        self.assertTrue(os.path.exists(path))
+
+        loaded = glText.AdvanceTable.load(path)
+        self.assertEqual(loaded.font, "/fonts/Test.ttf")
+        self.assertEqual((loaded.ascender, loaded.descender), (table.ascender, table.descender))
+        for name in ("known", "advances", "left", "right", "bottom", "top"):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(table, name))
+
+        #  A later session loads the table instead of measuring it.
+        later = glText()
+        later.advanceCacheDirectory = self.directory
+        later.setFont("/fonts/Test.ttf")
+        evals = self.runtime.evals
+        self.assertIsNotNone(later.advanceTable())
+        self.assertEqual(self.runtime.evals, evals)
+
+    def test_defaultFontIsNotPersisted(self):
+        self.proxy.size(14)
+        self.assertIsNotNone(self.proxy.advanceTable())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_otherVersionsAreIgnored(self):
+        self.proxy.setFont("/fonts/Test.ttf")
+        self.proxy.size(14)
+        path = self.proxy._advanceCachePath("/fonts/Test.ttf")
+        self.proxy.advanceTable()
+        with open(path) as f:
+            data = f.read()
+        with open(path, "w") as f:
+            f.write(data.replace('"version": %d' % glText.AdvanceTable.VERSION, '"version": -1'))
+        self.assertIsNone(glText.AdvanceTable.load(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Behaviour of the pure Python parts of GlyphNamespace.
+
+Run from the directory containing this package:
+
+    python -m pytest -q <package>/tests
+"""
+
+import importlib
+import math
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.dirname(ROOT) not in sys.path:
+    sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+importlib.import_module(PACKAGE + ".benchmarks").installStandIns()
+glyph = importlib.import_module(PACKAGE + ".glyph")
+
+G = glyph.GlyphNamespace
+
+
+class FitSizeTest(unittest.TestCase):
+    #  Text extents as functions of size: proportional, with a fixed margin,
+    #  hinted to whole pixels and growing faster than linearly.
+    MEASURES = {
+        "linear": lambda size: (5.5 * size, 1.3 * size),
+        "margin": lambda size: (4.0 * size + 37.0, 1.2 * size + 16.0),
+        "hinted": lambda size: (math.floor(0.55 * size) * 9.0, math.ceil(1.05 * size)),
+        "curved": lambda size: (0.02 * size * size + 3.0 * size, 1.1 * size),
+    }
+
+    def setUp(self):
+        G._fitCache.clear()
+
+    def largestFitting(self, measure, width, height):
+        fitting = [s for s in range(G.fitMinSize, G.fitMaxSize + 1)
+                   if measure(s)[0] <= width and measure(s)[1] <= height]
+        return fitting[-1] if fitting else G.fitMinSize
+
+    def test_matchesExhaustiveSearch(self):
+        for name, measure in self.MEASURES.items():
+            for width, height in ((640, 80), (200, 400), (1920, 1080), (90, 30), (5000, 5000)):
+                key = (name, width, height)
+                size = G._fitSize(key, measure, width, height)
+                self.assertEqual(size, self.largestFitting(measure, width, height) - 2, key)
+
+    def test_probes(self):
+        #  Proportional extents are solved from the reference measurement and
+        #  confirmed one size up.
+        probes = G.fitStats["probes"]
+        G._fitSize("probes", self.MEASURES["linear"], 640, 80)
+        self.assertLessEqual(G.fitStats["probes"] - probes, 4)
+
+    def test_nothingFits(self):
+        self.assertEqual(G._fitSize("tiny", self.MEASURES["margin"], 10, 10), G.fitMinSize - 2)
+
+    def test_memoized(self):
+        calls = []
+
+        def measure(size):
+            calls.append(size)
+            return self.MEASURES["linear"](size)
+        size = G._fitSize("memo", measure, 640, 80)
+        count = len(calls)
+        self.assertEqual(G._fitSize("memo", measure, 640, 80), size)
+        self.assertEqual(len(calls), count)
+
+    def test_fitTextInBox(self):
+        #  The stand-in font is 0.55 size wide per character and 1.05 size high
+        #  including a 0.25 size descent below the baseline.
+        size = G.fitTextInBox("Frame 1234", 300, 100)
+        self.assertEqual(size, self.largestFitting(lambda s: (5.5 * s, 0.8 * s), 300, 100) - 2)
+
+
+class LowerBoundsTest(unittest.TestCase):
+    def test_matchesLowerBounds(self):
+        generator = random.Random(11)
+        for length in (1, 2, 3, 10, 57):
+            array = sorted(generator.randint(0, 40) for _ in range(length))
+            values = list(range(-2, 43)) + array
+            expected = [G.lower_bounds(array, value) for value in values]
+            self.assertEqual(G.lower_bounds_many(array, values).tolist(), expected, array)
+
+    def test_edges(self):
+        array = [2, 4, 4, 4, 9]
+        np.testing.assert_array_equal(G.lower_bounds_many(array, [1, 2, 3, 4, 5, 9, 10]), [-1, 0, 0, 3, 3, 4, 4])
+        np.testing.assert_array_equal(G.lower_bounds_many(np.array(array), np.array([[4, 1]])), [[3, -1]])
+        np.testing.assert_array_equal(G.lower_bounds_many([], [0, 5]), [-1, -1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+NumpyBackend renders frames pixel for pixel like a straightforward rasterizer
+that fills one triangle at a time over the whole frame.
+
+Run from the directory containing this package:
+
+    python -m pytest -q <package>/tests
+"""
+
+import importlib
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.dirname(ROOT) not in sys.path:
+    sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+importlib.import_module(PACKAGE + ".benchmarks").installStandIns()
+backend = importlib.import_module(PACKAGE + ".backend")
+glyph = importlib.import_module(PACKAGE + ".glyph")
+util = importlib.import_module(PACKAGE + ".util")
+
+G = glyph.GlyphNamespace
+Color = util.Color
+
+BACKGROUND = (0.1, 0.2, 0.3, 1.0)
+
+
+class ReferenceBackend(backend.NumpyBackend):
+    """
+    NumpyBackend filling each triangle on its own by testing every pixel of the
+    frame against its edge functions.
+    """
+    def fillTriangles(self, vertices, colors):
+        height, width = self.image.shape[:2]
+        px = np.arange(width) + 0.5
+        py = np.arange(height) + 0.5
+        triangles = np.asarray(vertices, dtype=np.float64).reshape(-1, 3, 2)
+        for triangle, color in zip(triangles, np.asarray(colors, dtype=np.float32)[0::3]):
+            (ax, ay), (bx, by), (cx, cy) = triangle
+            area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+            if area == 0:
+                continue
+            if area < 0:
+                triangle = triangle[(0, 2, 1), :]
+            inside = np.ones((height, width), dtype=bool)
+            for edge in range(3):
+                (sx, sy), (ex, ey) = triangle[edge], triangle[(edge + 1) % 3]
+                dx, dy = ex - sx, ey - sy
+                value = (dx * (py - sy))[:, None] - (dy * (px - sx))[None, :]
+                if dy < 0 or (dy == 0 and dx < 0):
+                    inside &= value >= 0
+                else:
+                    inside &= value > 0
+            alpha = inside * color[3]
+            keep = 1.0 - alpha
+            self.image[..., :3] *= keep[..., None]
+            self.image[..., :3] += alpha[..., None] * color[:3]
+            self.image[..., 3] = alpha + self.image[..., 3] * keep
+
+
+class NumpyBackendTest(unittest.TestCase):
+    def setUp(self):
+        self._backend = G.backend
+
+    def tearDown(self):
+        G.setBackend(self._backend)
+
+    def render(self, cls, draw, width=200, height=120):
+        target = cls(width, height, BACKGROUND)
+        G.setBackend(target)
+        draw(target)
+        G.flushBatch()
+        return target.image
+
+    def assertMatchesReference(self, draw, width=200, height=120):
+        image = self.render(backend.NumpyBackend, draw, width, height)
+        reference = self.render(ReferenceBackend, draw, width, height)
+        self.assertTrue((reference != np.float32(BACKGROUND)).any(), "nothing was drawn")
+        np.testing.assert_array_equal(image, reference)
+        return image
+
+    def test_roundedBox(self):
+        fg, bg = Color(0, 1, 0, 1), Color(1, 0, 0, 0.5)
+        image = self.assertMatchesReference(lambda b: G.drawRoundedBox(40, 30, 159, 89, 10, bg, fg))
+        #  Rows are bottom up: image[y, x].
+        np.testing.assert_allclose(image[60, 100], (0.55, 0.1, 0.15, 1.0), atol=1e-6)
+        np.testing.assert_array_equal(image[89, 100], (0.0, 1.0, 0.0, 1.0))
+        np.testing.assert_array_equal(image[5, 5], np.float32(BACKGROUND))
+        np.testing.assert_array_equal(image[88, 31], np.float32(BACKGROUND))
+
+    def test_roundedBoxCoveringTheFrame(self):
+        fg, bg = Color(1, 1, 1, 1), Color(0.2, 0.2, 0.2, 0.6)
+        self.assertMatchesReference(lambda b: G.drawRoundedBox(0, 0, 639, 359, 20, bg, fg), 640, 360)
+
+    def test_nameValuePairs(self):
+        fg, bg = Color(1, 1, 1, 1), Color(0, 0, 0, 0.85)
+        pairs = [("Name", "value"), ("Frame", "1234"), ("Resolution", "1920 x 1080")]
+        self.assertMatchesReference(lambda b: G.drawNameValuePairs(pairs, fg, bg, 20, 20, 8))
+
+    def test_glyphs(self):
+        def draw(target):
+            shapes = (G.triangleGlyph, G.circleGlyph, G.squareGlyph, G.pauseGlyph, G.rgbGlyph, G.drawXGlyph)
+            for i, shape in enumerate(shapes):
+                target.setColor((0.9, 0.5, 0.1, 0.7))
+                G.draw(shape, 20 + i * 32, 30, 15 * i, 12, False)
+                target.setColor((0.1, 0.9, 0.5, 0.8))
+                G.draw(shape, 20 + i * 32, 80, 0, 12, True)
+        self.assertMatchesReference(draw)
+
+    def test_drawMany(self):
+        count = 12
+        xs = np.linspace(10, 190, count)
+        colors = np.random.RandomState(1).uniform(0.2, 1.0, (count, 4))
+        self.assertMatchesReference(
+            lambda b: G.drawMany(G.circleGlyph, xs, xs * 0.5 + 10, np.zeros(count), np.full(count, 14.0), colors)
+        )
+
+    def test_overlappingTriangles(self):
+        random = np.random.RandomState(7)
+        vertices = random.uniform(-20, 220, (60 * 3, 2))
+        vertices[:30] = np.round(vertices[:30])
+        colors = random.uniform(0, 1, (60 * 3, 4)).astype(np.float32)
+        self.assertMatchesReference(lambda b: b.fillTriangles(vertices, colors))
+
+    def test_sharedEdgesCoverPixelsOnce(self):
+        #  Two halves of a square: every pixel on the diagonal belongs to
+        #  exactly one of them.
+        vertices = np.array(((10, 10), (50, 10), (50, 50), (10, 10), (50, 50), (10, 50)))
+        colors = np.full((6, 4), 0.5, dtype=np.float32)
+        image = self.assertMatchesReference(lambda b: b.fillTriangles(vertices, colors))
+        inside = image[10:50, 10:50]
+        np.testing.assert_array_equal(inside, np.broadcast_to(inside[0, 0], inside.shape))
+
+    def test_chunks(self):
+        #  Runs split on covered pixels draw the same frame.
+        vertices = np.array(((0, 0), (200, 0), (200, 120), (0, 0), (200, 120), (0, 120)) * 3, dtype=np.float32)
+        colors = np.random.RandomState(3).uniform(0, 1, (len(vertices), 4)).astype(np.float32)
+        whole = self.render(backend.NumpyBackend, lambda b: b.fillTriangles(vertices, colors))
+
+        class Chunked(backend.NumpyBackend):
+            _chunkPixels = 1000
+        chunked = self.render(Chunked, lambda b: b.fillTriangles(vertices, colors))
+        np.testing.assert_array_equal(chunked, whole)
+
+    def test_pixels(self):
+        target = backend.NumpyBackend(4, 2, BACKGROUND)
+        target.fillTriangles(np.array(((0, 0), (4, 0), (4, 1), (0, 0), (4, 1), (0, 1))), np.ones((6, 4)))
+        np.testing.assert_array_equal(target.pixels()[:, 0], ((26, 51, 77, 255), (255, 255, 255, 255)))
+
+
+if __name__ == "__main__":
+    unittest.main()
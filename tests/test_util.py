@@ -0,0 +1,132 @@
+"""
+Behaviour of the pure Python helpers in util.py.
+
+Run from the directory containing this package:
+
+    python -m pytest -q <package>/tests
+"""
+
+import importlib
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.dirname(ROOT) not in sys.path:
+    sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+importlib.import_module(PACKAGE + ".benchmarks").installStandIns()
+util = importlib.import_module(PACKAGE + ".util")
+
+Color = util.Color
+Configuration = util.Configuration
+SpatialGrid = util.SpatialGrid
+
+
+class ConfigurationTest(unittest.TestCase):
+    def setUp(self):
+        Configuration.reload()
+        #  Configuration evaluates through whichever rv.runtime is installed.
+        self.runtime = sys.modules["rv"].runtime
+
+    def tearDown(self):
+        Configuration.reload()
+
+    def test_failedReadIsKept(self):
+        #  The stand-in runtime does not answer the rvui.globalConfig eval.
+        config = Configuration()
+        evals = self.runtime.evals
+        for _ in range(200):
+            self.assertEqual(config.bg, Color(0, 0, 0, 0))
+        self.assertEqual(self.runtime.evals - evals, 1)
+
+    def test_failedReadIsRetried(self):
+        config = Configuration()
+        with mock.patch.object(util.time, "monotonic", return_value=1000.0):
+            config.bg
+        evals = self.runtime.evals
+        with mock.patch.object(util.time, "monotonic", return_value=1000.0 + Configuration.RETRY_SECONDS / 2):
+            config.bg
+        self.assertEqual(self.runtime.evals, evals)
+        with mock.patch.object(util.time, "monotonic", return_value=1000.0 + Configuration.RETRY_SECONDS):
+            config.bg
+        self.assertEqual(self.runtime.evals, evals + 1)
+
+    def test_reload(self):
+        config = Configuration()
+        config.bg
+        evals = self.runtime.evals
+        Configuration.reload()
+        config.bg
+        self.assertEqual(self.runtime.evals, evals + 1)
+
+    def test_successfulRead(self):
+        def answer(source, modules):
+            count = source.count("c.")
+            return ["1 0.5 0.25 1"] * count
+        with mock.patch.object(self.runtime, "eval", answer):
+            config = Configuration()
+            self.assertEqual(config.bg, Color(1, 0.5, 0.25, 1))
+        #  Kept, with no retry pending.
+        self.assertEqual(config.fg, Color(1, 0.5, 0.25, 1))
+        self.assertIsNone(Configuration._retryAt)
+
+
+class SpatialGridTest(unittest.TestCase):
+    def assertMatchesScan(self, grid, boxes, points):
+        #  boxes: item -> (x, y, w, h), in insertion order.
+        for x, y in points:
+            expected = [item for item, (bx, by, bw, bh) in boxes.items() if bx <= x <= bx + bw and by <= y <= by + bh]
+            self.assertEqual(grid.query(x, y), expected, (x, y))
+            self.assertEqual(grid.first(x, y), expected[0] if expected else None)
+
+    def test_query(self):
+        generator = random.Random(5)
+        grid = SpatialGrid(cellSize=16.0)
+        boxes = {}
+        for item in range(60):
+            boxes[item] = tuple(generator.uniform(-50, 200) for _ in range(2)) + tuple(
+                generator.uniform(0, 80) for _ in range(2)
+            )
+            grid.insert(item, *boxes[item])
+        points = [(generator.uniform(-60, 290), generator.uniform(-60, 290)) for _ in range(500)]
+        self.assertMatchesScan(grid, boxes, points)
+
+        #  Moving keeps an item's place in the order; removing forgets it.
+        for item in range(0, 60, 3):
+            boxes[item] = (generator.uniform(-50, 200), generator.uniform(-50, 200), 40.0, 40.0)
+            grid.update(item, *boxes[item])
+        for item in range(1, 60, 3):
+            del boxes[item]
+            grid.remove(item)
+        self.assertEqual(len(grid), len(boxes))
+        self.assertEqual(len(grid._order), len(boxes))
+        self.assertMatchesScan(grid, boxes, points)
+
+    def test_edges(self):
+        grid = SpatialGrid(cellSize=10.0)
+        grid.insert("a", 5, 5, 10, 10)
+        self.assertEqual(grid.first(5, 5), "a")
+        self.assertEqual(grid.first(15, 15), "a")
+        self.assertIsNone(grid.first(15.01, 15))
+        self.assertIsNone(grid.first(4.99, 10))
+
+    def test_removeAndClear(self):
+        grid = SpatialGrid()
+        grid.insert("a", 0, 0, 100, 100)
+        grid.insert("b", 10, 10, 10, 10)
+        grid.remove("a")
+        grid.remove("a")
+        self.assertNotIn("a", grid)
+        self.assertEqual(grid.query(15, 15), ["b"])
+        self.assertEqual(grid._cells.keys() - {(0, 0)}, set())
+        grid.clear()
+        self.assertEqual(len(grid), 0)
+        self.assertIsNone(grid.first(15, 15))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Behaviour of Widget that does not need RV or a GL context.
+
+Run from the directory containing this package:
+
+    python -m pytest -q <package>/tests
+"""
+
+import importlib
+import os
+import sys
+import time
+import types
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.dirname(ROOT) not in sys.path:
+    sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+importlib.import_module(PACKAGE + ".benchmarks").installStandIns()
+widget = importlib.import_module(PACKAGE + "._rvtypes_widget")
+
+Widget = widget.Widget
+
+
+def waitForLayout(target, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while target.currentLayout() is None:
+        if time.monotonic() > deadline:
+            raise AssertionError("the layout never completed")
+        time.sleep(0.001)
+
+
+class WidgetTest(unittest.TestCase):
+    def test_toggleOffRedrawsAfterDrawLayout(self):
+        target = Widget()
+        target.init("test-toggle", [], None)
+        target.toggle()
+        draws = []
+        target.submitLayout(lambda: types.SimpleNamespace(draw=lambda: draws.append(1)))
+        waitForLayout(target)
+        target.render(None)
+        self.assertEqual(draws, [1])
+
+        with mock.patch.object(widget.commands, "redraw") as redraw:
+            target.toggle()
+        redraw.assert_called_once_with()
+
+    def test_renderDoesNotStartTheLayoutWorker(self):
+        layout = importlib.import_module(PACKAGE + ".layout")
+        with mock.patch.object(layout.LayoutWorker, "_shared", None):
+            target = Widget()
+            target.render(None)
+            self.assertIsNone(target.currentLayout())
+            self.assertIsNone(layout.LayoutWorker._shared)
+
+    def test_toggleOffWithoutDrawingDoesNotRedraw(self):
+        target = Widget()
+        target.init("test-toggle-undrawn", [], None)
+        target.toggle()
+        with mock.patch.object(widget.commands, "redraw") as redraw:
+            target.toggle()
+        redraw.assert_not_called()
+
+
+class ButtonTest(unittest.TestCase):
+    def setUp(self):
+        self.widget = Widget()
+        self.a = self.widget.addButton(Widget.Button(0, 0, 20, 20))
+        self.b = self.widget.addButton(Widget.Button(10, 10, 20, 20))
+
+    def assertHits(self, points, buttons):
+        buttons = list(buttons)
+        for (x, y), button in zip(points, buttons):
+            self.assertIs(self.widget.buttonAt(x, y), button)
+        expected = [-1 if b is None else self.widget._buttons.index(b) for b in buttons]
+        self.assertEqual(self.widget.buttonsAt([x for x, _ in points], [y for _, y in points]).tolist(), expected)
+
+    def test_api(self):
+        points = [(5, 5), (15, 15), (25, 25), (40, 40)]
+        self.assertHits(points, (self.a, self.a, self.b, None))
+        self.b.setBounds(30, 30, 20, 20)
+        self.assertHits(points, (self.a, self.a, None, self.b))
+        self.widget.removeButton(self.a)
+        self.assertHits(points, (None, None, None, self.b))
+
+    def test_editingTheListDirectly(self):
+        points = [(5, 5), (25, 25), (55, 55)]
+        c = Widget.Button(50, 50, 10, 10)
+        self.widget._buttons.append(c)
+        self.assertHits(points, (self.a, self.b, c))
+        del self.widget._buttons[:]
+        self.assertHits(points, (None, None, None))
+        self.widget._buttons = [c]
+        self.assertHits(points, (None, None, c))
+        self.assertIs(c._owner, self.widget)
+        #  The API keeps working after direct edits.
+        self.widget.addButton(self.a)
+        self.assertHits(points, (self.a, None, c))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Run-length timeline drawing.
+
+Cached, marked and skipped frames are kept as runs of consecutive frames,
+merged once when the frame sets change rather than on every redraw. Drawing
+maps the runs onto pixels, merges runs closer than a pixel, and emits one
+quad per remaining run with all quads of a color in a single batched shape,
+using the tl* colors of the Configuration.
+"""
+
+import numpy as np
+from .gl import GL_QUADS
+
+from .glyph import GlyphNamespace
+from .util import Configuration
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def frameRuns(frames):
+    """
+    Merge frames (any iterable of frame numbers, in any order, duplicates
+    allowed) into runs of consecutive frames. Returns (starts, ends) int64
+    arrays with inclusive ends.
+    """
+    if not isinstance(frames, np.ndarray):
+        frames = np.fromiter(frames, dtype=np.int64)
+    frames = np.unique(frames.astype(np.int64, copy=False))
+    if not len(frames):
+        return _EMPTY, _EMPTY
+    breaks = np.flatnonzero(np.diff(frames) != 1)
+    starts = frames[np.concatenate(([0], breaks + 1))]
+    ends = frames[np.concatenate((breaks, [len(frames) - 1]))]
+    return starts, ends
+
+
+def rangeRuns(ranges):
+    """
+    Merge (start, end) inclusive frame ranges, such as the cached ranges RV
+    reports, into sorted runs with overlapping and adjacent ranges joined.
+    """
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    if not len(ranges):
+        return _EMPTY, _EMPTY
+    ranges = ranges[np.argsort(ranges[:, 0], kind="stable")]
+    starts, ends = ranges[:, 0], np.maximum.accumulate(ranges[:, 1])
+    breaks = np.flatnonzero(starts[1:] > ends[:-1] + 1)
+    return starts[np.concatenate(([0], breaks + 1))], ends[np.concatenate((breaks, [len(ranges) - 1]))]
+
+
+def pixelRuns(starts, ends, x, scale, first, minWidth=1.0):
+    """
+    Map runs onto [x0, x1) pixel spans, frame first starting at x and every
+    frame scale pixels wide. Spans less than a pixel apart are merged and all
+    spans are at least minWidth wide.
+    """
+    if not len(starts):
+        return np.empty(0), np.empty(0)
+    x0 = x + (starts - first) * scale
+    x1 = np.maximum(x + (ends + 1 - first) * scale, x0 + minWidth)
+    if len(x0) > 1:
+        groups = np.concatenate(([0], np.flatnonzero(x0[1:] - x1[:-1] >= 1.0) + 1))
+        x0 = x0[groups]
+        x1 = np.maximum.reduceat(x1, groups)
+    return x0, x1
+
+
+def spanQuads(x0, x1, y0, y1):
+    """
+    GL_QUADS vertices of [x0, x1) x [y0, y1) spans, as an (N * 4, 2) array.
+    """
+    quads = np.empty((len(x0), 4, 2), dtype=np.float32)
+    quads[:, (0, 3), 0] = x0[:, None]
+    quads[:, (1, 2), 0] = x1[:, None]
+    quads[:, (0, 1), 1] = y0
+    quads[:, (2, 3), 1] = y1
+    return quads.reshape(-1, 2)
+
+
+class Timeline(object):
+    """
+    The frame range of a timeline with its in/out points and cached, marked
+    and skipped frames.
+    """
+    def __init__(self, start=1, end=1, config=None):
+        super(Timeline, self).__init__()
+        self.config = config if config is not None else Configuration()
+        self.start = start
+        self.end = end
+        self.inFrame = start
+        self.outFrame = end
+        #  Height of the cache bar as a fraction of the timeline height, and
+        #  width of the in/out caps in pixels.
+        self.cacheHeight = 0.2
+        self.capWidth = 3.0
+        self._cached = (_EMPTY, _EMPTY)
+        self._cachedCount = 0
+        self._marked = (_EMPTY, _EMPTY)
+        self._skipped = (_EMPTY, _EMPTY)
+
+    def setRange(self, start, end):
+        self.start = start
+        self.end = end
+
+    def setInOut(self, inFrame, outFrame):
+        self.inFrame = inFrame
+        self.outFrame = outFrame
+
+    def setCachedFrames(self, frames):
+        self._setCached(frameRuns(frames))
+
+    def setCachedRanges(self, ranges):
+        self._setCached(rangeRuns(ranges))
+
+    def _setCached(self, runs):
+        self._cached = runs
+        self._cachedCount = int((runs[1] - runs[0] + 1).sum())
+
+    def setMarkedFrames(self, frames):
+        self._marked = frameRuns(frames)
+
+    def setSkippedFrames(self, frames):
+        self._skipped = frameRuns(frames)
+
+    def cachedRuns(self):
+        return self._cached
+
+    def markedRuns(self):
+        return self._marked
+
+    def skippedRuns(self):
+        return self._skipped
+
+    def fullyCached(self):
+        """
+        True when every frame between the in and out points is cached.
+        """
+        starts, ends = self._cached
+        if not len(starts):
+            return False
+        index = np.searchsorted(starts, self.inFrame, side="right") - 1
+        return index >= 0 and ends[index] >= self.outFrame
+
+    def frameX(self, frame, x, w):
+        return x + (frame - self.start) * (w / float(self.end - self.start + 1))
+
+    def draw(self, x, y, w, h):
+        """
+        Draw the timeline into the box at (x, y) of size w x h.
+        """
+        config = self.config
+        scale = w / float(self.end - self.start + 1)
+
+        with GlyphNamespace.batching() as batch:
+            batch.setState()
+
+            in_x, out_x = pixelRuns(np.array([self.inFrame]), np.array([self.outFrame]), x, scale, self.start)
+            batch.setColor(config.tlRangeColor)
+            batch.shape(GL_QUADS, spanQuads(in_x, out_x, y, y + h))
+
+            self._drawRuns(batch, self._skipped, config.tlSkipColor, x, y, scale, y + h)
+            cache_color = config.tlCacheFullColor if self.fullyCached() else config.tlCacheColor
+            self._drawRuns(batch, self._cached, cache_color, x, y, scale, y + h * self.cacheHeight)
+            self._drawRuns(batch, self._marked, config.tlMarkedColor, x, y, scale, y + h)
+
+            caps_x = np.concatenate((in_x, out_x - self.capWidth))
+            batch.setColor(config.tlInOutCapsColor)
+            batch.shape(GL_QUADS, spanQuads(caps_x, caps_x + self.capWidth, y, y + h))
+
+    def _drawRuns(self, batch, runs, color, x, y0, scale, y1):
+        x0, x1 = pixelRuns(runs[0], runs[1], x, scale, self.start)
+        if len(x0):
+            batch.setColor(color)
+            batch.shape(GL_QUADS, spanQuads(x0, x1, y0, y1))
@@ -1,3 +1,12 @@
+import math
+import numbers
+import operator
+import re
+import time
+
+import numpy as np
+
+
 def lerp(a, b, t):
     """
     math_util.lerp
@@ -6,24 +15,114 @@ def lerp(a, b, t):
 
 
 class Color(object):
-    def __init__(self, r, g, b, a=None):
-        self.r = r
-        self.g = g
-        self.b = b
-        self.a = a
+    """
+    Immutable RGBA color. a may be None for colors given without alpha; it
+    counts as 1.0 in arithmetic. Like Mu's vec4, arithmetic is componentwise
+    and returns a new Color; multiplying by a number scales all four
+    components.
+
+    Colors listed in Color._interned (see Color.intern) are shared: building
+    one of them returns the existing instance instead of allocating.
+    """
+    __slots__ = ("r", "g", "b", "a")
+
+    _interned = {}
+
+    def __new__(cls, r, g, b, a=None):
+        color = cls._interned.get((r, g, b, a))
+        if color is not None:
+            return color
+        color = object.__new__(cls)
+        object.__setattr__(color, "r", r)
+        object.__setattr__(color, "g", g)
+        object.__setattr__(color, "b", b)
+        object.__setattr__(color, "a", a)
+        return color
+
+    @classmethod
+    def intern(cls, r, g, b, a=None):
+        """
+        Return the shared instance of this color, creating it if needed.
+        """
+        color = cls(r, g, b, a)
+        return cls._interned.setdefault((r, g, b, a), color)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Color is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Color is immutable")
+
+    def __reduce__(self):
+        return Color, (self.r, self.g, self.b, self.a)
+
+    def __repr__(self):
+        return "Color(%r, %r, %r, %r)" % (self.r, self.g, self.b, self.a)
+
+    def __eq__(self, other):
+        if not isinstance(other, Color):
+            return NotImplemented
+        return (self.r, self.g, self.b, self.a) == (other.r, other.g, other.b, other.a)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash((self.r, self.g, self.b, self.a))
+
+    def rgba(self):
+        return (self.r, self.g, self.b, 1.0 if self.a is None else self.a)
+
+    def _combine(self, other, operator, name):
+        if isinstance(other, numbers.Real):
+            return Color(operator(self.r, other), operator(self.g, other), operator(self.b, other),
+                         None if self.a is None else operator(self.a, other))
+        if isinstance(other, Color):
+            a = None if self.a is None and other.a is None else operator(
+                1.0 if self.a is None else self.a, 1.0 if other.a is None else other.a
+            )
+            return Color(operator(self.r, other.r), operator(self.g, other.g), operator(self.b, other.b), a)
+        raise ValueError("Cannot %s a Color and a %s" % (name, type(other)))
 
     def __mul__(self, other):
-        if isinstance(other, (int, float)):
-            for attr in [self.r, self.g, self.b, self.a]:
-                attr *= other
-        elif isinstance(other, Color):
-            self.r *= other.r
-            self.g *= other.g
-            self.b *= other.b
-            self.a *= other.a
-        else:
-            raise ValueError("Cannot multiply a Color against a %s" % type(other))
-        return self
+        return self._combine(other, operator.mul, "multiply")
+
+    __rmul__ = __mul__
+
+    def __add__(self, other):
+        return self._combine(other, operator.add, "add")
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._combine(other, operator.sub, "subtract")
+
+    @staticmethod
+    def pack(colors):
+        """
+        Pack a sequence of Colors into an (N, 4) float32 RGBA array, for
+        uploading or blending many colors at once.
+        """
+        result = np.empty((len(colors), 4), dtype=np.float32)
+        for index, color in enumerate(colors):
+            result[index] = color.rgba()
+        return result
+
+    @staticmethod
+    def unpack(array):
+        """
+        The Colors of an (N, 4) RGBA array.
+        """
+        return [Color(*row) for row in np.asarray(array, dtype=np.float32).tolist()]
+
+
+for _rgba in [
+    (0, 0, 0, 0), (0, 0, 0, 1), (1, 1, 1, 1), (0.5, 0.5, 0.5, 1), (0.2, 0.2, 0.2, 1),
+    (0, 0, 0, 0.85), (0, 0, 0, 0.25), (1, 1, 1, 0.25), (0.5, 0.5, 0.5, 0.5),
+]:
+    Color.intern(*_rgba)
+del _rgba
 
 
 class TBox(object):
@@ -40,87 +139,318 @@ class BBox(object):
         self.y1 = y1
 
 
+_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
 class Configuration(object):
-    def __init__(
-            self,
-            lastOpenDir           =     "",
-            lastLUTDir            =     "",
-            bg                    =     Color(0, 0, 0, 0),
-            fg                    =     Color(0, 0, 0, 0),
-            bgErr                 =     Color(0, 0, 0, 0),
-            fgErr                 =     Color(0, 0, 0, 0),
-            bgFeedback            =     Color(0, 0, 0, 0),
-            fgFeedback            =     Color(0, 0, 0, 0),
-            textEntryTextSize     =     0.0,
-            inspectorTextSize     =     0.0,
-            infoTextSize          =     0.0,
-            wipeFade              =     0.0,
-            wipeFadeProximity     =     0.0,
-            wipeGrabProximity     =     0.0,
-            wipeInfoTextSize      =     0.0,
-            msFrameTextSize       =     0.0,
-            tlFrameTextSize       =     0.0,
-            tlBoundsTextSize      =     0.0,
-            tlBoundsColor         =     Color(0, 0, 0, 0),
-            tlRangeColor          =     Color(0, 0, 0, 0),
-            tlCacheColor          =     Color(0, 0, 0, 0),
-            tlCacheFullColor      =     Color(0, 0, 0, 0),
-            tlInOutCapsColor      =     Color(0, 0, 0, 0),
-            tlMarkedColor         =     Color(0, 0, 0, 0),
-            tlSkipColor           =     Color(0, 0, 0, 0),
-            tlSkipTextColor       =     Color(0, 0, 0, 0),
-            matteColor            =     Color(0, 0, 0, 0),
-            bgVCR                 =     Color(0, 0, 0, 0),
-            fgVCR                 =     Color(0, 0, 0, 0),
-            bgTlVCR               =     Color(0, 0, 0, 0),
-            bgVCRButton           =     Color(0, 0, 0, 0),
-            hlVCRButton           =     Color(0, 0, 0, 0),
-            pdfReader             =     "",
-            htmlReader            =     "",
-            os                    =     "",
-            bevelMargin           =     0,
-            menuBarCreationFunc   =     None,
-            renderImageSpace      =     (0, 0, 0, 0),
-            renderViewSpace       =     (0, 0, 0, 0)
-    ):
+    """
+    The rvui.globalConfig settings.
+
+    Every field is read from RV in one runtime.eval the first time any
+    Configuration is read, and the values are shared by every instance in the
+    process. An instance copies them only when one of its fields is assigned
+    (or when it is constructed with explicit values), so building one per
+    Widget costs next to nothing. Configuration.reload() reads the settings
+    again; instances that were not written to see the new values.
+    """
+    #  (field, default). The type of the default decides how the field is
+    #  read; None fields are not settings and always start as None.
+    FIELDS = (
+        ("lastOpenDir", ""),
+        ("lastLUTDir", ""),
+        ("bg", Color(0, 0, 0, 0)),
+        ("fg", Color(0, 0, 0, 0)),
+        ("bgErr", Color(0, 0, 0, 0)),
+        ("fgErr", Color(0, 0, 0, 0)),
+        ("bgFeedback", Color(0, 0, 0, 0)),
+        ("fgFeedback", Color(0, 0, 0, 0)),
+        ("textEntryTextSize", 0.0),
+        ("inspectorTextSize", 0.0),
+        ("infoTextSize", 0.0),
+        ("wipeFade", 0.0),
+        ("wipeFadeProximity", 0.0),
+        ("wipeGrabProximity", 0.0),
+        ("wipeInfoTextSize", 0.0),
+        ("msFrameTextSize", 0.0),
+        ("tlFrameTextSize", 0.0),
+        ("tlBoundsTextSize", 0.0),
+        ("tlBoundsColor", Color(0, 0, 0, 0)),
+        ("tlRangeColor", Color(0, 0, 0, 0)),
+        ("tlCacheColor", Color(0, 0, 0, 0)),
+        ("tlCacheFullColor", Color(0, 0, 0, 0)),
+        ("tlInOutCapsColor", Color(0, 0, 0, 0)),
+        ("tlMarkedColor", Color(0, 0, 0, 0)),
+        ("tlSkipColor", Color(0, 0, 0, 0)),
+        ("tlSkipTextColor", Color(0, 0, 0, 0)),
+        ("matteColor", Color(0, 0, 0, 0)),
+        ("bgVCR", Color(0, 0, 0, 0)),
+        ("fgVCR", Color(0, 0, 0, 0)),
+        ("bgTlVCR", Color(0, 0, 0, 0)),
+        ("bgVCRButton", Color(0, 0, 0, 0)),
+        ("hlVCRButton", Color(0, 0, 0, 0)),
+        ("pdfReader", ""),
+        ("htmlReader", ""),
+        ("os", ""),
+        ("bevelMargin", 0),
+        ("menuBarCreationFunc", None),
+        ("renderImageSpace", (0, 0, 0, 0)),
+        ("renderViewSpace", (0, 0, 0, 0)),
+    )
 
+    __slots__ = ("_values", "_overrides")
+
+    #  The values read from RV, shared process wide.
+    _settings = None
+    #  When the defaults stand in for a failed read, the time.monotonic() at
+    #  which to read again.
+    _retryAt = None
+    RETRY_SECONDS = 5.0
+
+    def __init__(self, *args, **kwargs):
         super(Configuration, self).__init__()
-        self.lastOpenDir = lastOpenDir
-        self.lastLUTDir = lastLUTDir
-        self.bg = bg
-        self.fg = fg
-        self.bgErr = bgErr
-        self.fgErr = fgErr
-        self.bgFeedback = bgFeedback
-        self.fgFeedback = fgFeedback
-        self.textEntryTextSize = textEntryTextSize
-        self.inspectorTextSize = inspectorTextSize
-        self.infoTextSize = infoTextSize
-        self.wipeFade = wipeFade
-        self.wipeFadeProximity = wipeFadeProximity
-        self.wipeGrabProximity = wipeGrabProximity
-        self.wipeInfoTextSize = wipeInfoTextSize
-        self.msFrameTextSize = msFrameTextSize
-        self.tlFrameTextSize = tlFrameTextSize
-        self.tlBoundsTextSize = tlBoundsTextSize
-        self.tlBoundsColor = tlBoundsColor
-        self.tlRangeColor = tlRangeColor
-        self.tlCacheColor = tlCacheColor
-        self.tlCacheFullColor = tlCacheFullColor
-        self.tlInOutCapsColor = tlInOutCapsColor
-        self.tlMarkedColor = tlMarkedColor
-        self.tlSkipColor = tlSkipColor
-        self.tlSkipTextColor = tlSkipTextColor
-        self.matteColor = matteColor
-        self.bgVCR = bgVCR
-        self.fgVCR = fgVCR
-        self.bgTlVCR = bgTlVCR
-        self.bgVCRButton = bgVCRButton
-        self.hlVCRButton = hlVCRButton
-        self.pdfReader = pdfReader
-        self.htmlReader = htmlReader
-        self.os = os
-        self.bevelMargin = bevelMargin
-        self.menuBarCreationFunc = menuBarCreationFunc
-        self.renderImageSpace = renderImageSpace
-        self.renderViewSpace = renderViewSpace
+        if len(args) > len(Configuration.FIELDS):
+            raise TypeError("Configuration takes at most %d arguments" % len(Configuration.FIELDS))
+        overrides = dict(zip(Configuration._INDEX, args))
+        for name in kwargs:
+            if name not in Configuration._INDEX:
+                raise TypeError("Configuration has no field %r" % name)
+            if name in overrides:
+                raise TypeError("Configuration got multiple values for %r" % name)
+        overrides.update(kwargs)
+        self._values = None
+        self._overrides = overrides or None
+
+    @classmethod
+    def settings(cls):
+        """
+        The shared field values, read from RV on first use. When RV cannot be
+        read the defaults are used instead, and the read is tried again on the
+        first access RETRY_SECONDS later or after reload().
+        """
+        if Configuration._settings is None or (
+            Configuration._retryAt is not None and time.monotonic() >= Configuration._retryAt
+        ):
+            values = cls._read()
+            if values is None:
+                values = [default for _, default in Configuration.FIELDS]
+                Configuration._retryAt = time.monotonic() + Configuration.RETRY_SECONDS
+            else:
+                Configuration._retryAt = None
+            Configuration._settings = tuple(values)
+        return Configuration._settings
+
+    @classmethod
+    def reload(cls):
+        Configuration._settings = None
+        Configuration._retryAt = None
+
+    @classmethod
+    def _read(cls):
+        """
+        The field values from rvui.globalConfig, with defaults for those which
+        do not parse, or None if the eval failed.
+        """
+        defaults = [default for _, default in Configuration.FIELDS]
+        fields = [(name, default) for name, default in Configuration.FIELDS if default is not None]
+        source = "{ require rvui; let c = rvui.globalConfig; string[] {%s}; }" % ", ".join(
+            ("c." + name) if isinstance(default, str) else ("string(c.%s)" % name) for name, default in fields
+        )
+        try:
+            from rv import runtime
+            result = runtime.eval(source, ["rvui"])
+        except Exception:
+            return None
+        if isinstance(result, str):
+            result = [re.sub(r"\\(.)", r"\1", value) for value in _QUOTED.findall(result)]
+        if result is None or len(result) != len(fields):
+            return None
+
+        values = dict(zip([name for name, _ in fields], result))
+        for index, (name, default) in enumerate(Configuration.FIELDS):
+            if default is None or isinstance(default, str):
+                defaults[index] = values.get(name, default)
+                continue
+            numbers = [float(v) for v in _NUMBER.findall(values[name])]
+            if isinstance(default, Color) and len(numbers) == 4:
+                defaults[index] = Color(*numbers)
+            elif isinstance(default, tuple) and len(numbers) == len(default):
+                defaults[index] = tuple(numbers)
+            elif isinstance(default, (int, float)) and len(numbers) == 1:
+                defaults[index] = type(default)(numbers[0])
+        return defaults
+
+    def _get(self, index):
+        if self._overrides is not None:
+            self._own()
+        values = self._values
+        return (Configuration.settings() if values is None else values)[index]
+
+    def _set(self, index, value):
+        if self._values is None:
+            self._own()
+        self._values[index] = value
+
+    def _own(self):
+        values = list(Configuration.settings() if self._values is None else self._values)
+        if self._overrides is not None:
+            for name, value in self._overrides.items():
+                values[Configuration._INDEX[name]] = value
+            self._overrides = None
+        self._values = values
+
+    def isShared(self):
+        """
+        True while this instance reads the shared values.
+        """
+        return self._values is None and self._overrides is None
+
+    def copy(self):
+        config = Configuration()
+        if not self.isShared():
+            self._own()
+            config._values = list(self._values)
+        return config
+
+    def asDict(self):
+        values = Configuration.settings() if self.isShared() else [self._get(i) for i in range(len(Configuration.FIELDS))]
+        return dict(zip(Configuration._INDEX, values))
+
+
+Configuration._INDEX = dict((name, index) for index, (name, _) in enumerate(Configuration.FIELDS))
+for _index, (_name, _) in enumerate(Configuration.FIELDS):
+    setattr(Configuration, _name, property(
+        lambda self, i=_index: self._get(i),
+        lambda self, value, i=_index: self._set(i, value),
+    ))
+del _index, _name
+
+
+class SpatialGrid(object):
+    """
+    Uniform grid over axis aligned boxes for point queries. Each box is
+    registered in every cell it overlaps, so a query only tests the boxes of
+    the one cell the point falls in.
+    """
+    def __init__(self, cellSize=32.0):
+        super(SpatialGrid, self).__init__()
+        self.cellSize = float(cellSize)
+        self._cells = {}
+        self._boxes = {}
+        self._order = {}
+        self._next = 0
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def __contains__(self, item):
+        return item in self._boxes
+
+    def _cellRange(self, x0, y0, x1, y1):
+        size = self.cellSize
+        for cx in range(int(x0 // size), int(x1 // size) + 1):
+            for cy in range(int(y0 // size), int(y1 // size) + 1):
+                yield cx, cy
+
+    def insert(self, item, x, y, w, h):
+        """
+        Add item covering [x, x + w] x [y, y + h], or move it there if it is
+        already in the grid.
+        """
+        if item in self._boxes:
+            self._unlink(item)
+        else:
+            self._order[item] = self._next
+            self._next += 1
+        box = (x, y, x + w, y + h)
+        self._boxes[item] = box
+        for cell in self._cellRange(*box):
+            self._cells.setdefault(cell, []).append(item)
+
+    update = insert
+
+    def remove(self, item):
+        self._unlink(item)
+        self._order.pop(item, None)
+
+    def _unlink(self, item):
+        box = self._boxes.pop(item, None)
+        if box is None:
+            return
+        for cell in self._cellRange(*box):
+            items = self._cells[cell]
+            items.remove(item)
+            if not items:
+                del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._boxes.clear()
+        self._order.clear()
+
+    def query(self, x, y):
+        """
+        Every item whose box contains (x, y), in insertion order.
+        """
+        size = self.cellSize
+        items = self._cells.get((int(x // size), int(y // size)))
+        if not items:
+            return []
+        hits = []
+        for item in items:
+            x0, y0, x1, y1 = self._boxes[item]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                hits.append(item)
+        if len(hits) > 1:
+            hits.sort(key=self._order.__getitem__)
+        return hits
+
+    def first(self, x, y):
+        """
+        The earliest inserted item whose box contains (x, y), or None.
+        """
+        hits = self.query(x, y)
+        return hits[0] if hits else None
+
+
+class RingBuffer(object):
+    """
+    The most recent capacity samples, overwriting the oldest once full.
+    """
+    def __init__(self, capacity=240):
+        super(RingBuffer, self).__init__()
+        self.capacity = int(capacity)
+        self._values = []
+        self._next = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, value):
+        if len(self._values) < self.capacity:
+            self._values.append(value)
+        else:
+            self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+
+    def clear(self):
+        del self._values[:]
+        self._next = 0
+
+    def values(self):
+        """
+        The samples, oldest first.
+        """
+        if len(self._values) < self.capacity:
+            return list(self._values)
+        return self._values[self._next:] + self._values[:self._next]
+
+    def percentiles(self, *percents):
+        """
+        Nearest rank percentiles of the samples, or None each when empty.
+        """
+        if not self._values:
+            return [None] * len(percents)
+        ordered = sorted(self._values)
+        last = len(ordered) - 1
+        return [ordered[min(last, max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1))] for p in percents]